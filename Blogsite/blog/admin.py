@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Post, Category, Tag, Comment, UserProfile
+from .jobs import queue_depth, retry_failed
+from .models import Post, Category, Tag, Comment, UserProfile, Job, PostDailyStats
 
 
 @admin.register(Category)
@@ -7,10 +8,7 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'slug', 'post_count')
     search_fields = ('name', 'description')
     prepopulated_fields = {'slug': ('name',)}
-    
-    def post_count(self, obj):
-        return obj.posts.count()
-    post_count.short_description = 'Posts'
+    readonly_fields = ('post_count',)
 
 
 @admin.register(Tag)
@@ -18,10 +16,7 @@ class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'slug', 'post_count')
     search_fields = ('name',)
     prepopulated_fields = {'slug': ('name',)}
-    
-    def post_count(self, obj):
-        return obj.posts.count()
-    post_count.short_description = 'Posts'
+    readonly_fields = ('post_count',)
 
 
 class CommentInline(admin.TabularInline):
@@ -42,16 +37,8 @@ class PostAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('title',)}
     date_hierarchy = 'date_created'
     filter_horizontal = ('tags', 'likes')
-    readonly_fields = ('views', 'date_created', 'date_updated')
+    readonly_fields = ('views', 'like_count', 'comment_count', 'date_created', 'date_updated')
     inlines = [CommentInline]
-    
-    def like_count(self, obj):
-        return obj.likes.count()
-    like_count.short_description = 'Likes'
-    
-    def comment_count(self, obj):
-        return obj.comments.count()
-    comment_count.short_description = 'Comments'
 
 
 @admin.register(Comment)
@@ -59,14 +46,36 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ('__str__', 'post', 'author', 'date_created', 'parent', 'like_count')
     list_filter = ('date_created',)
     search_fields = ('content', 'author__username', 'post__title')
-    readonly_fields = ('date_created',)
-    
-    def like_count(self, obj):
-        return obj.likes.count()
-    like_count.short_description = 'Likes'
+    readonly_fields = ('date_created', 'like_count')
 
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'website', 'twitter', 'github', 'linkedin')
-    search_fields = ('user__username', 'user__email', 'bio')
\ No newline at end of file
+    search_fields = ('user__username', 'user__email', 'bio')
+
+
+@admin.register(PostDailyStats)
+class PostDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('post', 'author', 'date', 'views', 'likes', 'comments')
+    list_filter = ('date',)
+    search_fields = ('post__title', 'author__username')
+    raw_id_fields = ('post', 'author')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'priority', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'dedupe_key')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'dedupe_key', 'last_error')
+    readonly_fields = ('attempts', 'locked_by', 'locked_at', 'last_error', 'date_created')
+    actions = ['retry_jobs']
+    
+    @admin.action(description='Retry selected failed jobs')
+    def retry_jobs(self, request, queryset):
+        retried = retry_failed(queryset)
+        self.message_user(request, f'{retried} failed jobs queued again.')
+    
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {**(extra_context or {}), 'queue_depth': queue_depth()}
+        return super().changelist_view(request, extra_context=extra_context)
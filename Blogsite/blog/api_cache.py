@@ -0,0 +1,184 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from .page_cache import fill_routing, get_cache, invalidate, tag_versions
+
+
+# Rendered API responses, shared by every client, keyed on the path, the
+# query string and the Accept header. Entries are checked against
+# generation counters (page cache tags, see blog/page_cache.py) that
+# blog/signals.py bumps on writes:
+#
+#   'api:<model>'        any change to a row of the model; list responses
+#   'api:<model>:<pk>'   a change to that row; its detail responses
+#   'api:<model>:*'      bulk changes (imports, re-rendering) to every row
+#
+# A hit costs one cache lookup plus one get_many of its generations, and
+# answers conditional requests from the stored ETag and Last-Modified: no
+# queries and no serialization. View counts are not writes here, as with
+# the page cache, so they may lag by up to API_CACHE_TIMEOUT.
+#
+# Only responses that are the same for every user belong in this cache;
+# the browsable API, which shows the user, is never stored.
+
+API_KEY_PREFIX = 'blog:api'
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Vary')
+
+
+def generation(model, pk=None):
+    name = model if isinstance(model, str) else model._meta.model_name
+    return f'api:{name}' if pk is None else f'api:{name}:{pk}'
+
+
+def bump(model, *pks):
+    """Rows ``pks`` of ``model`` changed: their detail responses and every
+    list of the model go stale."""
+    invalidate(generation(model), *[generation(model, pk) for pk in pks if pk is not None])
+
+
+def bump_all(model):
+    invalidate(generation(model), generation(model, '*'))
+
+
+def depend_on(request, *generations):
+    """Declare generations learned while rendering, such as the primary key
+    of the object a slug resolved to."""
+    request = getattr(request, '_request', request)
+    if hasattr(request, '_api_generations'):
+        request._api_generations.update(generations)
+
+
+def _key(request):
+    query = sorted(request.GET.lists())
+    accept = request.headers.get('Accept', '')
+    digest = hashlib.md5(repr((request.path, query, accept)).encode()).hexdigest()
+    return f'{API_KEY_PREFIX}:{digest}'
+
+
+def _replay(request, entry):
+    headers = entry['headers']
+    response = get_conditional_response(
+        request, etag=headers.get('ETag'), last_modified=parse_http_date_safe(headers.get('Last-Modified')))
+    if response is None:
+        response = HttpResponse(entry['content'], status=entry['status'])
+        for header, value in headers.items():
+            response[header] = value
+    else:
+        for header in ('ETag', 'Last-Modified'):
+            if header in headers:
+                response[header] = headers[header]
+    response['X-API-Cache'] = 'HIT'
+    return response
+
+
+def _lookup(request):
+    """``(key, cached response or None)``, or ``(None, None)`` to bypass."""
+    if not getattr(settings, 'API_CACHE_ENABLED', True) or request.method not in ('GET', 'HEAD'):
+        return None, None
+    key = _key(request)
+    cache = get_cache()
+    entry = cache.get(key)
+    if entry is None or tag_versions(entry['generations'], cache) != entry['generations']:
+        return key, None
+    return key, _replay(request, entry)
+
+
+def _begin(request, generations):
+    # Snapshot before rendering so a write that lands meanwhile still wins
+    request._api_generations = set()
+    return tag_versions(generations)
+
+
+def _store(request, key, response, versions):
+    if hasattr(response, 'render') and callable(response.render):
+        response = response.render()
+    renderer = getattr(response, 'accepted_renderer', None)
+    if (response.status_code == 200 and not response.streaming and not response.cookies
+            and getattr(renderer, 'format', None) != 'api'):
+        cache = get_cache()
+        versions.update(tag_versions(request._api_generations - set(versions), cache))
+        cache.set(key, {
+            'content': response.content,
+            'status': response.status_code,
+            'headers': {header: response[header] for header in STORED_HEADERS if response.has_header(header)},
+            'generations': versions,
+        }, getattr(settings, 'API_CACHE_TIMEOUT', 300))
+    response['X-API-Cache'] = 'MISS'
+    return response
+
+
+def cached_api_response(request, generations, respond):
+    """The cached response to ``request`` if none of ``generations`` (nor
+    those declared with ``depend_on`` when it was stored) moved since;
+    otherwise ``respond()``, stored for next time."""
+    key, response = _lookup(request)
+    if response is not None:
+        return response
+    if key is None:
+        return respond()
+    versions = _begin(request, generations)
+    with fill_routing():
+        response = respond()
+    return _store(request, key, response, versions)
+
+
+def cache_api_response(*generations):
+    """Cache a function-based API view whose responses depend on
+    ``generations``. Async views are supported; the cache work then runs
+    in the request's sync thread."""
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                key, response = await sync_to_async(_lookup)(request)
+                if response is not None:
+                    return response
+                if key is None:
+                    return await view_func(request, *args, **kwargs)
+                versions = await sync_to_async(_begin)(request, generations)
+                with await sync_to_async(fill_routing)():
+                    response = await view_func(request, *args, **kwargs)
+                return await sync_to_async(_store)(request, key, response, versions)
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            return cached_api_response(request, generations, lambda: view_func(request, *args, **kwargs))
+        return wrapper
+    return decorator
+
+
+class CachedResponseMixin:
+    """Cache a viewset's ``list`` and ``retrieve`` responses.
+
+    ``cache_model`` names the viewset's own model and ``cache_related`` the
+    models nested in its representation. Lists depend on the whole of
+    each; a detail response on its own row and the related models. The
+    cache sits in front of ``dispatch``, so conditional-GET decorators on
+    the actions only run on misses.
+    """
+    cache_model = None
+    cache_related = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        action = self.action_map.get(request.method.lower())
+        if action == 'list':
+            generations = [generation(self.cache_model)]
+        elif action == 'retrieve':
+            generations = [generation(self.cache_model, '*')]
+        else:
+            return super().dispatch(request, *args, **kwargs)
+        generations += [generation(model) for model in self.cache_related]
+        return cached_api_response(request, generations, lambda: super(CachedResponseMixin, self).dispatch(
+            request, *args, **kwargs))
+
+    def get_object(self):
+        obj = super().get_object()
+        depend_on(self.request, generation(self.cache_model, obj.pk))
+        return obj
@@ -0,0 +1,273 @@
+import gzip
+import mimetypes
+import os
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.http import FileResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Static asset pipeline. `collectstatic` concatenates and minifies the
+# STATIC_BUNDLES into bundles/<name>, gives every file a content-hashed name
+# (ManifestStaticFilesStorage) and writes .gz (and, with the brotli package,
+# .br) siblings of the compressible ones. StaticAssetMiddleware serves
+# STATIC_ROOT with the smallest variant the client accepts; hashed names
+# never change content, so they are cacheable for a year.
+#
+# Templates load bundles with {% bundle %} (blog/templatetags/blog_assets.py),
+# which falls back to the separate source files until the bundles are
+# collected, e.g. under runserver or in tests.
+
+BUNDLE_DIR = 'bundles'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.xml', '.html')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.')
+
+_CSS_TOKENS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|/\*.*?\*/''', re.S)
+# A slash after these (or at the start) opens a regular expression literal
+_JS_REGEX_BEFORE = set('(,=:[!&|?{};+-*%<>~^')
+_JS_REGEX = re.compile(r'/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-z]*')
+
+
+def bundles():
+    return getattr(settings, 'STATIC_BUNDLES', {})
+
+
+def bundle_path(name):
+    return f'{BUNDLE_DIR}/{name}'
+
+
+def _squeeze(source, tokens, compact):
+    # Strings are kept verbatim and comments dropped; ``compact`` tidies
+    # the code between strings
+    parts, code, position = [], [], 0
+    for match in tokens.finditer(source):
+        code.append(source[position:match.start()])
+        if match.group(1):
+            parts.extend((compact(''.join(code)), match.group(1)))
+            code = []
+        else:
+            code.append(' ')
+        position = match.end()
+    code.append(source[position:])
+    parts.append(compact(''.join(code)))
+    return ''.join(parts)
+
+
+def _compact_css(code):
+    code = re.sub(r'\s+', ' ', code)
+    code = re.sub(r' ?([{};,>]) ?', r'\1', code)
+    return code.replace(';}', '}')
+
+
+def _compact_js(code):
+    # Newlines stay, so automatic semicolon insertion is unaffected
+    code = re.sub(r'[ \t]+', ' ', code)
+    return re.sub(r' ?\n[\s]*', '\n', code)
+
+
+def minify_css(source):
+    return _squeeze(source, _CSS_TOKENS, _compact_css).strip() + '\n'
+
+
+def minify_js(source):
+    parts, code, last = [], [], ''
+    position, size = 0, len(source)
+
+    def flush():
+        parts.append(_compact_js(''.join(code)))
+        code.clear()
+
+    while position < size:
+        char = source[position]
+        if char in '"\'`':
+            end = position + 1
+            while end < size and source[end] != char:
+                end += 2 if source[end] == '\\' else 1
+            flush()
+            parts.append(source[position:end + 1])
+            last, position = char, end + 1
+        elif source.startswith('//', position):
+            end = source.find('\n', position)
+            position = size if end < 0 else end
+        elif source.startswith('/*', position):
+            end = source.find('*/', position + 2)
+            end = size if end < 0 else end + 2
+            code.append('\n' if '\n' in source[position:end] else ' ')
+            position = end
+        else:
+            match = _JS_REGEX.match(source, position) if char == '/' and (not last or last in _JS_REGEX_BEFORE) else None
+            if match:
+                # A regular expression literal, which may hold quotes or //
+                flush()
+                parts.append(match.group(0))
+                last, position = '/', match.end()
+                continue
+            code.append(char)
+            if not char.isspace():
+                last = char
+            position += 1
+    flush()
+    return ''.join(parts).strip() + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def build_bundle(name, read):
+    """Concatenate and minify the sources of bundle ``name``; ``read(path)``
+    returns a source file's text."""
+    minify = MINIFIERS.get(os.path.splitext(name)[1], lambda source: source)
+    return ''.join(minify(read(path)) for path in bundles()[name])
+
+
+def compress(content):
+    """``{encoding suffix: compressed bytes}`` worth serving for ``content``."""
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content, quality=11)
+    return {suffix: data for suffix, data in variants.items() if len(data) < len(content) * 0.95}
+
+
+class BundledManifestStorage(ManifestStaticFilesStorage):
+    """Manifest storage that builds the STATIC_BUNDLES before hashing and
+    writes precompressed variants of the hashed files after."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            yield from super().post_process(paths, dry_run, **options)
+            return
+        paths = {**paths, **self.build_bundles(paths)}
+        yield from super().post_process(paths, dry_run, **options)
+        for name in set(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE):
+                self.precompress(name)
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not collected (yet): link the plain name, as under DEBUG
+            return name
+
+    def build_bundles(self, paths):
+        built = {}
+        for name in bundles():
+            def read(path):
+                storage, source = paths[path]
+                with storage.open(source) as stream:
+                    return stream.read().decode('utf-8')
+            target = bundle_path(name)
+            if self.exists(target):
+                self.delete(target)
+            self._save(target, ContentFile(build_bundle(name, read).encode('utf-8')))
+            built[target] = (self, target)
+        return built
+
+    def precompress(self, name):
+        with self.open(name) as stream:
+            content = stream.read()
+        for suffix, data in compress(content).items():
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(data))
+
+
+def bundle_built(name):
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+    return bundle_path(name) in hashed_files
+
+
+def _accepted(request):
+    header = request.headers.get('Accept-Encoding', '')
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def serve_static(request, path):
+    """Response for ``path`` under STATIC_ROOT, or None if there is no such
+    file."""
+    try:
+        filename = safe_join(settings.STATIC_ROOT, path)
+    except ValueError:
+        return None
+    if not os.path.isfile(filename):
+        return None
+    encoding, served = None, filename
+    if filename.endswith(COMPRESSIBLE):
+        accepted = _accepted(request)
+        for coding, suffix in ENCODINGS:
+            if coding in accepted and os.path.isfile(filename + suffix):
+                encoding, served = coding, filename + suffix
+                break
+
+    stream = open(served, 'rb')
+    stat = os.fstat(stream.fileno())
+    etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = FileResponse(stream)
+        response['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response['Content-Length'] = stat.st_size
+        if encoding:
+            response['Content-Encoding'] = encoding
+    else:
+        stream.close()
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if filename.endswith(COMPRESSIBLE):
+        response['Vary'] = 'Accept-Encoding'
+    if HASHED_NAME.search(os.path.basename(filename)):
+        response['Cache-Control'] = IMMUTABLE
+    else:
+        response['Cache-Control'] = f"public, max-age={getattr(settings, 'STATIC_ASSETS_MAX_AGE', 60)}"
+    return response
+
+
+class StaticAssetMiddleware:
+    """Serve collected static files from STATIC_ROOT before the rest of the
+    middleware runs. Requests for files that were not collected go on to
+    the next handler."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else f'/{settings.STATIC_URL}'
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _static_path(self, request):
+        if (not getattr(settings, 'STATIC_ASSETS_SERVE', True) or request.method not in ('GET', 'HEAD')
+                or not request.path.startswith(self.prefix)):
+            return None
+        return request.path[len(self.prefix):]
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        path = self._static_path(request)
+        response = serve_static(request, path) if path else None
+        return response or self.get_response(request)
+
+    async def __acall__(self, request):
+        path = self._static_path(request)
+        response = await sync_to_async(serve_static)(request, path) if path else None
+        return response or await self.get_response(request)
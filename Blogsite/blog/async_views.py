@@ -0,0 +1,251 @@
+"""Async versions of the hot read-only views, used when the site is served
+over ASGI (``BLOG_ASYNC_VIEWS``, see blog/urls.py).
+
+Queries go through Django's async ORM and independent ones are awaited
+together. Template rendering and DRF serialization may still touch lazy
+relations, so they run in the request's sync thread.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from rest_framework.utils.urls import replace_query_param
+
+from .api_cache import cache_api_response, depend_on, generation
+from .comment_tree import acomment_tree
+from .conditional import conditional_post, conditional_post_list, conditional_post_page
+from .forms import CommentForm, SearchForm
+from .models import Category, Post, Tag
+from .page_cache import add_cache_tags, anonymous_page_cache, set_cache_meta
+from .pagination import POST_ORDERING, InvalidCursor, KeysetPaginator, OffsetCursorPaginator
+from .query_budget import query_budget
+from .query_plan import optimize
+from .reactions import mark_liked, walk_tree
+from .related import related_posts
+from .rendering import BODY_FIELDS
+from .search import get_backend as get_search_backend, search_posts
+from .serializers import PostSerializer, PostSummarySerializer
+from .view_counter import record_view
+from .views import count_cached_view, count_revalidated_view
+
+
+arender = sync_to_async(render)
+
+
+async def _list(queryset):
+    return [obj async for obj in queryset]
+
+
+async def _get_or_404(queryset, **lookup):
+    try:
+        return await queryset.aget(**lookup)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.verbose_name} found matching the query')
+
+
+async def _none():
+    return None
+
+
+# Home Page
+@query_budget(8)
+@anonymous_page_cache('posts', 'taxonomy')
+async def home(request):
+    published = Post.objects.filter(status='published').select_related('author', 'category').defer(*BODY_FIELDS)
+    featured_posts, recent_posts, categories, popular_tags = await asyncio.gather(
+        _list(published.order_by('-views')[:5]),
+        _list(published.order_by('-date_created')[:5]),
+        _list(Category.objects.order_by('-post_count', 'name')[:10]),
+        _list(Tag.objects.order_by('-post_count', 'name')[:15]),
+    )
+    context = {
+        'featured_posts': featured_posts,
+        'recent_posts': recent_posts,
+        'categories': categories,
+        'popular_tags': popular_tags,
+    }
+    return await arender(request, 'blog/home.html', context)
+
+
+# Post List
+@query_budget(10)
+@anonymous_page_cache('posts', 'taxonomy')
+async def post_list(request, category_slug=None, tag_slug=None):
+    queryset = (Post.objects.filter(status='published')
+                .select_related('author', 'category')
+                .prefetch_related('tags')
+                .defer(*BODY_FIELDS))
+    if category_slug:
+        queryset = queryset.filter(category__slug=category_slug)
+    if tag_slug:
+        queryset = queryset.filter(tags__slug=tag_slug)
+
+    search_hits = None
+    search_form = SearchForm(request.GET)
+    if search_form.is_valid() and search_form.cleaned_data['query']:
+        queryset, search_hits = await sync_to_async(search_posts)(search_form.cleaned_data['query'], queryset)
+        paginator = OffsetCursorPaginator(queryset, 9)
+    else:
+        paginator = KeysetPaginator(queryset, 9, POST_ORDERING)
+
+    try:
+        page, categories, popular_tags, current_category, current_tag = await asyncio.gather(
+            paginator.apage(request.GET.get('cursor')),
+            _list(Category.objects.order_by('name')),
+            _list(Tag.objects.order_by('-post_count', 'name')[:20]),
+            _get_or_404(Category.objects, slug=category_slug) if category_slug else _none(),
+            _get_or_404(Tag.objects, slug=tag_slug) if tag_slug else _none(),
+        )
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
+
+    def page_query(cursor):
+        params = request.GET.copy()
+        params.pop('page', None)
+        params['cursor'] = cursor
+        return params.urlencode()
+
+    context = {
+        'posts': page.object_list,
+        'post_list': page.object_list,
+        'page_obj': page,
+        'paginator': paginator,
+        'is_paginated': page.has_other_pages(),
+        'search_form': search_form,
+        'categories': categories,
+        'popular_tags': popular_tags,
+    }
+    if page.has_next():
+        context['next_page_query'] = page_query(page.next_cursor)
+    if page.has_previous():
+        context['previous_page_query'] = page_query(page.previous_cursor)
+    if search_hits is not None:
+        context['search_total'] = len(search_hits)
+        for post in page.object_list:
+            hit = search_hits.get(post.pk)
+            post.search_snippet = hit.snippet if hit else ''
+    if current_category is not None:
+        context['current_category'] = current_category
+    if current_tag is not None:
+        context['current_tag'] = current_tag
+    return await arender(request, 'blog/post_list.html', context)
+
+
+# Post Detail
+@query_budget(12)
+@conditional_post_page(on_not_modified=count_revalidated_view)
+@anonymous_page_cache('taxonomy', on_hit=count_cached_view)
+async def post_detail(request, slug):
+    post = await _get_or_404(
+        Post.objects.select_related('author', 'category').prefetch_related('tags'), slug=slug)
+    # Buffer the view; the counter flushes it to the database in batches
+    await sync_to_async(record_view)(post.pk)
+    add_cache_tags(request, f'post:{post.pk}')
+    set_cache_meta(request, post_id=post.pk)
+    post.views += 1
+
+    comments, related, user = await asyncio.gather(
+        acomment_tree(post),
+        _list(related_posts(post, limit=3)),
+        request.auser(),
+    )
+    context = {
+        'post': post,
+        'object': post,
+        'comments': comments,
+        'comment_form': CommentForm(),
+        'related_posts': related,
+    }
+    if user.is_authenticated:
+        await sync_to_async(mark_liked)(user, [post, *walk_tree(comments)])
+        context['user_has_liked'] = post.user_has_liked
+    return await arender(request, 'blog/post_detail.html', context)
+
+
+# Category List
+@query_budget(5)
+@anonymous_page_cache('taxonomy')
+async def category_list(request):
+    categories = await _list(Category.objects.order_by('name'))
+    return await arender(request, 'blog/category_list.html', {'categories': categories})
+
+
+# Tag List
+@query_budget(5)
+@anonymous_page_cache('taxonomy')
+async def tag_list(request):
+    tags = await _list(Tag.objects.order_by('name'))
+    return await arender(request, 'blog/tag_list.html', {'tags': tags})
+
+
+# API Views
+def _serialize(serializer_class, instance, request, **kwargs):
+    return serializer_class(instance, context={'request': request}, **kwargs).data
+
+
+@query_budget(8)
+@cache_api_response('api:post', 'api:category', 'api:tag', 'api:user')
+@conditional_post_list
+async def post_list_api(request):
+    try:
+        page_size = max(1, min(int(request.GET.get('page_size', 10)), 100))
+    except ValueError:
+        page_size = 10
+    posts = optimize(Post.objects.filter(status='published'), PostSummarySerializer(context={'request': request}),
+                     keep=POST_ORDERING)
+    paginator = KeysetPaginator(posts, page_size, POST_ORDERING)
+    try:
+        page = await paginator.apage(request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'detail': 'Invalid cursor'}, status=404)
+
+    def link(cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(request.build_absolute_uri(), 'cursor', cursor)
+
+    results = await sync_to_async(_serialize)(PostSummarySerializer, page.object_list, request, many=True)
+    return JsonResponse({
+        'next': link(page.next_cursor),
+        'previous': link(page.previous_cursor),
+        'results': results,
+    })
+
+
+@query_budget(8)
+@cache_api_response('api:post:*', 'api:category', 'api:tag', 'api:user')
+@conditional_post
+async def post_detail_api(request, slug):
+    try:
+        post = await optimize(Post.objects.all(), PostSerializer(context={'request': request})).aget(slug=slug)
+    except Post.DoesNotExist:
+        return JsonResponse({'error': 'Post not found'}, status=404)
+    depend_on(request, generation(post, post.pk))
+    return JsonResponse(await sync_to_async(_serialize)(PostSerializer, post, request))
+
+
+@query_budget(5)
+async def search_api(request):
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'Missing search query "q"'}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit', 20)), 100)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        return JsonResponse({'error': 'limit and offset must be integers'}, status=400)
+    hits = await sync_to_async(get_search_backend().search)(query, limit=limit, offset=offset)
+    posts = await Post.objects.ain_bulk([hit.post_id for hit in hits])
+    results = [
+        {
+            'id': hit.post_id,
+            'title': posts[hit.post_id].title,
+            'slug': posts[hit.post_id].slug,
+            'url': posts[hit.post_id].get_absolute_url(),
+            'rank': hit.rank,
+            'snippet': hit.snippet,
+        }
+        for hit in hits if hit.post_id in posts
+    ]
+    return JsonResponse({'query': query, 'results': results})
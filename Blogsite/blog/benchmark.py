@@ -0,0 +1,423 @@
+import contextlib
+import gc
+import logging
+import platform
+import random
+import subprocess
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import count
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections, transaction
+from django.shortcuts import resolve_url
+from django.test import Client, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+from .counters import reconcile_counters
+from .models import Category, Comment, Post, Tag
+from .query_budget import QueryRecorder
+from .transfer import PostImporter, chunked, finish_import
+
+
+# Synthetic datasets
+
+BENCHMARK_PASSWORD = 'benchmark'
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+WORDS = '''
+    python django query index cache async thread process queue latency
+    template model view form serializer router signal migration request
+    response session cookie header token search ranking feed sitemap image
+    static storage database transaction cursor pagination keyset offset
+'''.split()
+
+
+def _sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def generate_records(users=20, posts=500, tags=40, categories=8, comments_per_post=5, seed=0):
+    """Yield JSONL post records (see blog/transfer.py) for a synthetic
+    dataset. The same arguments always produce the same records."""
+    rng = random.Random(seed)
+    for number in range(posts):
+        title = f'Benchmark post {number}: {_sentence(rng, 4)}'
+        created = EPOCH + timedelta(minutes=number * 37)
+        comments = []
+        for position in range(comments_per_post):
+            # Every other comment replies to the one before it
+            parent = comments[-1]['id'] if position % 2 and comments else None
+            comments.append({
+                'id': position + 1, 'parent': parent,
+                'author': {'username': f'bench-user-{rng.randrange(users)}', 'email': ''},
+                'content': _sentence(rng, 12),
+                'date_created': created + timedelta(hours=position + 1),
+            })
+        tag_numbers = sorted(rng.sample(range(tags), min(3, tags)))
+        yield {
+            'slug': f'benchmark-post-{number}',
+            'title': title,
+            'excerpt': _sentence(rng, 15),
+            'content': ''.join(f'<p>{_sentence(rng, 40)}</p>' for _ in range(6)),
+            'status': 'draft' if number % 10 == 9 else 'published',
+            'featured_image': '',
+            'views': rng.randrange(5000),
+            'date_created': created,
+            'date_updated': created + timedelta(days=1),
+            'author': {'username': f'bench-user-{number % users}', 'email': ''},
+            'category': {'name': f'Benchmark category {number % categories}',
+                         'slug': f'benchmark-category-{number % categories}', 'description': ''},
+            'tags': [{'name': f'bench-tag-{tag}', 'slug': f'bench-tag-{tag}'} for tag in tag_numbers],
+            'comments': comments,
+        }
+
+
+def seed_dataset(users=20, posts=500, tags=40, categories=8, comments_per_post=5, likes_per_post=3,
+                 seed=0, chunk_size=500):
+    """Create (or refresh) a synthetic dataset with bulk queries.
+
+    Posts are matched on their generated slugs, so seeding twice with the
+    same arguments leaves the same data behind. Every seeded user can log
+    in with BENCHMARK_PASSWORD.
+    """
+    importer = PostImporter()
+    records = generate_records(users, posts, tags, categories, comments_per_post, seed)
+    for chunk in chunked(records, chunk_size):
+        importer.import_chunk(chunk)
+
+    User = get_user_model()
+    bench_users = User.objects.filter(username__startswith='bench-user-')
+    # One hash for every user keeps seeding fast; these are throwaway accounts
+    bench_users.update(password=make_password(BENCHMARK_PASSWORD))
+    user_ids = sorted(bench_users.values_list('pk', flat=True))
+    rng = random.Random(seed)
+    Like = Post.likes.through
+    post_ids = Post.objects.filter(slug__startswith='benchmark-post-').order_by('pk').values_list('pk', flat=True)
+    for chunk in chunked(post_ids.iterator(chunk_size=chunk_size), chunk_size):
+        with transaction.atomic():
+            Like.objects.filter(post_id__in=chunk).delete()
+            Like.objects.bulk_create([
+                Like(post_id=post_id, user_id=user_id)
+                for post_id in chunk
+                for user_id in rng.sample(user_ids, min(likes_per_post, len(user_ids)))
+            ])
+    reconcile_counters()
+    finish_import()
+    return importer
+
+
+def dataset_summary():
+    return {
+        'users': get_user_model().objects.count(),
+        'posts': Post.objects.count(),
+        'published_posts': Post.objects.filter(status='published').count(),
+        'comments': Comment.objects.count(),
+        'categories': Category.objects.count(),
+        'tags': Tag.objects.count(),
+        'likes': Post.likes.through.objects.count(),
+    }
+
+
+# Route plans
+
+# Routes left out unless writes are requested, with what they would change
+WRITE_ROUTES = {
+    'add_comment': ('post', {'content': 'Benchmark comment'}),
+    'like_post': ('post', {}),
+    'like_comment': ('post', {}),
+    'post_create_api': ('post', lambda n: {'title': f'Benchmark write {n}-{time.time_ns()}',
+                                           'content': 'Body', 'status': 'draft'}),
+    'post_update_api': ('put', {'excerpt': 'Updated by the benchmark'}),
+}
+# Routes never measured
+SKIPPED_ROUTES = {
+    'logout': 'ends the session the other routes use',
+    'rest_framework:logout': 'ends the session the other routes use',
+    'post_delete_api': 'deletes the post the other routes read',
+}
+# POST-only routes that do not change content
+POST_ROUTES = {
+    'api_token_auth': ('post', lambda n: {'username': None, 'password': BENCHMARK_PASSWORD}),
+}
+# Query strings for routes that need one to do real work
+QUERY_STRINGS = {
+    'search_api': 'q=django',
+    'likes_api': 'posts=1,2,3,4,5&comments=1,2,3,4,5',
+}
+# Django's own admin routes are not part of the site's hot paths
+EXCLUDED_NAMESPACES = {'admin'}
+
+
+@dataclass
+class Route:
+    name: str
+    path: str
+    method: str = 'get'
+    data: object = None
+    authenticated: bool = False
+    stats: dict = field(default_factory=dict)
+
+    def payload(self, number, user):
+        data = self.data(number) if callable(self.data) else self.data
+        if isinstance(data, dict) and 'username' in data and data['username'] is None:
+            data = {**data, 'username': user.get_username()}
+        return data
+
+
+def iter_named_routes(patterns=None, namespace=None):
+    """Yield ``(name, pattern)`` for every named URL pattern, with names
+    qualified by their namespace."""
+    patterns = get_resolver().url_patterns if patterns is None else patterns
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            inner = pattern.namespace
+            if inner in EXCLUDED_NAMESPACES:
+                continue
+            prefix = f'{namespace}:{inner}' if namespace and inner else (inner or namespace)
+            yield from iter_named_routes(pattern.url_patterns, prefix)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield (f'{namespace}:{pattern.name}' if namespace else pattern.name), pattern
+
+
+def benchmark_subjects():
+    """The user, post, category and tag the routes are exercised with.
+
+    Seeded posts come first, since their authors' password is known.
+    """
+    published = Post.objects.filter(status='published').select_related('author', 'category').order_by('pk')
+    post = published.filter(slug__startswith='benchmark-post-').first() or published.first()
+    if post is None:
+        raise ValueError('No published posts to benchmark; run seed_blog first')
+    return {
+        'user': post.author,
+        'post': post,
+        'category': post.category or Category.objects.order_by('pk').first(),
+        'tag': post.tags.order_by('pk').first() or Tag.objects.order_by('pk').first(),
+        'comment': post.comments.order_by('pk').first() or Comment.objects.order_by('pk').first(),
+    }
+
+
+def build_routes(writes=False, subjects=None):
+    """Plan one request shape per named route; returns ``(routes, skipped)``."""
+    subjects = subjects or benchmark_subjects()
+    values = {
+        'slug': subjects['post'].slug,
+        'category_slug': getattr(subjects['category'], 'slug', None),
+        'tag_slug': getattr(subjects['tag'], 'slug', None),
+        'username': subjects['user'].get_username(),
+        'pk': getattr(subjects['comment'], 'pk', None),
+        'year': subjects['post'].date_created.year,
+        'month': subjects['post'].date_created.month,
+    }
+    overrides = {
+        'category-detail': {'slug': values['category_slug']},
+        'tag-detail': {'slug': values['tag_slug']},
+    }
+    routes, skipped, seen = [], {}, set()
+    for name, pattern in iter_named_routes():
+        arguments = pattern.pattern.regex.groupindex
+        if 'format' in arguments or name in seen:
+            # Format-suffix twins of the router's routes
+            continue
+        seen.add(name)
+        if name in SKIPPED_ROUTES:
+            skipped[name] = SKIPPED_ROUTES[name]
+            continue
+        if name in WRITE_ROUTES and not writes:
+            skipped[name] = 'writes data; pass --writes to include it'
+            continue
+        kwargs = {key: {**values, **overrides.get(name, {})}.get(key) for key in arguments}
+        if None in kwargs.values():
+            skipped[name] = f'no object to fill in {", ".join(sorted(arguments))}'
+            continue
+        method, data = WRITE_ROUTES.get(name) or POST_ROUTES.get(name) or ('get', None)
+        path = reverse(name, kwargs=kwargs)
+        if name in QUERY_STRINGS:
+            path = f'{path}?{QUERY_STRINGS[name]}'
+        routes.append(Route(name, path, method, data,
+                            authenticated=name in WRITE_ROUTES))
+    return routes, skipped
+
+
+def _needs_login(response):
+    if response.status_code in (401, 403):
+        return True
+    login_url = resolve_url(settings.LOGIN_URL)
+    return response.status_code == 302 and response['Location'].startswith(login_url)
+
+
+# Load driver
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(results, elapsed):
+    """Throughput and latency of ``(status, seconds[, queries])`` results."""
+    latencies = sorted(result[1] for result in results)
+    queries = [result[2] for result in results if len(result) > 2]
+    summary = {
+        'requests': len(results),
+        'seconds': round(elapsed, 3),
+        'rps': round(len(results) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'statuses': dict(sorted(Counter(str(result[0]) for result in results).items())),
+    }
+    if queries:
+        summary['queries_mean'] = round(sum(queries) / len(queries), 2)
+        summary['queries_max'] = max(queries)
+    return summary
+
+
+class LoadDriver:
+    """Runs each route ``requests`` times from ``concurrency`` threads, each
+    with its own test client, and records latency and query counts. View
+    errors are recorded as 500 responses rather than raised."""
+
+    def __init__(self, requests=200, concurrency=4, warmup=10, page_cache=False):
+        self.requests = requests
+        self.concurrency = concurrency
+        self.warmup = warmup
+        self.page_cache = page_cache
+        self._local = threading.local()
+        self._numbers = count()
+
+    def settings_overrides(self):
+        overrides = {
+            # DEBUG would log every query and raise on query budget overruns
+            'DEBUG': False,
+            'QUERY_BUDGET_RAISE': False,
+            'ALLOWED_HOSTS': ['testserver'],
+        }
+        if not self.page_cache:
+            overrides['PAGE_CACHE_ENABLED'] = False
+        return overrides
+
+    def _client(self, route, user):
+        clients = self._local.__dict__.setdefault('clients', {})
+        if route.authenticated not in clients:
+            client = Client(raise_request_exception=False)
+            if route.authenticated:
+                client.force_login(user)
+            clients[route.authenticated] = client
+        return clients[route.authenticated]
+
+    def request(self, route, user):
+        client = self._client(route, user)
+        data = route.payload(next(self._numbers), user)
+        send = getattr(client, route.method)
+        kwargs = {'content_type': 'application/json'} if route.method == 'put' else {}
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with contextlib.ExitStack() as wrappers:
+            # Reads may be routed to replicas (see blog/db_router.py)
+            for alias in connections:
+                wrappers.enter_context(connections[alias].execute_wrapper(recorder))
+            response = send(route.path, data, **kwargs) if data is not None else send(route.path)
+        return response.status_code, time.perf_counter() - started, recorder.count
+
+    def probe(self, route, user):
+        """Anonymous routes that redirect to the login page or refuse the
+        request are measured logged in instead."""
+        if route.authenticated:
+            return
+        client = Client(raise_request_exception=False)
+        response = getattr(client, route.method)(route.path, route.payload(0, user))
+        route.authenticated = _needs_login(response)
+
+    def run_route(self, route, user):
+        self.probe(route, user)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(lambda _: self.request(route, user), range(self.warmup)))
+            gc.collect()
+            started = time.perf_counter()
+            results = list(pool.map(lambda _: self.request(route, user), range(self.requests)))
+            elapsed = time.perf_counter() - started
+        route.stats = summarize(results, elapsed)
+        return route.stats
+
+    def run(self, routes, user, progress=None):
+        # Budget overruns show up in the report's query counts instead
+        budget_logger = logging.getLogger('blog.query_budget')
+        level = budget_logger.level
+        budget_logger.setLevel(logging.ERROR)
+        try:
+            with override_settings(**self.settings_overrides()):
+                for route in routes:
+                    self.run_route(route, user)
+                    if progress:
+                        progress(route)
+        finally:
+            budget_logger.setLevel(level)
+        return routes
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+        'git_commit': commit,
+    }
+
+
+def build_report(routes, skipped, driver):
+    return {
+        'meta': {
+            'created': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            **environment(),
+            'requests_per_route': driver.requests,
+            'concurrency': driver.concurrency,
+            'warmup': driver.warmup,
+            'page_cache': driver.page_cache,
+            'dataset': dataset_summary(),
+        },
+        'routes': {
+            route.name: {'method': route.method.upper(), 'path': route.path,
+                         'authenticated': route.authenticated, **route.stats}
+            for route in routes
+        },
+        'skipped': skipped,
+    }
+
+
+def compare_reports(baseline, current, tolerance=0.2, noise_ms=1.0):
+    """Regressions of ``current`` against ``baseline``, as messages.
+
+    A route regresses when its p95 latency grows by more than ``tolerance``
+    (and ``noise_ms``), when it runs more queries, or when it starts
+    answering with server errors.
+    """
+    regressions = []
+    if baseline['meta'].get('dataset') != current['meta'].get('dataset'):
+        regressions.append('dataset differs from the baseline; results are not comparable')
+    for name, now in current['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        if now['p95_ms'] > before['p95_ms'] * (1 + tolerance) and now['p95_ms'] - before['p95_ms'] > noise_ms:
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {now['p95_ms']}ms")
+        if now.get('queries_mean', 0) > before.get('queries_mean', 0):
+            regressions.append(f"{name}: queries {before.get('queries_mean')} -> {now.get('queries_mean')}")
+        server_errors = sum(n for status, n in now['statuses'].items() if status.startswith('5'))
+        if server_errors and not any(status.startswith('5') for status in before['statuses']):
+            regressions.append(f'{name}: {server_errors} server errors')
+    return regressions
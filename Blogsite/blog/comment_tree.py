@@ -0,0 +1,85 @@
+from django.conf import settings
+
+from .models import Comment
+
+
+def _limits(max_depth, max_replies):
+    if max_depth is None:
+        max_depth = getattr(settings, 'COMMENT_TREE_MAX_DEPTH', 5)
+    if max_replies is None:
+        max_replies = getattr(settings, 'COMMENT_TREE_MAX_REPLIES', 20)
+    return max_depth, max_replies
+
+
+def assemble_tree(comments, max_depth=None, max_replies=None, root_depth=0):
+    """Link path-ordered ``comments`` into a tree without extra queries.
+
+    Every comment gets ``children`` (at most ``max_replies`` of them, oldest
+    first) and ``hidden_replies`` (how many comments below it were cut,
+    whole subtrees included). Comments nested deeper than ``max_depth``
+    levels below ``root_depth`` are cut too; those at that level get
+    ``at_depth_limit`` so templates stop offering replies there. Returns
+    the top-level comments, newest first.
+    """
+    max_depth, max_replies = _limits(max_depth, max_replies)
+    nodes = {}
+    # Cut comment pk -> the shown comment its subtree is counted under
+    cut = {}
+    roots = []
+    for comment in comments:
+        comment.children = []
+        comment.hidden_replies = 0
+        level = comment.depth - root_depth
+        comment.at_depth_limit = level >= max_depth
+        if level == 0:
+            nodes[comment.pk] = comment
+            roots.append(comment)
+            continue
+        parent = nodes.get(comment.parent_id)
+        if parent is None or level > max_depth or len(parent.children) >= max_replies:
+            shown = parent or cut.get(comment.parent_id)
+            if shown is not None:
+                shown.hidden_replies += 1
+                cut[comment.pk] = shown
+            continue
+        nodes[comment.pk] = comment
+        parent.children.append(comment)
+    roots.reverse()
+    return roots
+
+
+def thread_queryset():
+    return Comment.objects.select_related('author__profile').order_by('path')
+
+
+def comment_tree(post, max_depth=None, max_replies=None):
+    """Whole comment thread of ``post`` from a single ordered query."""
+    return assemble_tree(thread_queryset().filter(post=post), max_depth, max_replies)
+
+
+async def acomment_tree(post, max_depth=None, max_replies=None):
+    """``comment_tree`` for async views."""
+    comments = [comment async for comment in thread_queryset().filter(post=post)]
+    return assemble_tree(comments, max_depth, max_replies)
+
+
+def reply_tree(comment, max_depth=None, max_replies=None):
+    """Replies below ``comment`` from a single ``path`` prefix query."""
+    prefix = comment.path + Comment.PATH_SEPARATOR
+    replies = thread_queryset().filter(post_id=comment.post_id, path__startswith=prefix)
+    comment_copy = Comment(pk=comment.pk, depth=comment.depth)
+    assemble_tree([comment_copy, *replies], max_depth, max_replies, root_depth=comment.depth)
+    return comment_copy.children, comment_copy.hidden_replies
+
+
+def attach_comment_trees(posts, max_depth=None, max_replies=None):
+    """Set ``comment_tree`` on each post using one query for all of them."""
+    posts = list(posts)
+    by_post = {post.pk: [] for post in posts}
+    if by_post:
+        comments = thread_queryset().filter(post_id__in=by_post).order_by('post_id', 'path')
+        for comment in comments:
+            by_post[comment.post_id].append(comment)
+    for post in posts:
+        post.comment_tree = assemble_tree(by_post[post.pk], max_depth, max_replies)
+    return posts
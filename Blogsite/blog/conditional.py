@@ -0,0 +1,198 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import Category, Post, Tag
+from .page_cache import tag_versions
+from .sitemaps import month_state
+
+
+# Validators are computed from one small query plus the page cache's
+# dependency versions (see blog/page_cache.py), so a revalidation that ends
+# in 304 Not Modified skips the full query set, rendering and serialization.
+#
+# Post views are left out on purpose: they change on every hit, and
+# including them would make every validator useless.
+#
+# Post resources have no Last-Modified: likes and counters are written
+# without touching date_updated, taxonomy renames and deleted comments move
+# no post timestamp, so If-Modified-Since could not see them. Their ETags
+# cover all of it.
+
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def _memoize(request, key, compute):
+    # The ETag and Last-Modified callbacks share one lookup per request
+    state = request.__dict__.setdefault('_conditional_state', {})
+    if key not in state:
+        state[key] = compute()
+    return state[key]
+
+
+def _has_flash_message(request):
+    return bool(request.COOKIES.get(getattr(settings, 'MESSAGE_COOKIE_NAME', 'messages')))
+
+
+def _representation(request):
+    """What shapes a response besides the data: the sparse fieldset and
+    expansions (blog/serializers.py SparseFieldsMixin), normalized, and the
+    requested media type."""
+    def names(param):
+        return sorted({name.strip() for name in request.GET.get(param, '').split(',') if name.strip()})
+    return names('fields'), names('expand'), request.GET.get('format', ''), request.headers.get('Accept', '')
+
+
+def post_state(request, slug):
+    return _memoize(request, ('post', slug), lambda: (
+        Post.objects.filter(slug=slug)
+        .values('pk', 'date_updated', 'like_count', 'comment_count')
+        .first()
+    ))
+
+
+def post_etag(request, slug, **kwargs):
+    state = post_state(request, slug)
+    if state is None:
+        return None
+    versions = tag_versions(('taxonomy', f"post:{state['pk']}"))
+    return make_etag(
+        state['pk'], state['date_updated'], state['like_count'], state['comment_count'],
+        sorted(versions.items()), _representation(request),
+    )
+
+
+def post_page_etag(request, slug, **kwargs):
+    """Like ``post_etag`` but for the HTML page, which differs per user."""
+    if _has_flash_message(request):
+        return None
+    etag = post_etag(request, slug)
+    if etag is None:
+        return None
+    return make_etag(etag, request.user.pk)
+
+
+def collection_etag(queryset, *tags, latest_field=None):
+    """ETag for a list response: size and high-water marks of ``queryset``
+    plus the versions of its page cache dependency ``tags``."""
+    aggregates = {'total': Count('pk'), 'last_pk': Max('pk')}
+    if latest_field:
+        aggregates['latest'] = Max(latest_field)
+    watermark = queryset.order_by().aggregate(**aggregates)
+    return make_etag(sorted(watermark.items()), sorted(tag_versions(tags).items()))
+
+
+def published_posts_etag(request, *args, **kwargs):
+    return make_etag(
+        request.get_full_path(), _representation(request),
+        collection_etag(Post.objects.filter(status='published'), 'posts', 'taxonomy',
+                        latest_field='date_updated'),
+    )
+
+
+def all_posts_etag(request, *args, **kwargs):
+    return make_etag(
+        request.get_full_path(), _representation(request),
+        collection_etag(Post.objects.all(), 'posts', 'taxonomy', latest_field='date_updated'),
+    )
+
+
+def taxonomy_etag(model):
+    def etag_func(request, *args, **kwargs):
+        slug = kwargs.get('slug')
+        queryset = model.objects.all()
+        if slug is not None:
+            row = queryset.filter(slug=slug).values().first()
+            if row is None:
+                return None
+            return make_etag(model.__name__, sorted(row.items(), key=lambda item: item[0]), _representation(request))
+        return make_etag(request.get_full_path(), _representation(request), model.__name__,
+                         collection_etag(queryset, 'taxonomy'))
+    return etag_func
+
+
+def sitemap_month_state(request, year, month):
+    return _memoize(request, ('sitemap', year, month), lambda: month_state(year, month))
+
+
+def sitemap_month_etag(request, year, month):
+    state = sitemap_month_state(request, year, month)
+    if not state['count']:
+        return None
+    return make_etag(year, month, sorted(state.items()))
+
+
+def sitemap_month_last_modified(request, year, month):
+    return sitemap_month_state(request, year, month)['lastmod']
+
+
+def _validate(request, etag_func, last_modified_func, args, kwargs):
+    last_modified = None
+    if last_modified_func:
+        dt = last_modified_func(request, *args, **kwargs)
+        if dt:
+            last_modified = int(dt.timestamp())
+    etag = etag_func(request, *args, **kwargs) if etag_func else None
+    etag = quote_etag(etag) if etag is not None else None
+    return get_conditional_response(request, etag=etag, last_modified=last_modified), etag, last_modified
+
+
+def _finish(request, response, etag, last_modified):
+    if request.method in ('GET', 'HEAD'):
+        if last_modified and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(last_modified)
+        if etag:
+            response.headers.setdefault('ETag', etag)
+    return response
+
+
+def conditional(etag_func=None, last_modified_func=None, on_not_modified=None):
+    """Like Django's ``condition`` decorator, plus an ``on_not_modified(request,
+    *args, **kwargs)`` callback for side effects of requests answered with
+    304, such as counting a view.
+
+    Validators query the database, so for async views they are computed in
+    the request's sync thread.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                response, etag, last_modified = await sync_to_async(_validate)(
+                    request, etag_func, last_modified_func, args, kwargs)
+                if response is None:
+                    response = await view_func(request, *args, **kwargs)
+                elif response.status_code == 304 and on_not_modified is not None:
+                    await sync_to_async(on_not_modified)(request, *args, **kwargs)
+                return _finish(request, response, etag, last_modified)
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response, etag, last_modified = _validate(request, etag_func, last_modified_func, args, kwargs)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+            elif response.status_code == 304 and on_not_modified is not None:
+                on_not_modified(request, *args, **kwargs)
+            return _finish(request, response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+conditional_post = conditional(post_etag)
+conditional_post_list = conditional(published_posts_etag)
+conditional_post_collection = conditional(all_posts_etag)
+conditional_category = conditional(taxonomy_etag(Category))
+conditional_tag = conditional(taxonomy_etag(Tag))
+conditional_sitemap_month = conditional(sitemap_month_etag, sitemap_month_last_modified)
+
+
+def conditional_post_page(on_not_modified=None):
+    return conditional(post_page_etag, on_not_modified=on_not_modified)
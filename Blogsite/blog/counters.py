@@ -0,0 +1,112 @@
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .api_cache import bump, bump_all
+from .models import Category, Comment, Post, Tag
+
+
+def _through_count(through, fk_name):
+    """Correlated ``COUNT(*)`` of ``through`` rows pointing at the outer row."""
+    rows = (
+        through.objects.filter(**{fk_name: OuterRef('pk')})
+        .order_by()
+        .values(fk_name)
+        .annotate(total=Count('*'))
+        .values('total')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def post_like_count():
+    return _through_count(Post.likes.through, 'post')
+
+
+def comment_like_count():
+    return _through_count(Comment.likes.through, 'comment')
+
+
+def post_comment_count():
+    rows = (
+        Comment.objects.filter(post=OuterRef('pk'))
+        .order_by()
+        .values('post')
+        .annotate(total=Count('*'))
+        .values('total')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def category_post_count():
+    rows = (
+        Post.objects.filter(category=OuterRef('pk'), status='published')
+        .order_by()
+        .values('category')
+        .annotate(total=Count('*'))
+        .values('total')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def tag_post_count():
+    rows = (
+        Post.tags.through.objects.filter(tag=OuterRef('pk'), post__status='published')
+        .order_by()
+        .values('tag')
+        .annotate(total=Count('*'))
+        .values('total')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+# Counters are part of the API representations, so every refresh bumps the
+# generations of the rows it rewrote (see blog/api_cache.py).
+
+def refresh_category_counts(pks):
+    pks = [pk for pk in pks if pk is not None]
+    if pks:
+        Category.objects.filter(pk__in=pks).update(post_count=category_post_count())
+        bump('category', *pks)
+
+
+def refresh_tag_counts(pks):
+    pks = list(pks)
+    if pks:
+        Tag.objects.filter(pk__in=pks).update(post_count=tag_post_count())
+        bump('tag', *pks)
+
+
+def rebuild_taxonomy_counts():
+    """Recompute published post counts for every category and tag."""
+    categories = Category.objects.update(post_count=category_post_count())
+    tags = Tag.objects.update(post_count=tag_post_count())
+    bump_all('category')
+    bump_all('tag')
+    return categories, tags
+
+
+def refresh_like_counts(model, pks):
+    """Recompute ``like_count`` for the given rows in a single UPDATE."""
+    if model is Post:
+        expression = post_like_count()
+    else:
+        expression = comment_like_count()
+    updated = model.objects.filter(pk__in=pks).update(like_count=expression)
+    if model is Post:
+        bump('post', *pks)
+    else:
+        bump('post', *Comment.objects.filter(pk__in=pks).values_list('post_id', flat=True).distinct())
+    return updated
+
+
+def reconcile_counters():
+    """Recompute every stored counter from scratch.
+
+    Returns the number of posts and comments touched.
+    """
+    posts = Post.objects.update(
+        like_count=post_like_count(),
+        comment_count=post_comment_count(),
+    )
+    comments = Comment.objects.update(like_count=comment_like_count())
+    bump_all('post')
+    return posts, comments
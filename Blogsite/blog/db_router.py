@@ -0,0 +1,228 @@
+"""Primary/replica database routing.
+
+Writes always go to the ``default`` database. Reads go to a healthy alias
+from ``DATABASE_REPLICAS``, except:
+
+* inside a transaction on the primary, so a transaction reads its own rows;
+* inside ``use_primary()``, for code that must not see replication lag;
+* for ``DATABASE_REPLICA_PIN_SECONDS`` after a client's unsafe request
+  (POST, PUT, ...), so users read their own writes. ReplicaPinningMiddleware
+  marks the client with a cookie, which works across worker processes.
+* for filling the page and API caches within DATABASE_REPLICA_PIN_SECONDS
+  of an invalidation, so other clients' misses do not cache a lagging
+  replica's rows (see blog/page_cache.py fill_routing).
+
+With no replicas configured every query goes to the primary.
+"""
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import SynchronousOnlyOperation
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+logger = logging.getLogger('blog.db_router')
+
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_use_primary = contextvars.ContextVar('use_primary', default=False)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+@contextlib.contextmanager
+def use_primary():
+    """Send reads to the primary within the block (or decorated function)."""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+def primary_only(func):
+    if iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with use_primary():
+                return await func(*args, **kwargs)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with use_primary():
+                return func(*args, **kwargs)
+    return wrapper
+
+
+def probe(alias):
+    """Open (or reuse) this thread's connection to ``alias`` and check it
+    answers. Raises DatabaseError when it does not."""
+    connection = connections[alias]
+    if connection.vendor == 'sqlite' and not connection.is_in_memory_db():
+        # Connecting would create an empty database file
+        if not os.path.exists(connection.settings_dict['NAME']):
+            raise DatabaseError(f"{connection.settings_dict['NAME']} does not exist")
+    connection.ensure_connection()
+    if not connection.is_usable():
+        raise DatabaseError(f'Connection to {alias} is not usable')
+
+
+def copy_sqlite_replicas():
+    """Overwrite SQLite replica files with a snapshot of the primary, to try
+    replica routing locally. Returns the aliases copied."""
+    primary = connections[DEFAULT_DB_ALIAS]
+    primary.ensure_connection()
+    copied = []
+    for alias in replicas():
+        replica = connections[alias]
+        if replica.vendor != 'sqlite' or replica.settings_dict['NAME'] == primary.settings_dict['NAME']:
+            continue
+        replica.close()
+        target = sqlite3.connect(replica.settings_dict['NAME'])
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        copied.append(alias)
+    return copied
+
+
+class ReplicaHealth:
+    """Per-process health of the replica aliases.
+
+    A replica is probed at most once per ``DATABASE_REPLICA_CHECK_INTERVAL``
+    seconds, when a read is about to be routed to it. A failed probe (or a
+    ``mark_down`` from code that hit an error) takes the replica out of
+    rotation until the next check.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_check = {}
+        self._down = {}
+
+    def interval(self):
+        return getattr(settings, 'DATABASE_REPLICA_CHECK_INTERVAL', 10)
+
+    def mark_down(self, alias, error=''):
+        with self._lock:
+            if alias not in self._down:
+                logger.warning('Database replica %s is down: %s', alias, error)
+            self._down[alias] = str(error)
+            self._next_check[alias] = time.monotonic() + self.interval()
+
+    def mark_up(self, alias):
+        with self._lock:
+            if self._down.pop(alias, None) is not None:
+                logger.info('Database replica %s is back', alias)
+            self._next_check[alias] = time.monotonic() + self.interval()
+
+    def is_healthy(self, alias):
+        with self._lock:
+            due = time.monotonic() >= self._next_check.get(alias, 0)
+            if due:
+                # Claim the check so concurrent requests do not all probe
+                self._next_check[alias] = time.monotonic() + self.interval()
+        if due:
+            try:
+                probe(alias)
+            except SynchronousOnlyOperation:
+                # Routed from the event loop; check again from a thread
+                with self._lock:
+                    self._next_check[alias] = 0
+            except DatabaseError as error:
+                self.mark_down(alias, error)
+            else:
+                self.mark_up(alias)
+        return alias not in self._down
+
+    def status(self):
+        with self._lock:
+            return {alias: {'healthy': alias not in self._down, 'error': self._down.get(alias, '')}
+                    for alias in replicas()}
+
+    def reset(self):
+        with self._lock:
+            self._next_check.clear()
+            self._down.clear()
+
+
+health = ReplicaHealth()
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related rows come from wherever their instance was read
+            return instance._state.db
+        healthy = [alias for alias in replicas() if health.is_healthy(alias)]
+        return random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinningMiddleware:
+    """Read from the primary during unsafe requests and, through a cookie,
+    for DATABASE_REPLICA_PIN_SECONDS after them."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replicas():
+            return self.get_response(request)
+        with self._routing(request):
+            response = self.get_response(request)
+        return self._pin(request, response)
+
+    async def __acall__(self, request):
+        if not replicas():
+            return await self.get_response(request)
+        # Context variables follow the request into sync_to_async threads
+        with self._routing(request):
+            response = await self.get_response(request)
+        return self._pin(request, response)
+
+    def _routing(self, request):
+        if request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES:
+            return use_primary()
+        return contextlib.nullcontext()
+
+    def _pin(self, request, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5),
+                httponly=True, samesite='Lax', secure=request.is_secure(),
+            )
+        return response
@@ -0,0 +1,164 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.syndication.views import Feed
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+from django.utils.http import parse_http_date_safe, quote_etag
+
+from .conditional import make_etag
+from .models import Category, Post, Tag
+from .page_cache import KEY_PREFIX, get_cache, invalidate, tag_versions
+from .rendering import BODY_FIELDS
+
+
+# RSS and Atom feeds of the latest published posts: site-wide and per
+# category, tag and author. Rendered feeds are cached for every client
+# (nothing in them depends on the user) under page cache dependency tags:
+#
+#   'feed:all', 'feed:category:<pk>', 'feed:tag:<pk>', 'feed:author:<pk>'
+#       bumped when a published post in that feed is saved, deleted or
+#       retagged (see blog/signals.py)
+#   'feeds'
+#       bumped when a category or tag is renamed, which every feed may show
+#
+# The ETag is derived from those versions alone, so revalidating a feed
+# costs at most the lookup of its category, tag or author.
+
+FEED_KEY_PREFIX = f'{KEY_PREFIX}:feed'
+FEED_TYPES = {'rss': Rss201rev2Feed, 'atom': Atom1Feed}
+
+
+def feed_tags(kind, pk=None):
+    return ('feeds', f'feed:{kind}' if pk is None else f'feed:{kind}:{pk}')
+
+
+def invalidate_post_feeds(author_ids=(), category_ids=(), tag_ids=()):
+    """Bump the feeds that list a published post with these relations."""
+    invalidate(
+        'feed:all',
+        *[f'feed:author:{pk}' for pk in author_ids if pk is not None],
+        *[f'feed:category:{pk}' for pk in category_ids if pk is not None],
+        *[f'feed:tag:{pk}' for pk in tag_ids if pk is not None],
+    )
+
+
+class PostFeed(Feed):
+    """Latest published posts of a scope: ``None`` for the whole site, or
+    a Category, Tag or User."""
+
+    def __init__(self, feed_type):
+        super().__init__()
+        self.feed_type = feed_type
+
+    def get_object(self, request, category_slug=None, tag_slug=None, username=None):
+        if category_slug is not None:
+            return get_object_or_404(Category, slug=category_slug)
+        if tag_slug is not None:
+            return get_object_or_404(Tag, slug=tag_slug)
+        if username is not None:
+            return get_object_or_404(get_user_model(), username=username)
+        return None
+
+    def title(self, obj):
+        if obj is None:
+            return 'PyBlog'
+        if isinstance(obj, Category):
+            return f'PyBlog: {obj.name}'
+        if isinstance(obj, Tag):
+            return f'PyBlog: #{obj.name}'
+        return f'PyBlog: posts by {obj.get_username()}'
+
+    def link(self, obj):
+        if obj is None:
+            return reverse('post_list')
+        if isinstance(obj, Category):
+            return reverse('category_posts', kwargs={'category_slug': obj.slug})
+        if isinstance(obj, Tag):
+            return reverse('tag_posts', kwargs={'tag_slug': obj.slug})
+        return reverse('user_profile', kwargs={'username': obj.get_username()})
+
+    def description(self, obj):
+        return f'Latest posts on {self.title(obj)}'
+
+    def items(self, obj):
+        posts = Post.objects.filter(status='published')
+        if isinstance(obj, Category):
+            posts = posts.filter(category=obj)
+        elif isinstance(obj, Tag):
+            posts = posts.filter(tags=obj)
+        elif obj is not None:
+            posts = posts.filter(author=obj)
+        return (posts.select_related('author', 'category').prefetch_related('tags')
+                .defer(*BODY_FIELDS).order_by('-date_created', '-id')[:getattr(settings, 'FEED_ITEMS', 20)])
+
+    def item_title(self, post):
+        return post.title
+
+    def item_description(self, post):
+        return post.summary
+
+    def item_author_name(self, post):
+        return post.author.get_full_name() or post.author.get_username()
+
+    def item_pubdate(self, post):
+        return post.date_created
+
+    def item_updateddate(self, post):
+        return post.date_updated
+
+    def item_categories(self, post):
+        names = [post.category.name] if post.category else []
+        return names + [tag.name for tag in post.tags.all()]
+
+
+def _scope(category_slug=None, tag_slug=None, username=None):
+    """Dependency tags of a feed, looking up its scope's primary key."""
+    if category_slug is not None:
+        model, lookup, kind = Category, {'slug': category_slug}, 'category'
+    elif tag_slug is not None:
+        model, lookup, kind = Tag, {'slug': tag_slug}, 'tag'
+    elif username is not None:
+        model, lookup, kind = get_user_model(), {'username': username}, 'author'
+    else:
+        return feed_tags('all')
+    pk = model.objects.filter(**lookup).values_list('pk', flat=True).first()
+    if pk is None:
+        raise Http404(f'No {kind} matches the given query.')
+    return feed_tags(kind, pk)
+
+
+def serve_feed(request, feed_format, **kwargs):
+    """Serve a feed from the cache while its dependency tags are current,
+    answering conditional requests with 304 Not Modified."""
+    cache = get_cache()
+    versions = tag_versions(_scope(**kwargs), cache)
+    etag = quote_etag(make_etag(request.path, sorted(versions.items())))
+    key = f'{FEED_KEY_PREFIX}:{hashlib.md5(request.path.encode()).hexdigest()}'
+    entry = cache.get(key)
+    if entry is not None and entry['tags'] != versions:
+        entry = None
+
+    last_modified = entry['headers'].get('Last-Modified') if entry else None
+    response = get_conditional_response(request, etag=etag, last_modified=parse_http_date_safe(last_modified))
+    if response is None:
+        if entry is None:
+            generated = PostFeed(FEED_TYPES[feed_format])(request, **kwargs)
+            entry = {
+                'content': generated.content,
+                'headers': {header: generated[header] for header in ('Content-Type', 'Last-Modified')
+                            if generated.has_header(header)},
+                'tags': versions,
+            }
+            cache.set(key, entry, getattr(settings, 'FEED_CACHE_TIMEOUT', 86400))
+            last_modified = entry['headers'].get('Last-Modified')
+        response = HttpResponse(entry['content'])
+        response['Content-Type'] = entry['headers']['Content-Type']
+    if last_modified:
+        response['Last-Modified'] = last_modified
+    response['ETag'] = etag
+    return response
@@ -1,8 +1,11 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, PasswordChangeForm
 from django.contrib.auth.models import User
+from django.db.models import Q
 from ckeditor.widgets import CKEditorWidget
+from .api_cache import bump
 from .models import Post, Comment, Category, Tag, UserProfile
+from .page_cache import invalidate
 
 
 class CustomUserCreationForm(UserCreationForm):
@@ -68,13 +71,25 @@ class PostForm(forms.ModelForm):
             instance.save()
             # Handle tags
             if self.cleaned_data.get('tags_input'):
-                tags = [tag.strip() for tag in self.cleaned_data['tags_input'].split(',') if tag.strip()]
-                instance.tags.clear()
-                for tag_name in tags:
-                    tag, created = Tag.objects.get_or_create(name=tag_name, defaults={'slug': tag_name.lower().replace(' ', '-')})
-                    instance.tags.add(tag)
+                names = dict.fromkeys(tag.strip() for tag in self.cleaned_data['tags_input'].split(',') if tag.strip())
+                instance.tags.set(self.upsert_tags(list(names)))
             self.save_m2m()
         return instance
+    
+    @staticmethod
+    def upsert_tags(names):
+        """Existing or new tags for ``names`` in two queries, however many
+        there are. A name whose slug is taken reuses the tag with that slug."""
+        slugs = {name: name.lower().replace(' ', '-') for name in names}
+        # Rows that already exist (by name or slug) are skipped by the database
+        Tag.objects.bulk_create([Tag(name=name, slug=slug) for name, slug in slugs.items()], ignore_conflicts=True)
+        # bulk_create sends no post_save, so do what the Tag signals would
+        bump(Tag)
+        invalidate('taxonomy')
+        by_name, by_slug = {}, {}
+        for tag in Tag.objects.filter(Q(name__in=names) | Q(slug__in=slugs.values())):
+            by_name[tag.name] = by_slug[tag.slug] = tag
+        return [by_name.get(name) or by_slug[slugs[name]] for name in names]
 
 
 class CommentForm(forms.ModelForm):
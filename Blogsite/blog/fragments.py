@@ -0,0 +1,75 @@
+import hashlib
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .images import image_variants
+from .page_cache import get_cache
+
+
+# Rendered post cards (templates/blog/cards/), cached per post for every
+# user: a card renders from the post alone, never the request, so the
+# authenticated pages the full-page cache skips share the anonymous ones'
+# work. The key holds a version of everything a card shows - date_updated,
+# the counters and the loaded category, author and tags - so an edited post
+# or a renamed category simply misses and the old fragments expire.
+#
+# {% post_cards %} (blog/templatetags/blog_fragments.py) fetches a page's
+# cards with one get_many and stores the misses with one set_many. Views
+# should select_related/prefetch_related what their cards show, both to
+# avoid queries and so the version covers it.
+
+FRAGMENT_KEY_PREFIX = 'blog:card'
+
+
+def _loaded(post, name):
+    """Related object ``name`` if it was loaded with ``post``, else None."""
+    if name in getattr(post, '_prefetched_objects_cache', {}):
+        return list(post._prefetched_objects_cache[name])
+    field = post._meta.get_field(name)
+    if field.is_relation and not field.many_to_many and field.is_cached(post):
+        return field.get_cached_value(post)
+    return None
+
+
+def card_version(post):
+    """Changes whenever anything a card of ``post`` shows changes."""
+    category, author, tags = _loaded(post, 'category'), _loaded(post, 'author'), _loaded(post, 'tags')
+    parts = (
+        post.date_updated, post.views, post.like_count, post.comment_count, post.category_id,
+        (category.name, category.slug) if category else None,
+        author.get_username() if author else None,
+        [(tag.pk, tag.name, tag.slug) for tag in tags] if tags is not None else None,
+    )
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def card_key(post, template_name, options):
+    variant = hashlib.md5(repr((template_name, sorted(options.items()))).encode()).hexdigest()[:12]
+    return f'{FRAGMENT_KEY_PREFIX}:{variant}:{post.pk}:{card_version(post)}'
+
+
+def render_cards(posts, template_name, **options):
+    """The ``template_name`` card of each post, rendered with ``post`` and
+    ``options`` as its context. Search results, whose snippets depend on
+    the query, are rendered every time, and so are cards whose image
+    variants are still being generated."""
+    posts = list(posts)
+    cache = get_cache()
+    keys = {post.pk: card_key(post, template_name, options)
+            for post in posts if not getattr(post, 'search_snippet', '')}
+    found = cache.get_many(list(keys.values())) if keys else {}
+
+    fragments, missing = [], {}
+    for post in posts:
+        key = keys.get(post.pk)
+        fragment = found.get(key)
+        if fragment is None:
+            fragment = render_to_string(template_name, {'post': post, **options})
+            if key and (not post.featured_image or image_variants(post.featured_image)):
+                missing[key] = fragment
+        fragments.append(fragment)
+    if missing:
+        cache.set_many(missing, getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 86400))
+    return mark_safe(''.join(fragments))
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .jobs import enqueue, job
+
+
+# Labelled width bounds; images are never upscaled past their own width
+DEFAULT_VARIANTS = {'thumb': 160, 'card': 640, 'hero': 1280}
+MANIFEST_SUFFIX = '.variants.json'
+MANIFEST_CACHE_KEY = 'blog:images:manifest:%s'
+# How long to remember that an image has no variants yet
+MISSING_MANIFEST_TIMEOUT = 60
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+
+def get_variant_bounds():
+    return getattr(settings, 'IMAGE_VARIANTS', DEFAULT_VARIANTS)
+
+
+def manifest_name(name):
+    return os.path.splitext(name)[0] + MANIFEST_SUFFIX
+
+
+def variant_name(name, width, extension):
+    return f'{os.path.splitext(name)[0]}__{width}w.{extension}'
+
+
+def _cache_key(name):
+    return MANIFEST_CACHE_KEY % hashlib.md5(name.encode()).hexdigest()
+
+
+def _save(storage, image, name, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    quality = WEBP_QUALITY if image_format == 'WEBP' else JPEG_QUALITY
+    image.save(buffer, image_format, quality=quality, optimize=True)
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def generate_variants(name, force=False, storage=None):
+    """Write width-bounded copies of the image ``name`` next to it.
+
+    Every bound in ``IMAGE_VARIANTS`` gets a copy in the original format
+    (JPEG, or PNG for anything else) and a WebP copy. A JSON manifest at
+    ``<name>.variants.json`` records the files, and is what the template
+    tags and serializers read. Returns the manifest.
+    """
+    storage = storage or default_storage
+    if not force:
+        existing = read_manifest(name, storage)
+        if existing is not None:
+            return existing
+
+    with storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        image_format = 'JPEG' if image.format == 'JPEG' else 'PNG'
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    extension = 'jpg' if image_format == 'JPEG' else 'png'
+
+    manifest = {'source': name, 'width': image.width, 'height': image.height, 'variants': {}}
+    by_width = {}
+    for label, bound in sorted(get_variant_bounds().items(), key=lambda item: item[1]):
+        width = min(bound, image.width)
+        if width not in by_width:
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            by_width[width] = {
+                'width': width,
+                'height': height,
+                'path': _save(storage, resized, variant_name(name, width, extension), image_format),
+                'webp': _save(storage, resized, variant_name(name, width, 'webp'), 'WEBP'),
+            }
+        manifest['variants'][label] = by_width[width]
+
+    path = manifest_name(name)
+    if storage.exists(path):
+        storage.delete(path)
+    storage.save(path, ContentFile(json.dumps(manifest).encode()))
+    cache.set(_cache_key(name), manifest, None)
+    return manifest
+
+
+def read_manifest(name, storage=None):
+    storage = storage or default_storage
+    path = manifest_name(name)
+    if not storage.exists(path):
+        return None
+    with storage.open(path, 'rb') as handle:
+        return json.loads(handle.read())
+
+
+def image_variants(image):
+    """Manifest of an ``ImageField`` value, or None until it is generated.
+
+    Manifests are cached so rendering a page of cards does not touch
+    storage for every image.
+    """
+    if not image:
+        return None
+    key = _cache_key(image.name)
+    manifest = cache.get(key)
+    if manifest is None:
+        manifest = read_manifest(image.name, image.storage)
+        if manifest is None:
+            cache.set(key, False, MISSING_MANIFEST_TIMEOUT)
+            return None
+        cache.set(key, manifest, None)
+    return manifest or None
+
+
+def forget_variants(name):
+    cache.delete(_cache_key(name))
+
+
+def srcset(image, webp=False, build_url=None):
+    """``srcset`` attribute value listing every variant width of ``image``."""
+    manifest = image_variants(image)
+    if manifest is None:
+        return ''
+    build_url = build_url or (lambda url: url)
+    widths = {entry['width']: entry for entry in manifest['variants'].values()}
+    return ', '.join(
+        f"{build_url(image.storage.url(entry['webp' if webp else 'path']))} {width}w"
+        for width, entry in sorted(widths.items())
+    )
+
+
+def variant_url(image, label, webp=False):
+    """URL of one variant, falling back to the original upload."""
+    manifest = image_variants(image)
+    entry = manifest['variants'].get(label) if manifest else None
+    if entry is None:
+        return image.url
+    return image.storage.url(entry['webp' if webp else 'path'])
+
+
+# Uploads queue a job (see blog/jobs.py), so the request never waits for
+# Pillow. The backfill command fans out over a process pool of its own.
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def get_executor():
+    """Shared process pool, or None when IMAGE_PIPELINE_WORKERS is 0."""
+    global _executor
+    workers = getattr(settings, 'IMAGE_PIPELINE_WORKERS', 2)
+    if not workers:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        return _executor
+
+
+@job()
+def process_image(name, force=False):
+    generate_variants(name, force=force)
+    return name
+
+
+def schedule_variants(image):
+    """Queue variant generation for a freshly saved ``ImageField`` value.
+    Images that already have a manifest are skipped."""
+    if image and image_variants(image) is None:
+        enqueue(process_image, [image.name], dedupe_key=f'image-variants:{image.name}')
@@ -0,0 +1,254 @@
+import logging
+import os
+import socket
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Count, F, Min, Q
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .db_router import primary_only
+from .models import Job
+
+
+logger = logging.getLogger('blog.jobs')
+
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+# Jobs are rows in the blog_job table, inserted in the caller's transaction,
+# so work is queued exactly when the change that needs it commits. Workers
+# started with ``manage.py run_jobs`` claim due rows with a conditional
+# UPDATE, which needs no row locks and works on every database. Workers and
+# jobs read from the primary, never from a lagging replica.
+
+
+def job(max_attempts=DEFAULT_MAX_ATTEMPTS, priority=0):
+    """Mark a module-level function as a job and set its queue defaults.
+
+    The function is returned unchanged, so it can still be called directly.
+    """
+    def decorator(func):
+        func.job_options = {'max_attempts': max_attempts, 'priority': priority}
+        return func
+    return decorator
+
+
+def job_name(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def is_eager():
+    return getattr(settings, 'JOB_QUEUE_EAGER', False)
+
+
+def enqueue(func, args=(), kwargs=None, *, dedupe_key=None, priority=None, delay=None, max_attempts=None):
+    """Queue ``func(*args, **kwargs)``; arguments must be JSON serializable.
+
+    Only one job per ``dedupe_key`` waits in the queue: queueing it again
+    returns the waiting job, moved up to the higher priority and earlier
+    start. With ``JOB_QUEUE_EAGER`` the call runs in this process after the
+    transaction commits and None is returned.
+    """
+    name = job_name(func)
+    args, kwargs = list(args), dict(kwargs or {})
+    if is_eager():
+        transaction.on_commit(lambda: _run_eagerly(name, args, kwargs), robust=True)
+        return None
+
+    options = getattr(func, 'job_options', {})
+    priority = options.get('priority', 0) if priority is None else priority
+    run_at = timezone.now() + (delay or timedelta())
+    try:
+        with transaction.atomic():
+            return Job.objects.create(
+                name=name, args=args, kwargs=kwargs, priority=priority, run_at=run_at,
+                dedupe_key=dedupe_key,
+                max_attempts=max_attempts or options.get('max_attempts', DEFAULT_MAX_ATTEMPTS),
+            )
+    except IntegrityError:
+        if dedupe_key is None:
+            raise
+    waiting = Job.objects.filter(dedupe_key=dedupe_key, status=Job.QUEUED)
+    waiting.update(priority=Greatest('priority', priority), run_at=Least('run_at', run_at))
+    return waiting.first()
+
+
+def _run_eagerly(name, args, kwargs):
+    import_string(name)(*args, **kwargs)
+
+
+def claim(worker_id, limit=1):
+    """Mark up to ``limit`` due jobs as running for ``worker_id``, highest
+    priority first, and return them."""
+    now = timezone.now()
+    candidates = (Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+                  .order_by('-priority', 'run_at', 'pk').values_list('pk', flat=True)[:limit * 2])
+    claimed = []
+    for pk in candidates:
+        # Whichever worker flips the row first owns the job
+        flipped = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        )
+        if flipped:
+            claimed.append(pk)
+            if len(claimed) == limit:
+                break
+    return list(Job.objects.filter(pk__in=claimed).order_by('-priority', 'run_at', 'pk'))
+
+
+def retry_delay(attempts):
+    """Exponential backoff: JOB_RETRY_BACKOFF seconds, doubled per failed attempt."""
+    base = getattr(settings, 'JOB_RETRY_BACKOFF', 10)
+    ceiling = getattr(settings, 'JOB_RETRY_MAX_DELAY', 3600)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), ceiling))
+
+
+def complete(job):
+    Job.objects.filter(pk=job.pk).delete()
+
+
+def fail(job, error):
+    """Schedule a retry of ``job`` with backoff, or mark it failed once it
+    has used all its attempts."""
+    if job.attempts >= job.max_attempts:
+        Job.objects.filter(pk=job.pk).update(status=Job.FAILED, last_error=error, locked_by='', locked_at=None)
+        logger.error('Job %s failed after %d attempts', job, job.attempts)
+        return
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.QUEUED, run_at=timezone.now() + retry_delay(job.attempts),
+                last_error=error, locked_by='', locked_at=None,
+            )
+    except IntegrityError:
+        # A newer job with the same dedupe key is already waiting
+        complete(job)
+
+
+def retry_failed(queryset):
+    """Queue failed jobs in ``queryset`` again with fresh attempts."""
+    retried = 0
+    for job in queryset.filter(status=Job.FAILED):
+        try:
+            with transaction.atomic():
+                retried += Job.objects.filter(pk=job.pk).update(
+                    status=Job.QUEUED, attempts=0, run_at=timezone.now(), last_error='')
+        except IntegrityError:
+            complete(job)
+    return retried
+
+
+def requeue_stale(timeout=None):
+    """Retry jobs whose worker stopped without reporting a result."""
+    timeout = getattr(settings, 'JOB_STALE_TIMEOUT', 600) if timeout is None else timeout
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale = list(Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff))
+    for job in stale:
+        fail(job, f'Worker {job.locked_by} did not finish the job within {timeout} seconds')
+    return len(stale)
+
+
+def queue_depth():
+    """Per job name: due, scheduled, running and failed counts, in one query."""
+    now = timezone.now()
+    due = Q(status=Job.QUEUED, run_at__lte=now)
+    rows = (Job.objects.order_by('name').values('name').annotate(
+        queued=Count('pk', filter=Q(status=Job.QUEUED)),
+        due=Count('pk', filter=due),
+        running=Count('pk', filter=Q(status=Job.RUNNING)),
+        failed=Count('pk', filter=Q(status=Job.FAILED)),
+        oldest_due=Min('run_at', filter=due),
+    ))
+    return [{**row, 'scheduled': row['queued'] - row['due']} for row in rows]
+
+
+@primary_only
+def execute(name, args, kwargs):
+    """Run one job; returns None on success or the formatted traceback.
+
+    Runs in a pool thread or process, so the traceback travels back as text.
+    """
+    close_old_connections()
+    try:
+        import_string(name)(*args, **kwargs)
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        close_old_connections()
+    return None
+
+
+def _init_process():
+    import django
+    django.setup()
+
+
+class Worker:
+    """Claims due jobs and runs up to ``concurrency`` of them at a time in a
+    thread pool, or a process pool for CPU-bound work."""
+
+    def __init__(self, concurrency=4, processes=False, poll_interval=1.0, worker_id=None):
+        self.concurrency = concurrency
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.processed = 0
+        self.failed = 0
+        self._stopping = False
+
+    def stop(self):
+        """Finish the running jobs, then return from ``run``."""
+        self._stopping = True
+
+    def _executor(self):
+        if self.processes:
+            return ProcessPoolExecutor(max_workers=self.concurrency, initializer=_init_process)
+        return ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='job')
+
+    @primary_only
+    def run(self, burst=False):
+        """Process jobs until stopped, or until the queue has no due jobs
+        when ``burst`` is set. Returns the number of jobs processed."""
+        running = {}
+        next_stale_check = 0
+        with self._executor() as executor:
+            while not self._stopping:
+                if time.monotonic() >= next_stale_check:
+                    requeue_stale()
+                    next_stale_check = time.monotonic() + self.poll_interval * 30
+                free = self.concurrency - len(running)
+                if free:
+                    for job in claim(self.worker_id, free):
+                        running[executor.submit(execute, job.name, job.args, job.kwargs)] = job
+                if not running:
+                    if burst:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._finish(running.pop(future), future)
+            for future in wait(running).done:
+                self._finish(running.pop(future), future)
+        return self.processed
+
+    def _finish(self, job, future):
+        try:
+            error = future.result()
+        except Exception:
+            # The pool itself broke, e.g. a worker process was killed
+            error = traceback.format_exc()
+        self.processed += 1
+        if error is None:
+            complete(job)
+        else:
+            self.failed += 1
+            logger.warning('Job %s raised on attempt %d:\n%s', job, job.attempts, error)
+            fail(job, error)
@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test import override_settings
+from django.urls import reverse
+
+from blog.benchmark import summarize
+from blog.models import Post
+
+
+HOST = '127.0.0.1'
+
+
+def default_paths():
+    paths = ['/', reverse('post_list'), reverse('category_list'), reverse('tag_list'), reverse('post_list_api')]
+    slug = Post.objects.filter(status='published').order_by('-views').values_list('slug', flat=True).first()
+    if slug:
+        paths.append(reverse('post_detail', kwargs={'slug': slug}))
+    return paths
+
+
+def _split(path):
+    path, _, query = path.partition('?')
+    return path, query
+
+
+def run_wsgi(paths, total, concurrency):
+    application = get_wsgi_application()
+
+    def request(path):
+        path, query = _split(path)
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+            'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'HTTP_HOST': HOST, 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+            'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+        }
+        status = []
+        started = time.perf_counter()
+        body = application(environ, lambda code, headers, exc_info=None: status.append(code))
+        try:
+            for _ in body:
+                pass
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        return int(status[0].split()[0]), time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(request, paths))  # warm up
+        started = time.perf_counter()
+        results = list(pool.map(request, (paths[i % len(paths)] for i in range(total))))
+    return results, time.perf_counter() - started
+
+
+def run_asgi(paths, total, concurrency):
+    application = get_asgi_application()
+
+    async def request(path):
+        path, query = _split(path)
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'headers': [(b'host', HOST.encode())],
+            'client': ('127.0.0.1', 50000), 'server': (HOST, 80),
+        }
+        status = []
+        requested = False
+        finished = asyncio.Event()
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # Django listens for a disconnect while the view runs
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif not message.get('more_body'):
+                finished.set()
+
+        started = time.perf_counter()
+        await application(scope, receive, send)
+        return status[0], time.perf_counter() - started
+
+    async def main():
+        for path in paths:
+            await request(path)  # warm up
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(path):
+            async with semaphore:
+                return await request(path)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(limited(paths[i % len(paths)]) for i in range(total)))
+        return results, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+class Command(BaseCommand):
+    help = 'Compare read throughput of the WSGI stack (sync views) and the ASGI stack (async views)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Paths to request in turn (default: the hot read pages)')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per stack')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='WSGI worker threads and ASGI requests in flight')
+        parser.add_argument('--page-cache', action='store_true', help='Keep the anonymous page cache on')
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['mode']:
+            self.stdout.write(json.dumps(self.run_mode(options)))
+            return
+
+        # Each stack runs in its own process, because BLOG_ASYNC_VIEWS picks
+        # the views when the URLconf is imported.
+        rows = {}
+        for mode in ('wsgi', 'asgi'):
+            command = [sys.executable, '-m', 'django', 'benchmark_asgi', '--mode', mode,
+                       '--requests', str(options['requests']), '--concurrency', str(options['concurrency']),
+                       *options['paths']]
+            if options['page_cache']:
+                command.append('--page-cache')
+            env = {**os.environ, 'BLOG_ASYNC_VIEWS': '1' if mode == 'asgi' else '0'}
+            env.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+            result = subprocess.run(command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+            if result.returncode:
+                raise CommandError(f'{mode} benchmark failed:\n{result.stderr}')
+            rows[mode] = json.loads(result.stdout.strip().splitlines()[-1])
+
+        self.stdout.write(f"{'stack':<6} {'requests':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8}  statuses")
+        for mode, row in rows.items():
+            self.stdout.write(
+                f"{mode:<6} {row['requests']:>8} {row['rps']:>9} {row['p50_ms']:>8} {row['p95_ms']:>8}  "
+                f"{row['statuses']}"
+            )
+        if rows['wsgi']['rps']:
+            self.stdout.write(self.style.SUCCESS(
+                f"ASGI/WSGI throughput ratio: {rows['asgi']['rps'] / rows['wsgi']['rps']:.2f} "
+                f"at concurrency {options['concurrency']}"
+            ))
+
+    def run_mode(self, options):
+        overrides = {'ALLOWED_HOSTS': [HOST]}
+        if not options['page_cache']:
+            overrides['PAGE_CACHE_ENABLED'] = False
+        with override_settings(**overrides):
+            paths = options['paths'] or default_paths()
+            runner = run_asgi if options['mode'] == 'asgi' else run_wsgi
+            results, elapsed = runner(paths, options['requests'], options['concurrency'])
+        summary = summarize(results, elapsed)
+        summary['async_views'] = settings.BLOG_ASYNC_VIEWS
+        return summary
@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.benchmark import LoadDriver, benchmark_subjects, build_report, build_routes, compare_reports
+
+
+class Command(BaseCommand):
+    help = ('Load-test every named route of the site in-process and report throughput, '
+            'p50/p95/p99 latency and queries per request as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('routes', nargs='*', help='Route names to run (default: all)')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per route')
+        parser.add_argument('--concurrency', type=int, default=4, help='Client threads per route')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per route')
+        parser.add_argument('--page-cache', action='store_true', help='Keep the anonymous page cache on')
+        parser.add_argument('--writes', action='store_true',
+                            help='Also run routes that create or change data')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--baseline', help='Earlier report to compare with; regressions fail the command')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative p95 growth against the baseline')
+
+    def handle(self, *args, **options):
+        try:
+            subjects = benchmark_subjects()
+        except ValueError as error:
+            raise CommandError(error)
+        routes, skipped = build_routes(writes=options['writes'], subjects=subjects)
+        if options['routes']:
+            unknown = set(options['routes']) - {route.name for route in routes} - set(skipped)
+            if unknown:
+                raise CommandError(f"Unknown routes: {', '.join(sorted(unknown))}")
+            routes = [route for route in routes if route.name in options['routes']]
+            skipped = {name: reason for name, reason in skipped.items() if name in options['routes']}
+
+        driver = LoadDriver(requests=max(1, options['requests']), concurrency=max(1, options['concurrency']),
+                            warmup=max(0, options['warmup']), page_cache=options['page_cache'])
+        # The table goes to stderr when stdout carries the JSON report
+        log = self.stdout if options['output'] else self.stderr
+        log.write(f"{'route':<28} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}  statuses")
+        driver.run(routes, subjects['user'], progress=lambda route: log.write(
+            f"{route.name:<28} {route.stats['rps']:>8} {route.stats['p50_ms']:>8} {route.stats['p95_ms']:>8} "
+            f"{route.stats['p99_ms']:>8} {route.stats.get('queries_mean', 0):>8}  {route.stats['statuses']}"
+        ))
+        for name, reason in skipped.items():
+            log.write(f'{name:<28} skipped: {reason}')
+
+        report = build_report(routes, skipped, driver)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(routes)} routes to {options['output']}"))
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as handle:
+                regressions = compare_reports(json.load(handle), report, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+            log.write(self.style.SUCCESS('No regressions against the baseline'))
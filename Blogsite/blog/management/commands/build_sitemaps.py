@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.sitemaps import base_url, build_closed_shards, sitemap_root
+
+
+class Command(BaseCommand):
+    help = 'Write the sitemap shards of past months to SITEMAP_ROOT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', help='Scheme and host of the URLs, e.g. https://example.com '
+                                               '(defaults to SITE_URL)')
+        parser.add_argument('--force', action='store_true', help='Rewrite shards that already exist')
+
+    def handle(self, *args, **options):
+        if options['base_url']:
+            base = options['base_url'].rstrip('/')
+        else:
+            try:
+                base = base_url()
+            except ValueError as error:
+                raise CommandError(f'{error}, or pass --base-url')
+        written = build_closed_shards(base, force=options['force'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} sitemap shards to {sitemap_root()}'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from blog.db_router import copy_sqlite_replicas, probe, replicas
+
+
+class Command(BaseCommand):
+    help = 'Check that the primary database and every read replica answer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--copy-sqlite', action='store_true',
+                            help='First refresh SQLite replica files with a snapshot of the primary')
+
+    def handle(self, *args, **options):
+        if options['copy_sqlite']:
+            for alias in copy_sqlite_replicas():
+                self.stdout.write(f'Copied the primary to {alias}')
+
+        failed = []
+        for alias in [DEFAULT_DB_ALIAS, *replicas()]:
+            role = 'primary' if alias == DEFAULT_DB_ALIAS else 'replica'
+            location = connections[alias].settings_dict.get('HOST') or connections[alias].settings_dict['NAME']
+            try:
+                probe(alias)
+            except DatabaseError as error:
+                failed.append(alias)
+                self.stdout.write(self.style.ERROR(f'{alias} ({role}, {location}): {error}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{alias} ({role}, {location}): ok'))
+        if DEFAULT_DB_ALIAS in failed:
+            raise CommandError('The primary database is unavailable')
+        if failed:
+            self.stdout.write(self.style.WARNING('Reads fall back to the remaining databases'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Post
+from blog.transfer import DEFAULT_CHUNK_SIZE, Checkpoint, dump_record, export_chunks, open_stream
+
+
+class Command(BaseCommand):
+    help = 'Stream posts with authors, categories, tags and comments as JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', default='-', help='File to write (.gz to compress, - for stdout)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Posts per query batch')
+        parser.add_argument('--status', choices=[choice for choice, _ in Post.STATUS_CHOICES],
+                            help='Only export posts with this status')
+        parser.add_argument('--checkpoint', help='File recording the last exported post; an interrupted '
+                                                 'export resumes from it and appends to the output')
+
+    def handle(self, *args, **options):
+        checkpoint = Checkpoint(options['checkpoint'])
+        after = checkpoint.load()
+        queryset = Post.objects.all()
+        if options['status']:
+            queryset = queryset.filter(status=options['status'])
+
+        exported = 0
+        with open_stream(options['output'], 'a' if after else 'w') as output:
+            for chunk in export_chunks(after, max(1, options['chunk_size']), queryset):
+                output.writelines(dump_record(record) for record in chunk)
+                output.flush()
+                checkpoint.save(chunk[-1]['id'])
+                exported += len(chunk)
+        checkpoint.clear()
+
+        # Keep stdout clean when the records go there
+        report = self.stderr if options['output'] == '-' else self.stdout
+        report.write(self.style.SUCCESS(f'Exported {exported} posts'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from blog.view_counter import flush_views, view_counter
+
+
+class Command(BaseCommand):
+    help = 'Write buffered post view counts to the database (needs a shared VIEW_COUNT_BUFFER cache)'
+
+    def handle(self, *args, **options):
+        if not view_counter.store.shared:
+            self.stderr.write(self.style.WARNING(
+                'View counts are buffered per process; this command cannot see '
+                "the web workers' counts. Set VIEW_COUNT_BUFFER = 'cache' with a shared cache."
+            ))
+        written = flush_views()
+        self.stdout.write(self.style.SUCCESS(f'Flushed {written} buffered views'))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from blog.images import forget_variants, get_executor, process_image
+from blog.models import Post, UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Generate responsive variants for existing featured images and profile pictures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate images that already have variants')
+
+    def handle(self, *args, **options):
+        names = set(Post.objects.exclude(featured_image='').exclude(featured_image=None)
+                    .values_list('featured_image', flat=True))
+        names.update(UserProfile.objects.exclude(profile_picture='').exclude(profile_picture=None)
+                     .values_list('profile_picture', flat=True))
+        names = sorted(names)
+
+        executor = get_executor()
+        if executor is None:
+            results = (self._process(name, options['force']) for name in names)
+        else:
+            futures = [(name, executor.submit(process_image, name, options['force'])) for name in names]
+            results = (self._wait(name, future) for name, future in futures)
+        processed = sum(1 for ok in results if ok)
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {processed} of {len(names)} images'))
+
+    def _process(self, name, force):
+        try:
+            process_image(name, force)
+        except Exception as exc:
+            self.stderr.write(f'{name}: {exc}')
+            return False
+        return True
+
+    def _wait(self, name, future):
+        try:
+            future.result()
+        except Exception as exc:
+            self.stderr.write(f'{name}: {exc}')
+            return False
+        forget_variants(name)
+        return True
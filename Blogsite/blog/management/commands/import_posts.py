@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from blog.transfer import (DEFAULT_CHUNK_SIZE, Checkpoint, PostImporter, chunked, finish_import,
+                           open_stream, read_records)
+
+
+class Command(BaseCommand):
+    help = 'Import posts from JSON Lines written by export_posts, in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='File to read (.gz for compressed, - for stdin)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Posts written per transaction')
+        parser.add_argument('--checkpoint', help='File recording the last imported line; an interrupted '
+                                                 'import resumes after it')
+
+    def handle(self, *args, **options):
+        checkpoint = Checkpoint(options['checkpoint'])
+        skip = checkpoint.load()
+        if skip:
+            self.stdout.write(f'Resuming after line {skip}')
+
+        importer = PostImporter()
+        with open_stream(options['input'], 'r') as source:
+            for chunk in chunked(read_records(source, skip), max(1, options['chunk_size'])):
+                importer.import_chunk([record for _, record in chunk])
+                checkpoint.save(chunk[-1][0])
+                self.stdout.write(f'Imported up to line {chunk[-1][0]}')
+        finish_import()
+        checkpoint.clear()
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {importer.posts_created} posts, updated {importer.posts_updated} posts '
+            f'and imported {importer.comments_created} comments'
+        ))
@@ -0,0 +1,17 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from blog.page_cache import cache_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Show anonymous page cache hit/miss counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(cache_stats(), indent=2))
+        if options['reset']:
+            reset_stats()
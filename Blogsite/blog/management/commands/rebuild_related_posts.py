@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from blog.related import rebuild_related_posts
+
+
+class Command(BaseCommand):
+    help = 'Recompute the related posts of every published post'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Related posts to keep per post')
+
+    def handle(self, *args, **options):
+        count = rebuild_related_posts(limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Computed related posts for {count} posts'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from blog.counters import rebuild_taxonomy_counts, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored like, comment and taxonomy post counters from the source tables'
+
+    def handle(self, *args, **options):
+        posts, comments = reconcile_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciled counters for {posts} posts and {comments} comments'
+        ))
+        categories, tags = rebuild_taxonomy_counts()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt post counts for {categories} categories and {tags} tags'
+        ))
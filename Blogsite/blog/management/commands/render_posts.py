@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from blog.api_cache import bump_all
+from blog.models import Post
+from blog.page_cache import invalidate
+from blog.rendering import render_stored_posts
+
+
+class Command(BaseCommand):
+    help = 'Re-render the stored summary, word count, reading time and sanitized HTML of posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Posts loaded and updated at a time')
+
+    def handle(self, *args, **options):
+        rendered = render_stored_posts(Post, chunk_size=options['chunk_size'])
+        invalidate('posts', 'taxonomy', 'feeds')
+        bump_all('post')
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} posts'))
@@ -0,0 +1,36 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from blog.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Jobs to run at the same time')
+        parser.add_argument('--processes', action='store_true',
+                            help='Run jobs in worker processes instead of threads (for CPU-bound jobs)')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between queue checks')
+        parser.add_argument('--burst', action='store_true', help='Exit once no jobs are due')
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            concurrency=max(1, options['concurrency']),
+            processes=options['processes'],
+            poll_interval=options['poll_interval'],
+        )
+        # Stop claiming on SIGINT/SIGTERM and let running jobs finish
+        previous = {signum: signal.signal(signum, lambda *_: worker.stop())
+                    for signum in (signal.SIGINT, signal.SIGTERM)}
+        pool = 'processes' if worker.processes else 'threads'
+        self.stdout.write(f'Worker {worker.worker_id} running {worker.concurrency} {pool}')
+        try:
+            worker.run(burst=options['burst'])
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {worker.processed} jobs ({worker.failed} failed)'
+        ))
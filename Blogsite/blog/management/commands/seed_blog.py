@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from blog.benchmark import BENCHMARK_PASSWORD, dataset_summary, seed_dataset
+from blog.transfer import DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Create a reproducible synthetic dataset for benchmarks, in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=500)
+        parser.add_argument('--tags', type=int, default=40)
+        parser.add_argument('--categories', type=int, default=8)
+        parser.add_argument('--comments-per-post', type=int, default=5)
+        parser.add_argument('--likes-per-post', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0, help='Same seed and sizes, same dataset')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Posts written per transaction')
+
+    def handle(self, *args, **options):
+        importer = seed_dataset(
+            users=max(1, options['users']), posts=options['posts'], tags=max(1, options['tags']),
+            categories=max(1, options['categories']), comments_per_post=options['comments_per_post'],
+            likes_per_post=options['likes_per_post'], seed=options['seed'],
+            chunk_size=max(1, options['chunk_size']),
+        )
+        self.stdout.write(', '.join(f'{count} {name}' for name, count in dataset_summary().items()))
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {importer.posts_created} new and {importer.posts_updated} existing posts; '
+            f"users bench-user-N log in with password '{BENCHMARK_PASSWORD}'"
+        ))
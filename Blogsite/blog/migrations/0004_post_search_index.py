@@ -0,0 +1,48 @@
+from django.db import migrations
+from django.utils.html import strip_tags
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('blog', 'Post')
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS blog_post_fts USING fts5('
+        'title, excerpt, content, author, category, tags, '
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    posts = Post.objects.filter(status='published').select_related('author', 'category').prefetch_related('tags')
+    rows = [
+        (
+            post.pk,
+            post.title,
+            strip_tags(post.excerpt),
+            strip_tags(post.content),
+            post.author.username,
+            post.category.name if post.category_id else '',
+            ' '.join(tag.name for tag in post.tags.all()),
+        )
+        for post in posts.iterator(chunk_size=500)
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO blog_post_fts (rowid, title, excerpt, content, author, category, tags) '
+            'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+            rows,
+        )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS blog_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_post_like_count_post_comment_count_comment_like_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    Comment = apps.get_model('blog', 'Comment')
+    paths = {}
+    depths = {}
+    updated = []
+    # Parents always have lower ids than their replies
+    for comment in Comment.objects.order_by('pk').only('pk', 'parent_id').iterator(chunk_size=1000):
+        key = str(comment.pk).zfill(10)
+        if comment.parent_id in paths:
+            comment.path = f'{paths[comment.parent_id]}.{key}'
+            comment.depth = depths[comment.parent_id] + 1
+        else:
+            comment.path = key
+            comment.depth = 0
+        paths[comment.pk] = comment.path
+        depths[comment.pk] = comment.depth
+        updated.append(comment)
+        if len(updated) == 1000:
+            Comment.objects.bulk_update(updated, ['path', 'depth'])
+            updated = []
+    Comment.objects.bulk_update(updated, ['path', 'depth'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_post_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='blog_commen_post_id_34d25d_idx'),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
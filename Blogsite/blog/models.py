@@ -1,14 +1,20 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.text import slugify
 from django.urls import reverse
 
+from .rendering import RENDERED_FIELDS, render_post_fields
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True, blank=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Published posts in this category, kept in sync by blog/signals.py
+    post_count = models.PositiveIntegerField(default=0, db_index=True, editable=False)
     
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -25,6 +31,8 @@ class Category(models.Model):
 class Tag(models.Model):
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(max_length=50, unique=True, blank=True)
+    # Published posts with this tag, kept in sync by blog/signals.py
+    post_count = models.PositiveIntegerField(default=0, db_index=True, editable=False)
     
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -67,10 +75,30 @@ class Post(models.Model):
     date_updated = models.DateTimeField(auto_now=True)
     views = models.PositiveIntegerField(default=0)
     likes = models.ManyToManyField(User, blank=True, related_name='liked_posts')
+    # Denormalized counters, kept in sync by blog/signals.py
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Derived from content and excerpt on save (see blog/rendering.py)
+    summary = models.TextField(blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveSmallIntegerField(default=1, editable=False)
+    content_html = models.TextField(blank=True, editable=False)
+    
+    def render_fields(self):
+        for name, value in render_post_fields(self.content, self.excerpt).items():
+            setattr(self, name, value)
     
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            if {'content', 'excerpt'} & set(update_fields):
+                self.render_fields()
+                kwargs['update_fields'] = {*update_fields, *RENDERED_FIELDS}
+        elif 'content' not in self.get_deferred_fields():
+            # A deferred body was not loaded, so it cannot have changed
+            self.render_fields()
         super().save(*args, **kwargs)
     
     def get_absolute_url(self):
@@ -80,22 +108,137 @@ class Post(models.Model):
         return self.title
     
     def total_likes(self):
-        return self.likes.count()
+        return self.like_count
     
     def total_comments(self):
-        return self.comments.count()
+        return self.comment_count
+    
+    class Meta:
+        indexes = [
+            # Keyset pagination seeks on (date_created, id) within a status
+            models.Index(fields=['status', '-date_created', '-id'], name='post_status_created_idx'),
+        ]
 
 
 class Comment(models.Model):
+    # Materialized path: zero-padded ids from the root down, joined by dots,
+    # so ORDER BY path returns a whole thread in depth-first order.
+    PATH_STEP = 10
+    PATH_SEPARATOR = '.'
+    MAX_DEPTH = 20
+
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
     content = models.TextField()
     date_created = models.DateTimeField(auto_now_add=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
     likes = models.ManyToManyField(User, blank=True, related_name='liked_comments')
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    
+    def save(self, *args, **kwargs):
+        is_new = self.pk is None
+        if is_new and self.parent_id:
+            # Replies beyond MAX_DEPTH attach to the deepest allowed ancestor
+            while self.parent.depth >= self.MAX_DEPTH:
+                self.parent = self.parent.parent
+            self.depth = self.parent.depth + 1
+        super().save(*args, **kwargs)
+        if is_new:
+            self.path = self.build_path()
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+    
+    def build_path(self):
+        key = str(self.pk).zfill(self.PATH_STEP)
+        if self.parent_id:
+            return f'{self.parent.path}{self.PATH_SEPARATOR}{key}'
+        return key
     
     def __str__(self):
         return f"{self.author.username}'s comment on {self.post.title}"
     
     class Meta:
-        ordering = ['-date_created']
\ No newline at end of file
+        ordering = ['-date_created']
+        indexes = [models.Index(fields=['post', 'path'])]
+
+class RelatedPost(models.Model):
+    """Precomputed "related posts" entry, maintained by blog/related.py."""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='linked_from')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    
+    def __str__(self):
+        return f'{self.post_id} -> {self.related_id} ({self.score:.3f})'
+    
+    class Meta:
+        ordering = ['post', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'related'], name='unique_related_post'),
+        ]
+        indexes = [models.Index(fields=['post', 'rank'])]
+
+
+class PostDailyStats(models.Model):
+    """One post's activity on one day, rolled up as it happens by
+    blog/stats.py. ``likes`` is net of likes taken back that day."""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='daily_stats')
+    # Copied from the post so an author's series is one index range scan
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    likes = models.IntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f'{self.post_id} on {self.date}'
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'date'], name='unique_post_day'),
+        ]
+        indexes = [models.Index(fields=['author', 'date'], name='daily_stats_author_idx')]
+        verbose_name_plural = 'post daily stats'
+
+
+class Job(models.Model):
+    """Deferred work for the ``run_jobs`` workers, managed by blog/jobs.py."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=200, help_text='Dotted path of the job function')
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # Higher priorities are claimed first
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    dedupe_key = models.CharField(max_length=200, null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
+
+    class Meta:
+        ordering = ['-priority', 'run_at', 'pk']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at'], name='job_claim_idx'),
+        ]
+        constraints = [
+            # At most one waiting job per key; a running one may have a
+            # queued successor that picks up changes made meanwhile.
+            models.UniqueConstraint(fields=['dedupe_key'], condition=Q(status='queued'),
+                                    name='unique_queued_job'),
+        ]
@@ -0,0 +1,216 @@
+import contextlib
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .db_router import replicas, use_primary
+
+
+KEY_PREFIX = 'blog:page'
+STATS_KEYS = {'hits': f'{KEY_PREFIX}:stats:hits', 'misses': f'{KEY_PREFIX}:stats:misses'}
+INVALIDATED_KEY = f'{KEY_PREFIX}:invalidated'
+
+
+def get_cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+def _tag_key(tag):
+    return f'{KEY_PREFIX}:tag:{tag}'
+
+
+def _page_key(request):
+    url = request.build_absolute_uri()
+    return f'{KEY_PREFIX}:{request.method}:{hashlib.md5(url.encode()).hexdigest()}'
+
+
+def _new_version():
+    # Time-based so a tag whose version key was evicted never comes back
+    # with a version an old page was stored under.
+    return time.time_ns()
+
+
+def tag_versions(tags, cache=None):
+    """Current version of each dependency tag, creating missing ones."""
+    cache = cache or get_cache()
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = cache.get_many(list(keys))
+    versions = {keys[key]: version for key, version in found.items()}
+    for key, tag in keys.items():
+        if tag not in versions:
+            version = _new_version()
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[tag] = version
+    return versions
+
+
+def invalidate(*tags):
+    """Bump ``tags`` so every cached page depending on them goes stale."""
+    cache = get_cache()
+    for tag in set(tags):
+        key = _tag_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+    cache.set(INVALIDATED_KEY, time.time(), None)
+
+
+def fill_routing(cache=None):
+    """Where a cache miss should read from: the primary for
+    DATABASE_REPLICA_PIN_SECONDS after any invalidation, so a lagging
+    replica cannot store content from before the write under the new tag
+    versions. The client pinning of blog/db_router.py only covers the
+    writer."""
+    if not replicas():
+        return contextlib.nullcontext()
+    invalidated = (cache or get_cache()).get(INVALIDATED_KEY)
+    if invalidated is not None and time.time() - invalidated < getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5):
+        return use_primary()
+    return contextlib.nullcontext()
+
+
+def add_cache_tags(request, *tags):
+    """Declare extra dependencies of the page being rendered."""
+    if hasattr(request, '_page_cache_tags'):
+        request._page_cache_tags.update(tags)
+
+
+def set_cache_meta(request, **meta):
+    """Store values the ``on_hit`` callback needs when serving this page."""
+    if hasattr(request, '_page_cache_meta'):
+        request._page_cache_meta.update(meta)
+
+
+def record_stat(name, cache=None):
+    cache = cache or get_cache()
+    key = STATS_KEYS[name]
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def cache_stats():
+    values = get_cache().get_many(list(STATS_KEYS.values()))
+    stats = {name: values.get(key, 0) for name, key in STATS_KEYS.items()}
+    total = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / total if total else 0.0
+    return stats
+
+
+def reset_stats():
+    get_cache().delete_many(list(STATS_KEYS.values()))
+
+
+def _cacheable_request(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.COOKIES.get(getattr(settings, 'MESSAGE_COOKIE_NAME', 'messages')):
+        # A flash message is waiting to be shown on this page
+        return False
+    return not request.user.is_authenticated
+
+
+def _cached_response(request, key, on_hit):
+    cache = get_cache()
+    entry = cache.get(key)
+    if entry is None or tag_versions(entry['tags'], cache) != entry['tags']:
+        record_stat('misses', cache)
+        return None
+    record_stat('hits', cache)
+    if on_hit is not None:
+        on_hit(request, entry['meta'])
+    response = HttpResponse(entry['content'], status=entry['status'])
+    for header, value in entry['headers'].items():
+        response[header] = value
+    response['X-Page-Cache'] = 'HIT'
+    return response
+
+
+def _begin(request, tags):
+    # Snapshot versions before rendering so a write that lands while the
+    # page renders still invalidates it.
+    versions = tag_versions(tags)
+    request._page_cache_tags = set(tags)
+    request._page_cache_meta = {}
+    return versions
+
+
+def _store(request, key, response, versions, timeout):
+    if hasattr(response, 'render') and callable(response.render):
+        response = response.render()
+    # A page that rendered a CSRF token holds this visitor's token, and the
+    # CSRF cookie is only set after the view returns
+    csrf_used = request.META.get('CSRF_COOKIE_NEEDS_UPDATE') or request.META.get('CSRF_COOKIE_USED')
+    if response.status_code == 200 and not response.streaming and not response.cookies and not csrf_used:
+        cache = get_cache()
+        extra_tags = request._page_cache_tags - set(versions)
+        versions.update(tag_versions(extra_tags, cache))
+        cache.set(key, {
+            'content': response.content,
+            'status': response.status_code,
+            'headers': {'Content-Type': response['Content-Type']},
+            'tags': versions,
+            'meta': request._page_cache_meta,
+        }, timeout if timeout is not None else getattr(settings, 'PAGE_CACHE_TIMEOUT', 300))
+    response['X-Page-Cache'] = 'MISS'
+    return response
+
+
+def _lookup(request, on_hit):
+    """``(key, cached response or None)``, or ``(None, None)`` to bypass."""
+    if not getattr(settings, 'PAGE_CACHE_ENABLED', True) or not _cacheable_request(request):
+        return None, None
+    key = _page_key(request)
+    return key, _cached_response(request, key, on_hit)
+
+
+def anonymous_page_cache(*tags, timeout=None, on_hit=None):
+    """Cache the full response for anonymous visitors.
+
+    Pages are keyed on the absolute URL (including the query string) and
+    stored with the versions of the dependency ``tags`` they were rendered
+    against, plus any added during rendering with ``add_cache_tags``. Model
+    signals call ``invalidate`` to bump a tag, which makes every page that
+    depends on it a miss without having to find or delete those pages.
+
+    ``on_hit(request, meta)`` runs for cache hits, for side effects such as
+    counting a view. Async views are supported; the cache work then runs in
+    the request's sync thread.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                key, response = await sync_to_async(_lookup)(request, on_hit)
+                if response is not None:
+                    return response
+                if key is None:
+                    return await view_func(request, *args, **kwargs)
+                versions = await sync_to_async(_begin)(request, tags)
+                with await sync_to_async(fill_routing)():
+                    response = await view_func(request, *args, **kwargs)
+                return await sync_to_async(_store)(request, key, response, versions, timeout)
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            key, response = _lookup(request, on_hit)
+            if response is not None:
+                return response
+            if key is None:
+                return view_func(request, *args, **kwargs)
+            versions = _begin(request, tags)
+            with fill_routing():
+                response = view_func(request, *args, **kwargs)
+            return _store(request, key, response, versions, timeout)
+        return wrapper
+    return decorator
@@ -0,0 +1,251 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# Newest first; id breaks ties between posts created in the same instant
+POST_ORDERING = ('-date_created', '-id')
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(payload):
+    data = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(payload, dict):
+        raise InvalidCursor(cursor)
+    return payload
+
+
+class CursorPage:
+    """One page of results plus opaque cursors to its neighbours.
+
+    Exposes the parts of Django's ``Page`` the templates use, without a
+    total count or page numbers.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+class KeysetPaginator:
+    """Seek-method pagination over a unique ordering such as
+    ``('-date_created', '-id')``.
+
+    A page is fetched with ``WHERE (date_created, id) < (last seen)`` and
+    ``LIMIT per_page + 1``, so its cost does not depend on how deep it is,
+    no COUNT is needed, and rows inserted at the head do not shift later
+    pages. The last field of ``ordering`` must be unique.
+    """
+
+    def __init__(self, queryset, per_page, ordering=POST_ORDERING):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.model_fields = [
+            queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+            for name in self.fields
+        ]
+
+    def _position(self, obj):
+        values = []
+        for field in self.model_fields:
+            value = getattr(obj, field.attname)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return values
+
+    def _parse_position(self, values):
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor(values)
+        try:
+            return [field.to_python(value) for field, value in zip(self.model_fields, values)]
+        except Exception:
+            raise InvalidCursor(values)
+
+    def _seek(self, position, forward):
+        """Rows after ``position`` in the page order (before it if not ``forward``)."""
+        clauses = []
+        for index, name in enumerate(self.ordering):
+            descending = name.startswith('-')
+            field = self.fields[index]
+            lookup = 'lt' if descending == forward else 'gt'
+            equal = {self.fields[i]: position[i] for i in range(index)}
+            clauses.append(Q(**equal, **{f'{field}__{lookup}': position[index]}))
+        return reduce(or_, clauses)
+
+    def _query(self, cursor):
+        if cursor:
+            payload = decode_cursor(cursor)
+            position = self._parse_position(payload.get('p'))
+            forward = not payload.get('r')
+        else:
+            position, forward = None, True
+
+        if forward:
+            ordering = self.ordering
+        else:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+        queryset = self.queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._seek(position, forward))
+        return queryset[:self.per_page + 1], position, forward
+
+    def _build_page(self, rows, position, forward):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+        if not rows:
+            return CursorPage(rows)
+
+        first, last = self._position(rows[0]), self._position(rows[-1])
+        if forward:
+            has_next, has_previous = has_more, position is not None
+        else:
+            has_next, has_previous = True, has_more
+        return CursorPage(
+            rows,
+            next_cursor=encode_cursor({'p': last}) if has_next else None,
+            previous_cursor=encode_cursor({'p': first, 'r': 1}) if has_previous else None,
+        )
+
+    def page(self, cursor=None):
+        queryset, position, forward = self._query(cursor)
+        return self._build_page(list(queryset), position, forward)
+
+    async def apage(self, cursor=None):
+        queryset, position, forward = self._query(cursor)
+        return self._build_page([row async for row in queryset], position, forward)
+
+
+class OffsetCursorPaginator:
+    """Opaque cursors over an already bounded result list (e.g. ranked search
+    hits), where there is no stable keyset to seek on."""
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def _offset(self, cursor):
+        offset = 0
+        if cursor:
+            offset = decode_cursor(cursor).get('o')
+            if not isinstance(offset, int) or offset < 0:
+                raise InvalidCursor(cursor)
+        return offset
+
+    def _build_page(self, rows, offset):
+        has_next = len(rows) > self.per_page
+        previous = max(offset - self.per_page, 0)
+        return CursorPage(
+            rows[:self.per_page],
+            next_cursor=encode_cursor({'o': offset + self.per_page}) if has_next else None,
+            previous_cursor=encode_cursor({'o': previous}) if offset else None,
+        )
+
+    def page(self, cursor=None):
+        offset = self._offset(cursor)
+        return self._build_page(list(self.queryset[offset:offset + self.per_page + 1]), offset)
+
+    async def apage(self, cursor=None):
+        offset = self._offset(cursor)
+        rows = [row async for row in self.queryset[offset:offset + self.per_page + 1]]
+        return self._build_page(rows, offset)
+
+
+class KeysetPagination(BasePagination):
+    """DRF pagination backed by ``KeysetPaginator``.
+
+    Views choose the ordering with a ``keyset_ordering`` attribute; the
+    default is newest primary key first.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    default_ordering = ('-pk',)
+
+    def get_page_size(self, request):
+        page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 10)
+        requested = request.query_params.get(self.page_size_query_param)
+        if requested:
+            try:
+                page_size = max(1, min(int(requested), self.max_page_size))
+            except ValueError:
+                pass
+        return page_size
+
+    def paginate_queryset(self, queryset, request, view=None, ordering=None):
+        self.request = request
+        if ordering is None:
+            ordering = getattr(view, 'keyset_ordering', self.default_ordering)
+        paginator = KeysetPaginator(queryset, self.get_page_size(request), ordering)
+        try:
+            self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self._link(self.page.next_cursor),
+            'previous': self._link(self.page.previous_cursor),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,141 @@
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger('blog.query_budget')
+
+# The recorder of the request being served. Concurrent ASGI requests share
+# the sync thread and its connections, so every request's recorder sees
+# every query there; each only counts those run in its own context.
+_current_recorder = ContextVar('query_budget_recorder', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of queries a function view may run.
+
+    Class-based views and viewsets set a ``query_budget`` attribute instead.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def get_query_budget(view_func):
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None:
+        view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+        budget = getattr(view_class, 'query_budget', None)
+    if budget is None:
+        budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+    return budget
+
+
+class QueryRecorder:
+    """``execute_wrapper`` hook counting queries and time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class RequestQueryRecorder(QueryRecorder):
+    """``QueryRecorder`` counting only the queries of the request it serves."""
+
+    def __call__(self, execute, sql, params, many, context):
+        if _current_recorder.get() is not self:
+            return execute(sql, params, many, context)
+        return super().__call__(execute, sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    """Count queries per request and compare them with the view's budget.
+
+    Violations are logged to ``blog.query_budget``; with
+    ``QUERY_BUDGET_RAISE`` (on by default in DEBUG) they raise instead so
+    N+1 regressions surface during development.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = RequestQueryRecorder()
+        request.query_budget = None
+        token = _current_recorder.set(recorder)
+        self._start(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            self._stop(recorder)
+            _current_recorder.reset(token)
+        return self._check(request, response, recorder)
+
+    async def __acall__(self, request):
+        # Under ASGI the ORM runs in the request's sync thread, whose
+        # connections are not the event loop's, so the wrappers are
+        # installed from that thread. sync_to_async copies this context,
+        # so queries run there on this request's behalf find its recorder.
+        recorder = RequestQueryRecorder()
+        request.query_budget = None
+        token = _current_recorder.set(recorder)
+        await sync_to_async(self._start)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(self._stop)(recorder)
+            _current_recorder.reset(token)
+        return self._check(request, response, recorder)
+
+    def _start(self, recorder):
+        for alias in connections:
+            connections[alias].execute_wrappers.append(recorder)
+
+    def _stop(self, recorder):
+        # Requests overlapping on one thread finish in any order, so each
+        # removes its own wrapper rather than popping the last one.
+        for alias in connections:
+            connections[alias].execute_wrappers.remove(recorder)
+
+    def _check(self, request, response, recorder):
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time-Ms'] = f'{recorder.duration * 1000:.1f}'
+
+        budget = request.query_budget
+        if budget is not None and recorder.count > budget:
+            message = (
+                f'{request.method} {request.path} ran {recorder.count} queries '
+                f'({recorder.duration * 1000:.1f} ms), budget is {budget}'
+            )
+            if getattr(settings, 'QUERY_BUDGET_RAISE', settings.DEBUG):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(view_func)
@@ -0,0 +1,209 @@
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+# Query plans derived from a serializer's field tree, so a queryset loads
+# everything the serializer reads up front:
+#
+#   nested serializer over a forward/one-to-one relation  select_related
+#   many=True serializer over a many relation             Prefetch with a
+#                                                         planned queryset
+#   PrimaryKeyRelatedField(many=True), other many fields  prefetch_related
+#   related fields that need more than the key, dotted
+#   sources such as 'author.username'                     select_related
+#
+# Fields the tree cannot explain, typically SerializerMethodFields, declare
+# what they read in ``Meta.query_hints``:
+#
+#   class Meta:
+#       query_hints = {
+#           'reply_count': {'annotate': {'reply_count': Count('replies')}},
+#           'owner_name': {'select_related': ['owner']},
+#       }
+#
+# and then read the annotated value (``obj.reply_count``) instead of
+# querying per object. Annotations only apply to the queryset being
+# planned, i.e. the top level or a prefetched relation; hints of a
+# serializer nested through select_related may only select and prefetch.
+#
+# The plan also defers the columns of the planned queryset that no field
+# reads, so a sparse fieldset (blog/serializers.py SparseFieldsMixin) never
+# loads the post body. A method field says which columns it reads with a
+# 'fields' hint, e.g. {'fields': ['title']}, or [] for the key alone;
+# without one, or with a '*' source or an attribute that is not a model
+# field, every column is loaded. Rows reached through select_related are
+# loaded whole.
+
+
+@dataclass
+class QueryPlan:
+    select_related: set = field(default_factory=set)
+    # lookup -> (related model, QueryPlan of its queryset), or None for a
+    # plain prefetch
+    prefetch_related: dict = field(default_factory=dict)
+    annotate: dict = field(default_factory=dict)
+    # Model fields read at this level, unless reads_all
+    fields: set = field(default_factory=set)
+    reads_all: bool = False
+
+    def deferred(self, model, keep=()):
+        """Concrete fields of ``model`` nothing in the plan reads; ``keep``
+        names more to load, e.g. the ordering a paginator reads back."""
+        if self.reads_all:
+            return []
+        loaded = self.fields | {lookup.split('__')[0] for lookup in self.select_related}
+        loaded.update(name.lstrip('-') for name in keep)
+        return [model_field.name for model_field in model._meta.concrete_fields
+                if not model_field.primary_key and model_field.name not in loaded
+                and model_field.attname not in loaded]
+
+    def apply(self, queryset, keep=()):
+        deferred = self.deferred(queryset.model, keep)
+        if deferred:
+            queryset = queryset.defer(*deferred)
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        for lookup, nested in self.prefetch_related.items():
+            if nested is None:
+                queryset = queryset.prefetch_related(lookup)
+            else:
+                model, plan = nested
+                queryset = queryset.prefetch_related(Prefetch(lookup, queryset=plan.apply(model._default_manager.all())))
+        if self.annotate:
+            queryset = queryset.annotate(**self.annotate)
+        return queryset
+
+
+def _relations(model, attrs):
+    """``[(name, related model, many, model field), ...]`` for the leading relations of
+    the dotted source ``attrs`` on ``model``; stops at the first attribute
+    that is not a relation."""
+    steps = []
+    for attr in attrs:
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not model_field.is_relation or model_field.related_model is None:
+            break
+        many = model_field.many_to_many or model_field.one_to_many
+        steps.append((attr, model_field.related_model, many, model_field))
+        model = model_field.related_model
+        if many:
+            break
+    return steps
+
+
+def _path(prefix, *names):
+    return '__'.join([*prefix, *names])
+
+
+def _add_hint(plan, hint, prefix, top_level):
+    plan.select_related.update(_path(prefix, lookup) for lookup in hint.get('select_related', ()))
+    for lookup in hint.get('prefetch_related', ()):
+        plan.prefetch_related.setdefault(_path(prefix, lookup), None)
+    if top_level:
+        plan.annotate.update(hint.get('annotate', {}))
+        if 'fields' in hint:
+            plan.fields.update(hint['fields'])
+        else:
+            plan.reads_all = True
+
+
+def _reads(plan, model, attr):
+    try:
+        plan.fields.add(model._meta.get_field(attr).name)
+    except FieldDoesNotExist:
+        # A property or method may read any column
+        plan.reads_all = True
+
+
+def _plan_fields(serializer, model, plan, prefix=()):
+    hints = getattr(getattr(serializer, 'Meta', None), 'query_hints', {})
+    for name, serializer_field in serializer.fields.items():
+        if serializer_field.write_only:
+            continue
+        if name in hints:
+            _add_hint(plan, hints[name], prefix, top_level=not prefix)
+            continue
+        if serializer_field.source == '*':
+            if isinstance(serializer_field, serializers.BaseSerializer):
+                _plan_fields(serializer_field, model, plan, prefix)
+            elif not prefix:
+                plan.reads_all = True
+            continue
+        if not prefix:
+            _reads(plan, model, serializer_field.source_attrs[0])
+
+        if (isinstance(serializer_field, serializers.RelatedField) and len(serializer_field.source_attrs) == 1
+                and serializer_field.use_pk_only_optimization()):
+            # Reads the foreign key column only
+            continue
+        steps = _relations(model, serializer_field.source_attrs)
+        if not steps:
+            continue
+        names = [name for name, _, _, _ in steps]
+        many = steps[-1][2]
+        single = names[:-1] if many else names
+        if single:
+            plan.select_related.add(_path(prefix, *single))
+        lookup = _path(prefix, *names)
+
+        if isinstance(serializer_field, serializers.ListSerializer) and many:
+            child = serializer_field.child
+            related_model, model_field = steps[-1][1], steps[-1][3]
+            child_plan = _plan_serializer(child, related_model)
+            if model_field.one_to_many:
+                # The prefetch matches rows back on their foreign key
+                child_plan.fields.add(model_field.field.name)
+            plan.prefetch_related[lookup] = (related_model, child_plan)
+        elif isinstance(serializer_field, serializers.BaseSerializer) and not many:
+            _plan_fields(serializer_field, steps[-1][1], plan, (*prefix, *names))
+        elif many:
+            plan.prefetch_related.setdefault(lookup, None)
+
+
+def _plan_serializer(serializer, model):
+    plan = QueryPlan()
+    _plan_fields(serializer, model, plan)
+    return plan
+
+
+@lru_cache(maxsize=None)
+def plan_for(serializer_class):
+    """The ``QueryPlan`` of a ModelSerializer class."""
+    serializer = serializer_class()
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    return _plan_serializer(serializer, serializer.Meta.model)
+
+
+def optimize(queryset, serializer, keep=()):
+    """``queryset`` with the related rows and only the columns
+    ``serializer`` reads. Pass a serializer class for its full
+    representation, or an instance shaped by the request (sparse fields,
+    expansions), which is planned each time."""
+    if isinstance(serializer, type):
+        plan = plan_for(serializer)
+    else:
+        if isinstance(serializer, serializers.ListSerializer):
+            serializer = serializer.child
+        plan = _plan_serializer(serializer, serializer.Meta.model)
+    return plan.apply(queryset, keep)
+
+
+class OptimizedQuerysetMixin:
+    """Plan a viewset's reads from the serializer the request gets, keeping
+    the ``keyset_ordering`` columns its paginator reads. Writes load whole
+    rows, as saving them needs."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return optimize(queryset, self.get_serializer(), keep=getattr(self, 'keyset_ordering', ()))
@@ -0,0 +1,100 @@
+from collections import defaultdict
+
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .api_cache import bump
+from .models import Comment, Post
+from .page_cache import invalidate
+from .stats import record_activity
+
+
+# Likes are rows in the ManyToMany through tables of Post.likes and
+# Comment.likes. Toggling writes the row with one conditional DELETE or
+# INSERT and moves the stored like_count by one, only when a row actually
+# changed, instead of going through the related manager, which reads before
+# it writes and recounts the table (see blog/signals.py).
+
+
+def _through(model):
+    field = model._meta.get_field('likes')
+    through = field.remote_field.through
+    return through, field.m2m_field_name()
+
+
+def _insert_like(through, fk_name, pk, user_pk):
+    """INSERT the like row unless it exists; True if a row was written."""
+    connection = connections[router.db_for_write(through)]
+    quote = connection.ops.quote_name
+    table = quote(through._meta.db_table)
+    columns = ', '.join(quote(through._meta.get_field(name).column) for name in (fk_name, 'user'))
+    if connection.vendor == 'mysql':
+        sql = f'INSERT IGNORE INTO {table} ({columns}) VALUES (%s, %s)'
+    else:
+        sql = f'INSERT INTO {table} ({columns}) VALUES (%s, %s) ON CONFLICT DO NOTHING'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [pk, user_pk])
+        return cursor.rowcount == 1
+
+
+def toggle_like(obj, user):
+    """Like ``obj`` (a Post or Comment) for ``user``, or take the like back.
+
+    Returns ``(liked, like_count)``; the count is computed from the value
+    loaded on ``obj``, so load it fresh.
+    """
+    model = type(obj)
+    through, fk_name = _through(model)
+    with transaction.atomic():
+        removed, _ = through.objects.filter(**{fk_name: obj.pk, 'user_id': user.pk}).delete()
+        if removed:
+            liked, change = False, -1
+        else:
+            # A concurrent like for the same pair already counted itself
+            liked, change = True, 1 if _insert_like(through, fk_name, obj.pk, user.pk) else 0
+        if not change:
+            return liked, obj.like_count
+        model.objects.filter(pk=obj.pk).update(like_count=Greatest(F('like_count') + change, 0))
+        if model is Post:
+            record_activity('likes', {obj.pk: change}, authors={obj.pk: obj.author_id})
+    obj.like_count = max(obj.like_count + change, 0)
+
+    post_id = obj.pk if model is Post else obj.post_id
+    invalidate(*(['posts'] if model is Post else []), f'post:{post_id}')
+    bump('post', post_id)
+    return liked, obj.like_count
+
+
+def liked_ids(user, model, pks):
+    """Primary keys among ``pks`` of ``model`` rows ``user`` has liked, in
+    one query."""
+    pks = [pk for pk in pks if pk is not None]
+    if not pks or not user.is_authenticated:
+        return set()
+    through, fk_name = _through(model)
+    return set(through.objects.filter(user_id=user.pk, **{f'{fk_name}_id__in': pks})
+               .values_list(f'{fk_name}_id', flat=True))
+
+
+def mark_liked(user, objects):
+    """Set ``user_has_liked`` on each Post or Comment in ``objects``, with
+    one query per model."""
+    by_model = defaultdict(list)
+    for obj in objects:
+        by_model[type(obj)].append(obj)
+    for model, group in by_model.items():
+        liked = liked_ids(user, model, [obj.pk for obj in group])
+        for obj in group:
+            obj.user_has_liked = obj.pk in liked
+    return objects
+
+
+def walk_tree(comments):
+    """Every comment in a tree built by blog/comment_tree.py, parents first."""
+    for comment in comments:
+        yield comment
+        yield from walk_tree(getattr(comment, 'children', ()))
+
+
+LIKEABLE = {'posts': Post, 'comments': Comment}
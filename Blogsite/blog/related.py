@@ -0,0 +1,335 @@
+import hashlib
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min
+from django.utils.html import strip_tags
+
+from .api_cache import bump, bump_all
+from .jobs import enqueue, job
+from .models import Post, RelatedPost
+from .page_cache import invalidate
+from .rendering import BODY_FIELDS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+DEFAULT_WEIGHTS = {'tags': 1.0, 'category': 0.5, 'text': 1.0}
+# Terms shared by the most posts become the TF-IDF features; words that
+# occur in a single post can never make two posts similar.
+MAX_TEXT_FEATURES = 2000
+BLOCK_SIZE = 256
+STOP_WORDS = frozenset('''
+    about after all also and any are because been but can could did does for
+    from had has have her his how into its just more most not now off only
+    other our out over own same she should some such than that the their them
+    then there these they this those through too under very was were what
+    when where which while who why will with would you your
+'''.split())
+_WORD_RE = re.compile(r'[^\W\d_]{3,}', re.UNICODE)
+
+
+def tokenize(text):
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in STOP_WORDS]
+
+
+def get_limit():
+    return getattr(settings, 'RELATED_POSTS_LIMIT', 6)
+
+
+def get_weights():
+    return {**DEFAULT_WEIGHTS, **getattr(settings, 'RELATED_POSTS_WEIGHTS', {})}
+
+
+class Corpus:
+    """Similarity features of a set of posts.
+
+    The score of two posts is::
+
+        tags * jaccard(tag sets) + category * same category
+            + text * cosine(TF-IDF of title and excerpt)
+
+    Scores are computed in blocks of rows with NumPy matrix products when it
+    is installed, and from inverted indexes otherwise.
+    """
+
+    def __init__(self, documents, weights=None, use_numpy=None):
+        """``documents`` yields ``(post_id, category_id, tag_ids, text)``."""
+        self.weights = weights or get_weights()
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        self.ids, self.categories, self.tags = [], [], []
+        term_counts = []
+        document_frequency = Counter()
+        for post_id, category_id, tag_ids, text in documents:
+            self.ids.append(post_id)
+            self.categories.append(category_id)
+            self.tags.append(frozenset(tag_ids))
+            counts = Counter(tokenize(text))
+            term_counts.append(counts)
+            document_frequency.update(counts.keys())
+        self.position = {post_id: row for row, post_id in enumerate(self.ids)}
+
+        shared = [term for term, df in document_frequency.items() if df > 1]
+        shared.sort(key=lambda term: (-document_frequency[term], term))
+        self.vocabulary = shared[:MAX_TEXT_FEATURES]
+        features = set(self.vocabulary)
+        total = len(self.ids)
+        self.vectors = []
+        for counts in term_counts:
+            vector = {
+                term: (1 + math.log(count)) * (math.log((1 + total) / (1 + document_frequency[term])) + 1)
+                for term, count in counts.items()
+            }
+            # Normalise over every term, then keep only the shared features
+            norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+            self.vectors.append({term: weight / norm for term, weight in vector.items() if term in features})
+        self._index = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, rows):
+        """Yield ``(row, {other_row: score})`` with positive scores only."""
+        rows = list(rows)
+        if self.use_numpy:
+            for start in range(0, len(rows), BLOCK_SIZE):
+                block = rows[start:start + BLOCK_SIZE]
+                matrix = self._score_block(block)
+                for row, values in zip(block, matrix):
+                    others = np.flatnonzero(values > 0)
+                    yield row, dict(zip(others.tolist(), values[others].tolist()))
+        else:
+            for row in rows:
+                yield row, self._score_row(row)
+
+    def top_related(self, post_ids=None, limit=None):
+        """Yield ``(post_id, [(related_id, score), ...])`` best first."""
+        limit = get_limit() if limit is None else limit
+        if post_ids is None:
+            rows = range(len(self.ids))
+        else:
+            rows = [self.position[post_id] for post_id in post_ids if post_id in self.position]
+        for row, scores in self.scores(rows):
+            best = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], self.ids[item[0]]))
+            yield self.ids[row], [(self.ids[other], score) for other, score in best]
+
+    def _build_matrices(self):
+        n = len(self.ids)
+        columns = {term: column for column, term in enumerate(self.vocabulary)}
+        text = np.zeros((n, len(columns)), dtype=np.float32)
+        for row, vector in enumerate(self.vectors):
+            for term, weight in vector.items():
+                text[row, columns[term]] = weight
+        tag_columns = {tag: column for column, tag in enumerate(sorted(set().union(*self.tags)))}
+        tags = np.zeros((n, len(tag_columns)), dtype=np.float32)
+        for row, tag_ids in enumerate(self.tags):
+            for tag_id in tag_ids:
+                tags[row, tag_columns[tag_id]] = 1
+        categories = np.array([-1 if category is None else category for category in self.categories], dtype=np.int64)
+        return text, tags, tags.sum(axis=1), categories
+
+    def _score_block(self, block):
+        if self._index is None:
+            self._index = self._build_matrices()
+        text, tags, tag_counts, categories = self._index
+        block = np.asarray(block, dtype=np.int64)
+        shared = tags[block] @ tags.T
+        union = tag_counts[block, None] + tag_counts[None, :] - shared
+        jaccard = np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+        same_category = (categories[block, None] == categories[None, :]) & (categories[block, None] >= 0)
+        scores = (
+            self.weights['tags'] * jaccard
+            + self.weights['category'] * same_category
+            + self.weights['text'] * (text[block] @ text.T)
+        )
+        scores[np.arange(len(block)), block] = 0
+        return scores
+
+    def _build_index(self):
+        terms, tags, categories = defaultdict(list), defaultdict(list), defaultdict(list)
+        for row, vector in enumerate(self.vectors):
+            for term, weight in vector.items():
+                terms[term].append((row, weight))
+            for tag_id in self.tags[row]:
+                tags[tag_id].append(row)
+            if self.categories[row] is not None:
+                categories[self.categories[row]].append(row)
+        return terms, tags, categories
+
+    def _score_row(self, row):
+        if self._index is None:
+            self._index = self._build_index()
+        terms, tags, categories = self._index
+        scores = defaultdict(float)
+        for term, weight in self.vectors[row].items():
+            for other, other_weight in terms[term]:
+                scores[other] += self.weights['text'] * weight * other_weight
+        own_tags = self.tags[row]
+        shared = Counter(other for tag_id in own_tags for other in tags[tag_id])
+        for other, count in shared.items():
+            scores[other] += self.weights['tags'] * count / (len(own_tags) + len(self.tags[other]) - count)
+        if self.categories[row] is not None:
+            for other in categories[self.categories[row]]:
+                scores[other] += self.weights['category']
+        scores.pop(row, None)
+        return {other: score for other, score in scores.items() if score > 0}
+
+
+def load_corpus(post_ids=None, **kwargs):
+    """Corpus of every published post, or of those among ``post_ids``,
+    loaded with two queries."""
+    tags = defaultdict(list)
+    links = Post.tags.through.objects.filter(post__status='published')
+    posts = Post.objects.filter(status='published')
+    if post_ids is not None:
+        links = links.filter(post_id__in=post_ids)
+        posts = posts.filter(pk__in=post_ids)
+    for post_id, tag_id in links.values_list('post_id', 'tag_id'):
+        tags[post_id].append(tag_id)
+    posts = posts.order_by('pk').values_list('pk', 'category_id', 'title', 'excerpt')
+    # The title is repeated so its words weigh more than the excerpt's
+    documents = (
+        (pk, category_id, tags[pk], f'{title} {title} {strip_tags(excerpt)}')
+        for pk, category_id, title, excerpt in posts
+    )
+    return Corpus(documents, **kwargs)
+
+
+def _entries(related):
+    return [
+        RelatedPost(post_id=post_id, related_id=related_id, score=score, rank=rank)
+        for post_id, items in related
+        for rank, (related_id, score) in enumerate(items)
+    ]
+
+
+@job(priority=-1)
+def rebuild_related_posts(limit=None, **kwargs):
+    """Recompute the related-posts table for every published post."""
+    corpus = load_corpus(**kwargs)
+    with transaction.atomic():
+        RelatedPost.objects.all().delete()
+        batch = []
+        for item in corpus.top_related(limit=limit):
+            batch.append(item)
+            if len(batch) == BLOCK_SIZE:
+                RelatedPost.objects.bulk_create(_entries(batch))
+                batch = []
+        RelatedPost.objects.bulk_create(_entries(batch))
+    invalidate('posts')
+    bump_all('post')
+    return len(corpus)
+
+
+def neighbourhood(post_ids):
+    """Published posts sharing a tag or the category with ``post_ids``."""
+    tag_ids = Post.tags.through.objects.filter(post_id__in=post_ids).values('tag_id')
+    category_ids = Post.objects.filter(pk__in=post_ids, category__isnull=False).values('category_id')
+    tagged = Post.tags.through.objects.filter(tag_id__in=tag_ids, post__status='published')
+    same_category = Post.objects.filter(status='published', category_id__in=category_ids)
+    return set(tagged.values_list('post_id', flat=True)) | set(same_category.values_list('pk', flat=True))
+
+
+@job(priority=-1)
+def refresh_related_posts(post_ids, limit=None, **kwargs):
+    """Update the table after ``post_ids`` changed.
+
+    The changed posts get fresh lists, and so does every other post whose
+    list contained one of them or that shares a tag or the category with
+    one of them and now scores it above its weakest entry. Only those
+    candidates and the current entries of the lists being rewritten are
+    loaded and scored, so the cost follows the changed posts' neighbourhood
+    rather than the size of the site. Document frequencies are those of
+    that sample, and posts similar by text alone are only picked up by
+    ``rebuild_related_posts``; run it periodically to re-level both.
+    Returns the ids of the posts whose lists were rewritten.
+    """
+    limit = get_limit() if limit is None else limit
+    post_ids = set(post_ids)
+    if not post_ids:
+        return set()
+    listing = set(RelatedPost.objects.filter(related_id__in=post_ids).values_list('post_id', flat=True))
+    candidates = neighbourhood(post_ids) - post_ids
+    sample = post_ids | listing | candidates
+    sample.update(RelatedPost.objects.filter(post_id__in=listing | candidates).values_list('related_id', flat=True))
+    corpus = load_corpus(sample, **kwargs)
+    current = [post_id for post_id in post_ids if post_id in corpus.position]
+    affected = set(current) | listing
+
+    thresholds = {
+        row['post']: row['weakest'] if row['entries'] >= limit else 0
+        for row in RelatedPost.objects.filter(post_id__in=candidates).order_by().values('post')
+        .annotate(weakest=Min('score'), entries=Count('*'))
+    }
+    for row, scores in corpus.scores(corpus.position[post_id] for post_id in current):
+        for other, score in scores.items():
+            other_id = corpus.ids[other]
+            if other_id in candidates and score > thresholds.get(other_id, 0):
+                affected.add(other_id)
+
+    with transaction.atomic():
+        RelatedPost.objects.filter(post_id__in=affected | post_ids).delete()
+        RelatedPost.objects.bulk_create(_entries(corpus.top_related(affected, limit=limit)))
+    invalidate(*[f'post:{post_id}' for post_id in affected | post_ids])
+    bump('post', *(affected | post_ids))
+    return affected
+
+
+def schedule_refresh(*post_ids):
+    """Queue a refresh of related posts for ``post_ids`` once the transaction
+    commits (see blog/jobs.py).
+
+    The ids travel with the commit hook of the transaction that scheduled
+    them, so a refresh never runs before the changes it is about are
+    visible. Scheduling the same ids again while their job waits, as the
+    save and tag signals of one post do, queues nothing new.
+    """
+    transaction.on_commit(partial(run_scheduled_refresh, post_ids))
+
+
+def run_scheduled_refresh(post_ids):
+    if post_ids:
+        post_ids = sorted(set(post_ids))
+        digest = hashlib.md5(repr(post_ids).encode()).hexdigest()
+        enqueue(refresh_related_posts, [post_ids], dedupe_key=f'related-posts:{digest}')
+
+
+def related_posts(post, limit=None):
+    """Precomputed related posts of ``post``, best first, in one query.
+
+    Each post carries its similarity as ``related_score``.
+    """
+    queryset = (
+        Post.objects.filter(linked_from__post=post, status='published')
+        .annotate(related_score=F('linked_from__score'))
+        .select_related('author', 'category')
+        .defer(*BODY_FIELDS)
+        .order_by('linked_from__rank')
+    )
+    return queryset[:limit] if limit else queryset
+
+
+def attach_related_posts(posts, limit=None):
+    """Set ``related_post_list`` on each post using one query for all of them."""
+    posts = list(posts)
+    by_post = {post.pk: [] for post in posts}
+    if by_post:
+        entries = (RelatedPost.objects.filter(post_id__in=by_post, related__status='published')
+                   .select_related('related').defer(*[f'related__{name}' for name in BODY_FIELDS])
+                   .order_by('post_id', 'rank'))
+        for entry in entries:
+            related = by_post[entry.post_id]
+            if limit is None or len(related) < limit:
+                entry.related.related_score = entry.score
+                related.append(entry.related)
+    for post in posts:
+        post.related_post_list = by_post[post.pk]
+    return posts
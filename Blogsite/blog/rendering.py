@@ -0,0 +1,172 @@
+import html
+import math
+import re
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from django.utils.text import Truncator
+
+
+# Fields derived from a post's CKEditor HTML when it is saved (see
+# Post.save), so pages and the API never parse the body per request:
+#
+#   summary       plain text, the author's excerpt or the body's first words
+#   word_count    words in the body's text
+#   reading_time  minutes at READING_SPEED words per minute, at least 1
+#   content_html  the body with only ALLOWED_TAGS and ALLOWED_ATTRIBUTES
+#
+# Changing the rules here needs `manage.py render_posts` to re-render the
+# stored posts.
+
+SUMMARY_WORDS = 30
+READING_SPEED = 200  # words per minute
+
+ALLOWED_TAGS = frozenset('''
+    a abbr b blockquote br caption cite code dd del div dl dt em figcaption figure
+    h1 h2 h3 h4 h5 h6 hr i img ins kbd li mark ol p pre q s small span strike
+    strong sub sup table tbody td tfoot th thead tr u ul
+'''.split())
+VOID_TAGS = frozenset({'br', 'hr', 'img'})
+# Dropped together with everything inside them
+DROPPED_TAGS = frozenset({'script', 'style', 'iframe', 'object', 'embed', 'template', 'noscript', 'svg', 'math'})
+ALLOWED_ATTRIBUTES = {
+    '*': {'class', 'title', 'lang', 'dir'},
+    'a': {'href', 'target', 'rel', 'name'},
+    'img': {'src', 'alt', 'width', 'height'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan', 'scope'},
+    'ol': {'start', 'type'},
+}
+URL_ATTRIBUTES = {'href', 'src'}
+ALLOWED_SCHEMES = {'', 'http', 'https', 'mailto'}
+BLOCK_TAGS = frozenset({'p', 'div', 'br', 'li', 'blockquote', 'pre', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+                        'figcaption', 'dt', 'dd', 'table', 'ul', 'ol', 'hr'})
+
+
+def _safe_url(value):
+    # Browsers ignore control characters and whitespace inside schemes
+    cleaned = re.sub(r'[\x00-\x20]+', '', html.unescape(value))
+    try:
+        scheme = urlsplit(cleaned).scheme.lower()
+    except ValueError:
+        return False
+    return scheme in ALLOWED_SCHEMES
+
+
+class _Sanitizer(HTMLParser):
+    """Rebuild HTML from allowed tags and attributes only, collecting the
+    text on the way."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.html, self.text, self.open = [], [], []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append('\n')
+        if tag not in ALLOWED_TAGS:
+            return
+        allowed = ALLOWED_ATTRIBUTES['*'] | ALLOWED_ATTRIBUTES.get(tag, set())
+        kept = []
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES and not _safe_url(value):
+                continue
+            kept.append((name, value))
+        if tag == 'a' and dict(kept).get('target') == '_blank':
+            kept = [(name, value) for name, value in kept if name != 'rel'] + [('rel', 'noopener noreferrer')]
+        if tag == 'img':
+            kept.append(('loading', 'lazy'))
+        rendered = ''.join(f' {name}="{html.escape(value)}"' for name, value in kept)
+        self.html.append(f'<{tag}{rendered}>')
+        if tag not in VOID_TAGS:
+            self.open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.open and self.open[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            self.dropping = max(self.dropping - 1, 0)
+            return
+        if self.dropping or tag not in self.open:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append('\n')
+        # Close anything left open inside this element
+        while self.open:
+            current = self.open.pop()
+            self.html.append(f'</{current}>')
+            if current == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.html.append(html.escape(data, quote=False))
+            self.text.append(data)
+
+    def close(self):
+        super().close()
+        while self.open:
+            self.html.append(f'</{self.open.pop()}>')
+
+
+def sanitize(source):
+    """``(sanitized HTML, plain text)`` of an HTML fragment."""
+    parser = _Sanitizer()
+    parser.feed(source or '')
+    parser.close()
+    text = re.sub(r'[ \t\r\f\v\xa0]+', ' ', ''.join(parser.text))
+    text = re.sub(r'\s*\n\s*', '\n', text).strip()
+    return ''.join(parser.html), text
+
+
+def plain_text(source):
+    return sanitize(source)[1]
+
+
+def render_post_fields(content, excerpt=''):
+    """The derived fields of a post with this body and excerpt."""
+    content_html, text = sanitize(content)
+    word_count = len(text.split())
+    summary = ' '.join((plain_text(excerpt) if excerpt else '').split()) or ' '.join(text.split())
+    return {
+        'summary': Truncator(summary).words(SUMMARY_WORDS),
+        'word_count': word_count,
+        'reading_time': max(1, math.ceil(word_count / READING_SPEED)),
+        'content_html': content_html,
+    }
+
+
+RENDERED_FIELDS = ('summary', 'word_count', 'reading_time', 'content_html')
+# Only the detail page needs these; lists defer them
+BODY_FIELDS = ('content', 'content_html')
+
+
+def render_stored_posts(model, queryset=None, chunk_size=500):
+    """Re-render the derived fields of stored posts chunk by chunk; returns
+    the number of posts updated."""
+    queryset = model.objects.all() if queryset is None else queryset
+    queryset = queryset.order_by('pk').only('pk', 'content', 'excerpt')
+    last_pk, updated = 0, 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return updated
+        for post in chunk:
+            for name, value in render_post_fields(post.content, post.excerpt).items():
+                setattr(post, name, value)
+        model.objects.bulk_update(chunk, RENDERED_FIELDS)
+        last_pk = chunk[-1].pk
+        updated += len(chunk)
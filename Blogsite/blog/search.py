@@ -0,0 +1,221 @@
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+from django.utils.html import escape, strip_tags
+from django.utils.module_loading import import_string
+
+from .models import Post
+
+
+FTS_TABLE = 'blog_post_fts'
+FTS_COLUMNS = ('title', 'excerpt', 'content', 'author', 'category', 'tags')
+
+# Markers used inside FTS snippets; swapped for <mark> after HTML escaping
+_HIGHLIGHT_START = '\x02'
+_HIGHLIGHT_END = '\x03'
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+@dataclass
+class SearchHit:
+    post_id: int
+    rank: float
+    snippet: str = ''
+
+
+def post_document(post):
+    """Plain-text fields of ``post`` in FTS_COLUMNS order."""
+    return (
+        post.title,
+        strip_tags(post.excerpt),
+        strip_tags(post.content),
+        post.author.username,
+        post.category.name if post.category_id else '',
+        ' '.join(tag.name for tag in post.tags.all()),
+    )
+
+
+def highlight(snippet):
+    return escape(snippet).replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_END, '</mark>')
+
+
+class BaseSearchBackend:
+    """Interface every search backend implements.
+
+    A PostgreSQL backend can store a tsvector column and implement the same
+    methods with ``SearchQuery``/``SearchRank``/``SearchHeadline``.
+    """
+
+    def index_posts(self, post_ids):
+        raise NotImplementedError
+
+    def remove_posts(self, post_ids):
+        raise NotImplementedError
+
+    def rebuild(self):
+        raise NotImplementedError
+
+    def search(self, query, limit=50, offset=0, scope=None):
+        """Return a list of ``SearchHit`` ordered by relevance.
+
+        ``scope`` is an optional Post queryset the hits must belong to, so
+        ``limit`` and ``offset`` apply after filtering by it.
+        """
+        raise NotImplementedError
+
+    def indexable_posts(self, post_ids=None):
+        queryset = (Post.objects.filter(status='published')
+                    .select_related('author', 'category')
+                    .prefetch_related('tags'))
+        if post_ids is not None:
+            queryset = queryset.filter(pk__in=post_ids)
+        return queryset
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """SQLite FTS5 index kept in the ``blog_post_fts`` virtual table.
+
+    The table's rowid is the post id. Columns are weighted for bm25 so title
+    and tag matches outrank body matches.
+    """
+
+    weights = (10.0, 4.0, 1.0, 2.0, 3.0, 5.0)
+    snippet_tokens = 24
+
+    def index_posts(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        rows = [(post.pk,) + post_document(post) for post in self.indexable_posts(post_ids)]
+        placeholders = ', '.join(['%s'] * (len(FTS_COLUMNS) + 1))
+        with connection.cursor() as cursor:
+            self._delete(cursor, post_ids)
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FTS_COLUMNS)}) VALUES ({placeholders})',
+                rows,
+            )
+
+    def remove_posts(self, post_ids):
+        post_ids = list(post_ids)
+        if post_ids:
+            with connection.cursor() as cursor:
+                self._delete(cursor, post_ids)
+
+    def _delete(self, cursor, post_ids):
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', post_ids)
+
+    def rebuild(self, chunk_size=500):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        post_ids = self.indexable_posts().order_by('pk').values_list('pk', flat=True)
+        chunk, indexed = [], 0
+        for post_id in post_ids.iterator(chunk_size=chunk_size):
+            chunk.append(post_id)
+            if len(chunk) == chunk_size:
+                self.index_posts(chunk)
+                indexed += len(chunk)
+                chunk = []
+        self.index_posts(chunk)
+        return indexed + len(chunk)
+
+    @staticmethod
+    def match_expression(query):
+        """Turn free text into an FTS5 query: every word, prefix-matched."""
+        tokens = _TOKEN_RE.findall(query)
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def search(self, query, limit=50, offset=0, scope=None):
+        match = self.match_expression(query)
+        if not match:
+            return []
+        weights = ', '.join(str(weight) for weight in self.weights)
+        content_column = FTS_COLUMNS.index('content')
+        where, params = f'{FTS_TABLE} MATCH %s', [match]
+        if scope is not None:
+            scope_sql, scope_params = scope.order_by().values('pk').query.sql_with_params()
+            where += f' AND rowid IN ({scope_sql})'
+            params.extend(scope_params)
+        sql = (
+            f'SELECT rowid, bm25({FTS_TABLE}, {weights}) AS rank, '
+            f"snippet({FTS_TABLE}, {content_column}, %s, %s, '…', {self.snippet_tokens}) "
+            f'FROM {FTS_TABLE} WHERE {where} ORDER BY rank LIMIT %s OFFSET %s'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [_HIGHLIGHT_START, _HIGHLIGHT_END, *params, limit, offset])
+            return [SearchHit(post_id, rank, highlight(snippet)) for post_id, rank, snippet in cursor.fetchall()]
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Unindexed ``icontains`` search for databases without FTS support."""
+
+    def index_posts(self, post_ids):
+        pass
+
+    def remove_posts(self, post_ids):
+        pass
+
+    def rebuild(self):
+        return 0
+
+    def search(self, query, limit=50, offset=0, scope=None):
+        posts = Post.objects.filter(status='published')
+        if scope is not None:
+            posts = posts.filter(pk__in=scope.order_by().values('pk'))
+        post_ids = (
+            posts
+            .filter(
+                Q(title__icontains=query) |
+                Q(content__icontains=query) |
+                Q(excerpt__icontains=query) |
+                Q(author__username__icontains=query) |
+                Q(category__name__icontains=query) |
+                Q(tags__name__icontains=query)
+            )
+            .distinct()
+            .order_by('-date_created')
+            .values_list('pk', flat=True)[offset:offset + limit]
+        )
+        return [SearchHit(post_id, 0.0) for post_id in post_ids]
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'BLOG_SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == 'sqlite':
+            _backend = SQLiteFTSBackend()
+        else:
+            _backend = DatabaseSearchBackend()
+    return _backend
+
+
+def search_posts(query, queryset=None, limit=None):
+    """Restrict ``queryset`` (published posts by default) to matches for
+    ``query``, ordered by rank.
+
+    Returns ``(queryset, hits)`` where ``hits`` maps post id to its
+    ``SearchHit`` so callers can show snippets. The backend searches within
+    ``queryset``, so ``limit`` caps the matches left after its filters.
+    """
+    if queryset is None:
+        queryset = Post.objects.filter(status='published')
+    if limit is None:
+        limit = getattr(settings, 'BLOG_SEARCH_MAX_RESULTS', 500)
+    hits = get_backend().search(query, limit=limit, scope=queryset)
+    post_ids = [hit.post_id for hit in hits]
+    queryset = queryset.filter(pk__in=post_ids)
+    if post_ids:
+        queryset = queryset.order_by(Case(
+            *[When(pk=post_id, then=position) for position, post_id in enumerate(post_ids)],
+            output_field=IntegerField(),
+        ))
+    return queryset, {hit.post_id: hit for hit in hits}
@@ -1,6 +1,41 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from django.contrib.auth.models import User
 from .models import Post, Category, Tag, Comment, UserProfile
+from .comment_tree import attach_comment_trees, comment_tree, reply_tree
+from .related import attach_related_posts, related_posts
+from .images import image_variants, srcset
+
+
+def _param_names(request, name):
+    params = getattr(request, 'query_params', request.GET)
+    return {value.strip() for value in params.get(name, '').split(',') if value.strip()}
+
+
+class SparseFieldsMixin:
+    """Shape a serializer from the request's query string on reads.
+    
+    ``?expand=author,tags`` swaps the relations listed in
+    ``Meta.expandable`` (name -> factory of the nested field) in for their
+    compact form, or adds them; ``?fields=id,title`` keeps only the named
+    fields, plus any expanded. Only the serializer handed the request in
+    its context is shaped, never the ones nested in it, and the query plan
+    (blog/query_plan.py) follows, so dropped fields are not loaded either.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        expandable = getattr(self.Meta, 'expandable', {})
+        expand = _param_names(request, 'expand') & set(expandable)
+        for name in expand:
+            self.fields[name] = expandable[name]()
+        requested = _param_names(request, 'fields')
+        if requested:
+            for name in set(self.fields) - requested - expand:
+                self.fields.pop(name)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -9,79 +44,169 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
 
 
+class ImageVariantsField(serializers.Field):
+    """Read-only URLs and srcsets of an image's responsive variants."""
+    
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+    
+    def to_representation(self, image):
+        if not image:
+            return None
+        request = self.context.get('request')
+        build_url = request.build_absolute_uri if request else (lambda url: url)
+        manifest = image_variants(image)
+        variants = manifest['variants'] if manifest else {}
+        return {
+            'src': build_url(image.url),
+            'srcset': srcset(image, build_url=build_url),
+            'webp_srcset': srcset(image, webp=True, build_url=build_url),
+            'variants': {
+                label: {
+                    'width': entry['width'],
+                    'height': entry['height'],
+                    'url': build_url(image.storage.url(entry['path'])),
+                    'webp_url': build_url(image.storage.url(entry['webp'])),
+                }
+                for label, entry in variants.items()
+            },
+        }
+
+
 class UserProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
+    profile_picture_variants = ImageVariantsField(source='profile_picture')
     
     class Meta:
         model = UserProfile
-        fields = ['id', 'user', 'bio', 'profile_picture', 'website', 'twitter', 'github', 'linkedin']
+        fields = ['id', 'user', 'bio', 'profile_picture', 'profile_picture_variants',
+                  'website', 'twitter', 'github', 'linkedin']
 
 
 class CategorySerializer(serializers.ModelSerializer):
-    post_count = serializers.SerializerMethodField()
-    
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug', 'description', 'created_at', 'post_count']
-    
-    def get_post_count(self, obj):
-        return obj.posts.count()
+        read_only_fields = ['post_count']
 
 
 class TagSerializer(serializers.ModelSerializer):
-    post_count = serializers.SerializerMethodField()
-    
     class Meta:
         model = Tag
         fields = ['id', 'name', 'slug', 'post_count']
-    
-    def get_post_count(self, obj):
-        return obj.posts.count()
+        read_only_fields = ['post_count']
 
 
 class CommentSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     replies = serializers.SerializerMethodField()
-    like_count = serializers.SerializerMethodField()
+    hidden_replies = serializers.SerializerMethodField()
     
     class Meta:
         model = Comment
-        fields = ['id', 'post', 'author', 'content', 'date_created', 'parent', 'replies', 'like_count']
-        read_only_fields = ['post', 'author', 'date_created']
+        fields = ['id', 'post', 'author', 'content', 'date_created', 'parent', 'depth',
+                  'replies', 'hidden_replies', 'like_count']
+        read_only_fields = ['post', 'author', 'date_created', 'depth', 'like_count']
+    
+    def _load_replies(self, obj):
+        # Comments coming from comment_tree() already carry their children;
+        # a standalone comment loads its subtree with one path query.
+        if not hasattr(obj, 'children'):
+            obj.children, obj.hidden_replies = reply_tree(obj)
+        return obj.children
     
     def get_replies(self, obj):
-        if obj.replies.exists():
-            return CommentSerializer(obj.replies.all(), many=True).data
-        return []
+        return CommentSerializer(self._load_replies(obj), many=True).data
     
-    def get_like_count(self, obj):
-        return obj.likes.count()
+    def get_hidden_replies(self, obj):
+        self._load_replies(obj)
+        return obj.hidden_replies
 
 
-class PostSerializer(serializers.ModelSerializer):
+class RelatedPostSerializer(serializers.ModelSerializer):
+    score = serializers.FloatField(source='related_score', read_only=True)
+    
+    class Meta:
+        model = Post
+        fields = ['id', 'title', 'slug', 'score']
+        read_only_fields = fields
+
+
+class PostListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Load the comment threads and related posts of every post on the
+        # page in one query each, when the representation includes them
+        posts = data.all() if hasattr(data, 'all') else data
+        if 'comments' in self.child.fields:
+            posts = attach_comment_trees(posts)
+        if 'related_posts' in self.child.fields:
+            posts = attach_related_posts(posts)
+        return super().to_representation(posts)
+
+
+class PostCommentsMixin:
+    def get_comments(self, obj):
+        # Top-level comments with their replies nested, from one query
+        tree = getattr(obj, 'comment_tree', None)
+        if tree is None:
+            tree = comment_tree(obj)
+        return CommentSerializer(tree, many=True).data
+
+
+class PostSummarySerializer(SparseFieldsMixin, PostCommentsMixin, serializers.ModelSerializer):
+    """The list representation of a post: headline fields, with the author
+    and category as primary keys unless expanded, and tags and comments
+    only when expanded."""
+    author = serializers.PrimaryKeyRelatedField(read_only=True)
+    category = serializers.PrimaryKeyRelatedField(read_only=True)
+    comments_count = serializers.IntegerField(source='comment_count', read_only=True)
+    likes_count = serializers.IntegerField(source='like_count', read_only=True)
+    
+    class Meta:
+        model = Post
+        fields = [
+            'id', 'title', 'slug', 'summary', 'reading_time', 'featured_image', 'author', 'category',
+            'status', 'date_created', 'date_updated', 'views', 'comments_count', 'likes_count'
+        ]
+        read_only_fields = fields
+        list_serializer_class = PostListSerializer
+        expandable = {
+            'author': lambda: UserSerializer(read_only=True),
+            'category': lambda: CategorySerializer(read_only=True),
+            'tags': lambda: TagSerializer(many=True, read_only=True),
+            'comments': serializers.SerializerMethodField,
+        }
+        # Comment trees are attached by post id
+        query_hints = {'comments': {'fields': []}}
+
+
+class PostSerializer(SparseFieldsMixin, PostCommentsMixin, serializers.ModelSerializer):
+    """The detail representation of a post, with everything nested."""
     author = UserSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
-    comments_count = serializers.SerializerMethodField()
-    likes_count = serializers.SerializerMethodField()
+    comments_count = serializers.IntegerField(source='comment_count', read_only=True)
+    likes_count = serializers.IntegerField(source='like_count', read_only=True)
     comments = serializers.SerializerMethodField()
+    related_posts = serializers.SerializerMethodField()
+    featured_image_variants = ImageVariantsField(source='featured_image')
     
     class Meta:
         model = Post
         fields = [
-            'id', 'title', 'slug', 'content', 'featured_image', 'excerpt',
-            'author', 'category', 'tags', 'status', 'date_created', 'date_updated',
-            'views', 'comments_count', 'likes_count', 'comments'
+            'id', 'title', 'slug', 'content', 'content_html', 'featured_image', 'featured_image_variants',
+            'excerpt', 'summary', 'word_count', 'reading_time', 'author', 'category', 'tags', 'status', 'date_created', 'date_updated',
+            'views', 'comments_count', 'likes_count', 'comments', 'related_posts'
         ]
-        read_only_fields = ['author', 'date_created', 'date_updated', 'views']
-    
-    def get_comments_count(self, obj):
-        return obj.comments.count()
+        read_only_fields = ['author', 'date_created', 'date_updated', 'views',
+                            'content_html', 'summary', 'word_count', 'reading_time']
+        list_serializer_class = PostListSerializer
+        # Comment trees and related posts are attached by post id
+        query_hints = {'comments': {'fields': []}, 'related_posts': {'fields': []}}
     
-    def get_likes_count(self, obj):
-        return obj.likes.count()
-    
-    def get_comments(self, obj):
-        # Only return top-level comments (no replies)
-        comments = obj.comments.filter(parent=None)
-        return CommentSerializer(comments, many=True).data
\ No newline at end of file
+    def get_related_posts(self, obj):
+        related = getattr(obj, 'related_post_list', None)
+        if related is None:
+            related = related_posts(obj)
+        return RelatedPostSerializer(related, many=True).data
@@ -0,0 +1,353 @@
+from django.contrib.auth.models import User
+from django.core.signals import request_finished
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .api_cache import bump
+from .counters import refresh_category_counts, refresh_like_counts, refresh_tag_counts
+from .feeds import invalidate_post_feeds
+from .images import schedule_variants
+from .models import Category, Comment, Post, RelatedPost, Tag, UserProfile
+from .page_cache import invalidate
+from .related import schedule_refresh as schedule_related_refresh
+from .search import get_backend
+from .sitemaps import discard_post_shard
+from .stats import record_activity
+from .view_counter import view_counter
+
+
+def _sync_like_count(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # Remember which rows lose a like before the through rows are gone
+        instance._cleared_like_pks = list(
+            sender.objects.filter(user=instance).values_list(model._meta.model_name, flat=True)
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        liked_model = type(instance)
+        pks = [instance.pk]
+    else:
+        liked_model = model
+        if action == 'post_clear':
+            pks = getattr(instance, '_cleared_like_pks', [])
+        else:
+            pks = list(pk_set or [])
+    if not pks:
+        return
+
+    refresh_like_counts(liked_model, pks)
+    if not reverse:
+        instance.like_count = liked_model.objects.values_list('like_count', flat=True).get(pk=instance.pk)
+
+
+m2m_changed.connect(_sync_like_count, sender=Post.likes.through, dispatch_uid='post_like_count')
+m2m_changed.connect(_sync_like_count, sender=Comment.likes.through, dispatch_uid='comment_like_count')
+
+
+@receiver(post_save, sender=Comment, dispatch_uid='comment_count_add')
+def comment_added(sender, instance, created, **kwargs):
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(comment_count=F('comment_count') + 1)
+        authors = {instance.post_id: instance.post.author_id} if Comment.post.is_cached(instance) else None
+        record_activity('comments', {instance.post_id: 1}, authors=authors)
+
+
+# Daily rollup of likes (see blog/stats.py). Likes toggled through
+# blog/reactions.py bypass m2m_changed and record their own activity.
+# Deleted comments and cleared likes stay in the history of their day.
+
+@receiver(m2m_changed, sender=Post.likes.through, dispatch_uid='post_likes_daily_stats')
+def record_post_likes(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    change = 1 if action == 'post_add' else -1
+    if reverse:
+        record_activity('likes', {pk: change for pk in pk_set})
+    else:
+        record_activity('likes', {instance.pk: change * len(pk_set)}, authors={instance.pk: instance.author_id})
+
+
+@receiver(post_delete, sender=Comment, dispatch_uid='comment_count_remove')
+def comment_removed(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id, comment_count__gt=0).update(
+        comment_count=F('comment_count') - 1
+    )
+
+
+# Taxonomy post counts: only posts whose published state or category
+# actually changed cause the affected rows to be recounted.
+
+@receiver(pre_save, sender=Post, dispatch_uid='post_taxonomy_before')
+def remember_post_taxonomy(sender, instance, raw=False, **kwargs):
+    instance._taxonomy_before = None
+    instance._author_before = None
+    if instance.pk and not raw:
+        before = Post.objects.filter(pk=instance.pk).values_list('status', 'category_id', 'author_id').first()
+        if before is not None:
+            instance._taxonomy_before, instance._author_before = before[:2], before[2]
+
+
+@receiver(post_save, sender=Post, dispatch_uid='post_taxonomy_counts')
+def update_post_taxonomy_counts(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_taxonomy_before', None)
+    old_status, old_category = before or (None, None)
+    published_changed = (old_status == 'published') != (instance.status == 'published')
+    if published_changed or old_category != instance.category_id:
+        refresh_category_counts({old_category, instance.category_id})
+    if published_changed and not created:
+        refresh_tag_counts(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Post, dispatch_uid='post_taxonomy_before_delete')
+def remember_deleted_post_tags(sender, instance, **kwargs):
+    instance._deleted_tag_pks = list(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Post, dispatch_uid='post_taxonomy_delete')
+def update_deleted_post_taxonomy_counts(sender, instance, **kwargs):
+    if instance.status == 'published':
+        refresh_category_counts([instance.category_id])
+        refresh_tag_counts(getattr(instance, '_deleted_tag_pks', []))
+
+
+@receiver(m2m_changed, sender=Post.tags.through, dispatch_uid='post_tags_taxonomy_counts')
+def update_tag_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and not reverse:
+        instance._cleared_tag_pks = list(instance.tags.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        refresh_tag_counts([instance.pk])
+    elif instance.status == 'published':
+        if action == 'post_clear':
+            refresh_tag_counts(getattr(instance, '_cleared_tag_pks', []))
+        else:
+            refresh_tag_counts(pk_set or [])
+
+
+@receiver(post_save, sender=Post, dispatch_uid='post_search_index')
+def index_post(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.status == 'published':
+        get_backend().index_posts([instance.pk])
+    else:
+        get_backend().remove_posts([instance.pk])
+
+
+@receiver(post_delete, sender=Post, dispatch_uid='post_search_unindex')
+def unindex_post(sender, instance, **kwargs):
+    get_backend().remove_posts([instance.pk])
+
+
+@receiver(m2m_changed, sender=Post.tags.through, dispatch_uid='post_tags_search_index')
+def reindex_post_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_post_pks = list(instance.posts.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # instance is a Tag; pk_set holds post ids (None on clear)
+        post_ids = pk_set if pk_set is not None else getattr(instance, '_cleared_post_pks', [])
+    else:
+        post_ids = [instance.pk]
+    get_backend().index_posts(post_ids)
+
+
+# Related posts: recomputed after commit for the posts that changed (see
+# blog/related.py).
+
+@receiver(post_save, sender=Post, dispatch_uid='post_related_save')
+def refresh_related_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_related_refresh(instance.pk)
+
+
+@receiver(pre_delete, sender=Post, dispatch_uid='post_related_delete')
+def refresh_related_on_delete(sender, instance, **kwargs):
+    # The cascade removes the rows pointing at this post; the posts that
+    # listed it need a replacement entry.
+    linked = RelatedPost.objects.filter(related=instance).values_list('post_id', flat=True)
+    schedule_related_refresh(*linked)
+
+
+@receiver(m2m_changed, sender=Post.tags.through, dispatch_uid='post_tags_related')
+def refresh_related_on_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_post_pks = list(instance.posts.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        post_ids = pk_set if pk_set is not None else getattr(instance, '_cleared_post_pks', [])
+    else:
+        post_ids = [instance.pk]
+    schedule_related_refresh(*post_ids)
+
+
+# Responsive image variants (see blog/images.py)
+
+@receiver(post_save, sender=Post, dispatch_uid='post_image_variants')
+def generate_post_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_variants(instance.featured_image)
+
+
+@receiver(post_save, sender=UserProfile, dispatch_uid='profile_image_variants')
+def generate_profile_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_variants(instance.profile_picture)
+
+
+# Feeds and sitemap shards (see blog/feeds.py and blog/sitemaps.py). Only
+# changes to published posts, including posts leaving that state, touch
+# them; views, likes and comments do not.
+
+@receiver(post_save, sender=Post, dispatch_uid='post_feeds_save')
+def refresh_post_feeds(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_status, old_category = getattr(instance, '_taxonomy_before', None) or (None, None)
+    if instance.status != 'published' and old_status != 'published':
+        return
+    tag_ids = [] if created else instance.tags.values_list('pk', flat=True)
+    invalidate_post_feeds(
+        {instance.author_id, getattr(instance, '_author_before', None)},
+        {instance.category_id, old_category},
+        tag_ids,
+    )
+    discard_post_shard(instance)
+
+
+@receiver(post_delete, sender=Post, dispatch_uid='post_feeds_delete')
+def refresh_deleted_post_feeds(sender, instance, **kwargs):
+    if instance.status == 'published':
+        invalidate_post_feeds([instance.author_id], [instance.category_id], getattr(instance, '_deleted_tag_pks', []))
+        discard_post_shard(instance)
+
+
+@receiver(m2m_changed, sender=Post.tags.through, dispatch_uid='post_tags_feeds')
+def refresh_tagged_post_feeds(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # Posts retagged from the tag's side; rare enough to refresh them all
+        invalidate('feeds')
+    elif instance.status == 'published':
+        tag_ids = getattr(instance, '_cleared_tag_pks', []) if action == 'post_clear' else pk_set or []
+        invalidate_post_feeds([instance.author_id], [instance.category_id], tag_ids)
+
+
+@receiver(post_save, sender=Category, dispatch_uid='category_feeds_save')
+@receiver(post_delete, sender=Category, dispatch_uid='category_feeds_delete')
+@receiver(post_save, sender=Tag, dispatch_uid='tag_feeds_save')
+@receiver(post_delete, sender=Tag, dispatch_uid='tag_feeds_delete')
+def refresh_taxonomy_feeds(sender, instance, created=False, **kwargs):
+    # Feed titles and item categories show the names; a new one is in no feed
+    if not created:
+        invalidate('feeds')
+
+
+# Anonymous page cache dependencies (see blog/page_cache.py):
+#   'posts'     - any page listing post cards
+#   'post:<pk>' - the detail page of one post
+#   'taxonomy'  - category and tag sidebars and index pages
+
+@receiver(post_save, sender=Post, dispatch_uid='post_page_cache_save')
+@receiver(post_delete, sender=Post, dispatch_uid='post_page_cache_delete')
+def invalidate_post_pages(sender, instance, **kwargs):
+    invalidate('posts', 'taxonomy', f'post:{instance.pk}')
+
+
+@receiver(post_save, sender=Comment, dispatch_uid='comment_page_cache_save')
+@receiver(post_delete, sender=Comment, dispatch_uid='comment_page_cache_delete')
+def invalidate_comment_pages(sender, instance, **kwargs):
+    invalidate('posts', f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Category, dispatch_uid='category_page_cache_save')
+@receiver(post_delete, sender=Category, dispatch_uid='category_page_cache_delete')
+@receiver(post_save, sender=Tag, dispatch_uid='tag_page_cache_save')
+@receiver(post_delete, sender=Tag, dispatch_uid='tag_page_cache_delete')
+def invalidate_taxonomy_pages(sender, instance, **kwargs):
+    # Post cards and detail pages show category and tag names too
+    invalidate('taxonomy', 'posts')
+    for post_id in instance.posts.values_list('pk', flat=True):
+        invalidate(f'post:{post_id}')
+
+
+def _invalidate_related_post_pages(instance, reverse, pk_set, *extra_tags):
+    if reverse:
+        post_ids = pk_set or []
+    else:
+        post_ids = [instance.pk]
+    invalidate('posts', *extra_tags, *[f'post:{post_id}' for post_id in post_ids])
+
+
+@receiver(m2m_changed, sender=Post.tags.through, dispatch_uid='post_tags_page_cache')
+def invalidate_tagged_post_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _invalidate_related_post_pages(instance, reverse, pk_set, 'taxonomy')
+
+
+@receiver(m2m_changed, sender=Post.likes.through, dispatch_uid='post_likes_page_cache')
+def invalidate_liked_post_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _invalidate_related_post_pages(instance, reverse, pk_set)
+
+
+# API response cache generations (see blog/api_cache.py). Counter refreshes
+# bump the rows they rewrite in blog/counters.py.
+
+@receiver(post_save, sender=Post, dispatch_uid='post_api_cache_save')
+@receiver(post_delete, sender=Post, dispatch_uid='post_api_cache_delete')
+def bump_post_generation(sender, instance, **kwargs):
+    bump(Post, instance.pk)
+
+
+@receiver(post_save, sender=Comment, dispatch_uid='comment_api_cache_save')
+@receiver(post_delete, sender=Comment, dispatch_uid='comment_api_cache_delete')
+def bump_commented_post_generation(sender, instance, **kwargs):
+    bump(Post, instance.post_id)
+
+
+@receiver(post_save, sender=Category, dispatch_uid='category_api_cache_save')
+@receiver(post_delete, sender=Category, dispatch_uid='category_api_cache_delete')
+@receiver(post_save, sender=Tag, dispatch_uid='tag_api_cache_save')
+@receiver(post_delete, sender=Tag, dispatch_uid='tag_api_cache_delete')
+def bump_taxonomy_generation(sender, instance, **kwargs):
+    # Posts nest these, and their responses depend on the whole model
+    bump(sender, instance.pk)
+
+
+@receiver(post_save, sender=User, dispatch_uid='user_api_cache_save')
+@receiver(post_delete, sender=User, dispatch_uid='user_api_cache_delete')
+def bump_user_generation(sender, instance, update_fields=None, **kwargs):
+    # Posts and comments nest their authors; logging in only stamps last_login
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump(sender, instance.pk)
+
+
+@receiver(m2m_changed, sender=Post.tags.through, dispatch_uid='post_tags_api_cache')
+def bump_tagged_post_generations(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        bump(Post, *(pk_set if pk_set is not None else getattr(instance, '_cleared_post_pks', [])))
+    else:
+        bump(Post, instance.pk)
+
+
+@receiver(request_finished, dispatch_uid='flush_requested_views')
+def flush_requested_views(sender, **kwargs):
+    # The response is already on its way, so the write costs the visitor nothing
+    view_counter.flush_requested()
@@ -0,0 +1,177 @@
+import datetime
+import os
+import tempfile
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.functions import TruncMonth
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Category, Post, Tag
+
+
+# Sitemap index sharded by month of publication (date_created). Shards of
+# months that have ended are written once to SITEMAP_ROOT and served from
+# there (the web server may serve that directory directly); saving or
+# deleting a published post discards its month's file so the next request
+# writes it again. The current month and the page shard are rendered per
+# request. Every response carries validators for conditional GET.
+
+SITEMAP_NAMESPACE = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def sitemap_root():
+    return getattr(settings, 'SITEMAP_ROOT', os.path.join(settings.MEDIA_ROOT, 'sitemaps'))
+
+
+def base_url(request=None):
+    """Scheme and host sitemap URLs are built with. SITE_URL wins, so
+    shards written to disk do not depend on the host that requested them."""
+    site_url = getattr(settings, 'SITE_URL', '')
+    if site_url:
+        return site_url.rstrip('/')
+    if request is None:
+        raise ValueError('Set SITE_URL to build sitemaps outside a request')
+    return request.build_absolute_uri('/').rstrip('/')
+
+
+def shard_name(year, month):
+    return f'posts-{year:04d}-{month:02d}.xml'
+
+
+def shard_path(year, month):
+    return os.path.join(sitemap_root(), shard_name(year, month))
+
+
+def is_closed(year, month, today=None):
+    """Whether the month has ended, so its shard can live on disk."""
+    today = today or timezone.localdate()
+    return (year, month) < (today.year, today.month)
+
+
+def _published():
+    return Post.objects.filter(status='published')
+
+
+def _month_range(year, month):
+    tz = timezone.get_current_timezone()
+    start = datetime.datetime(year, month, 1, tzinfo=tz)
+    end = datetime.datetime(year + month // 12, month % 12 + 1, 1, tzinfo=tz)
+    return start, end
+
+
+def month_shards():
+    """``[{'year', 'month', 'count', 'lastmod'}, ...]`` for every month with
+    published posts, oldest first, in one query."""
+    rows = (_published().annotate(month=TruncMonth('date_created')).order_by()
+            .values('month').annotate(count=Count('pk'), lastmod=Max('date_updated')).order_by('month'))
+    return [{'year': row['month'].year, 'month': row['month'].month,
+             'count': row['count'], 'lastmod': row['lastmod']} for row in rows]
+
+
+def month_state(year, month):
+    """Size and last change of a month's published posts."""
+    start, end = _month_range(year, month)
+    return _published().filter(date_created__gte=start, date_created__lt=end).aggregate(
+        count=Count('pk'), last_pk=Max('pk'), lastmod=Max('date_updated'))
+
+
+def _w3c(value):
+    return value.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _urlset(entries):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield f'<urlset xmlns="{SITEMAP_NAMESPACE}">\n'
+    for location, lastmod in entries:
+        yield f'<url><loc>{escape(location)}</loc>'
+        if lastmod:
+            yield f'<lastmod>{_w3c(lastmod)}</lastmod>'
+        yield '</url>\n'
+    yield '</urlset>\n'
+
+
+def render_index(shards, base):
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n', f'<sitemapindex xmlns="{SITEMAP_NAMESPACE}">\n',
+             f"<sitemap><loc>{escape(base + reverse('sitemap_pages'))}</loc></sitemap>\n"]
+    for shard in shards:
+        location = base + reverse('sitemap_posts', kwargs={'year': shard['year'], 'month': shard['month']})
+        parts.append(f"<sitemap><loc>{escape(location)}</loc><lastmod>{_w3c(shard['lastmod'])}</lastmod></sitemap>\n")
+    parts.append('</sitemapindex>\n')
+    return ''.join(parts)
+
+
+def render_month(year, month, base):
+    start, end = _month_range(year, month)
+    posts = (_published().filter(date_created__gte=start, date_created__lt=end)
+             .order_by('date_created', 'pk').values_list('slug', 'date_updated'))
+    return ''.join(_urlset(
+        (base + reverse('post_detail', kwargs={'slug': slug}), date_updated)
+        for slug, date_updated in posts.iterator(chunk_size=2000)
+    ))
+
+
+def render_pages(base):
+    entries = [(base + reverse(name), None) for name in ('home', 'post_list', 'category_list', 'tag_list')]
+    entries += [(base + reverse('category_posts', kwargs={'category_slug': slug}), None)
+                for slug in Category.objects.filter(post_count__gt=0).order_by('name').values_list('slug', flat=True)]
+    entries += [(base + reverse('tag_posts', kwargs={'tag_slug': slug}), None)
+                for slug in Tag.objects.filter(post_count__gt=0).order_by('name').values_list('slug', flat=True)]
+    return ''.join(_urlset(entries))
+
+
+def write_shard(year, month, base):
+    """Render a month to its file, atomically. Returns the path, or None
+    when the month has no published posts."""
+    content = render_month(year, month, base)
+    if '<url>' not in content:
+        discard_shard(year, month)
+        return None
+    path = shard_path(year, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return path
+
+
+def discard_shard(year, month):
+    try:
+        os.remove(shard_path(year, month))
+    except FileNotFoundError:
+        pass
+
+
+def discard_post_shard(post):
+    if post.date_created is not None:
+        created = timezone.localtime(post.date_created)
+        discard_shard(created.year, created.month)
+
+
+def discard_all_shards():
+    root = sitemap_root()
+    if not os.path.isdir(root):
+        return
+    for name in os.listdir(root):
+        if name.startswith('posts-') and name.endswith('.xml'):
+            os.remove(os.path.join(root, name))
+
+
+def build_closed_shards(base, force=False):
+    """Write the file of every ended month that lacks one (or all of them
+    with ``force``). Returns the number of files written."""
+    written = 0
+    for shard in month_shards():
+        year, month = shard['year'], shard['month']
+        if not is_closed(year, month) or (os.path.exists(shard_path(year, month)) and not force):
+            continue
+        if write_shard(year, month, base):
+            written += 1
+    return written
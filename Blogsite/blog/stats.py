@@ -0,0 +1,90 @@
+import datetime
+
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Post, PostDailyStats
+
+
+# Dashboard numbers. Totals come from the denormalized counters on Post in
+# one conditional-aggregate query; time series come from PostDailyStats,
+# which the view counter, likes and new comments bump as they happen, so
+# reading a series never scans views, likes or comments.
+
+ACTIVITY_FIELDS = ('views', 'likes', 'comments')
+
+
+def record_activity(field, counts, authors=None, day=None):
+    """Add ``counts`` ({post_id: amount}) to ``field`` of each post's row
+    for ``day`` (today by default).
+
+    A post with a row for the day costs one UPDATE. Missing rows are
+    inserted at zero first, so concurrent writers never lose increments.
+    ``authors`` ({post_id: author_id}) saves looking the authors up.
+    """
+    counts = {post_id: amount for post_id, amount in counts.items() if amount}
+    if not counts:
+        return
+    day = day or timezone.localdate()
+    rows = PostDailyStats.objects.filter(date=day)
+
+    if len(counts) == 1:
+        [(post_id, amount)] = counts.items()
+        if rows.filter(post_id=post_id).update(**{field: F(field) + amount}):
+            return
+        missing = {post_id}
+    else:
+        missing = set(counts) - set(rows.filter(post_id__in=counts).values_list('post_id', flat=True))
+
+    if missing:
+        authors = {post_id: authors[post_id] for post_id in missing if post_id in (authors or {})}
+        unknown = missing - set(authors)
+        if unknown:
+            authors.update(Post.objects.filter(pk__in=unknown).values_list('pk', 'author_id'))
+        # Posts deleted in the meantime have no author and get no row
+        PostDailyStats.objects.bulk_create(
+            [PostDailyStats(post_id=post_id, author_id=author_id, date=day) for post_id, author_id in authors.items()],
+            ignore_conflicts=True,
+        )
+
+    # Posts with the same amount share one UPDATE statement
+    by_amount = {}
+    for post_id, amount in counts.items():
+        by_amount.setdefault(amount, []).append(post_id)
+    for amount, post_ids in by_amount.items():
+        rows.filter(post_id__in=post_ids).update(**{field: F(field) + amount})
+
+
+def author_totals(author):
+    """Post counts and engagement totals of ``author`` in one query."""
+    totals = Post.objects.filter(author=author).aggregate(
+        post_count=Count('pk'),
+        published_count=Count('pk', filter=Q(status='published')),
+        draft_count=Count('pk', filter=Q(status='draft')),
+        total_views=Coalesce(Sum('views'), 0),
+        total_likes=Coalesce(Sum('like_count'), 0),
+        total_comments=Coalesce(Sum('comment_count'), 0),
+    )
+    posts = totals['post_count'] or 1
+    for field in ACTIVITY_FIELDS:
+        totals[f'avg_{field}'] = round(totals[f'total_{field}'] / posts, 1)
+    return totals
+
+
+def daily_series(author, days=30, today=None):
+    """``{'labels': [...], 'views': [...], 'likes': [...], 'comments': [...]}``
+    for ``author``'s posts over the last ``days`` days, days without
+    activity included as zeros. One query over the rollup."""
+    today = today or timezone.localdate()
+    start = today - datetime.timedelta(days=days - 1)
+    rows = {
+        row['date']: row
+        for row in PostDailyStats.objects.filter(author=author, date__gte=start, date__lte=today)
+        .values('date').annotate(**{field: Sum(field) for field in ACTIVITY_FIELDS}).order_by()
+    }
+    dates = [start + datetime.timedelta(days=offset) for offset in range(days)]
+    series = {'labels': [day.strftime('%b %d') for day in dates]}
+    for field in ACTIVITY_FIELDS:
+        series[field] = [rows[day][field] if day in rows else 0 for day in dates]
+    return series
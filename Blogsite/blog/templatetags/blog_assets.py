@@ -0,0 +1,26 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+from blog.assets import bundle_built, bundle_path, bundles
+
+
+register = template.Library()
+
+TAGS = {
+    '.css': '<link rel="stylesheet" href="{}">',
+    '.js': '<script src="{}"></script>',
+}
+
+
+@register.simple_tag
+def bundle(name):
+    """Load STATIC_BUNDLES entry ``name``: the hashed bundle once collected,
+    otherwise (and always under DEBUG) its source files one by one."""
+    if not settings.DEBUG and bundle_built(name):
+        urls = [static(bundle_path(name))]
+    else:
+        urls = [static(path) for path in bundles()[name]]
+    tag = TAGS[name[name.rindex('.'):]]
+    return format_html_join('\n', tag, ((url,) for url in urls))
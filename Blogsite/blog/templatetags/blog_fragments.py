@@ -0,0 +1,13 @@
+from django import template
+
+from blog.fragments import render_cards
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts, template_name, **options):
+    """Render ``template_name`` once per post through the card fragment
+    cache, e.g. {% post_cards posts 'blog/cards/post_card.html' show_tags=True %}."""
+    return render_cards(posts, template_name, **options)
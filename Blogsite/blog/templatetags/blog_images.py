@@ -0,0 +1,46 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from blog.images import image_variants, srcset as image_srcset, variant_url as image_variant_url
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, size='card', alt='', sizes=None, **attrs):
+    """Render ``image`` as a <picture> with WebP and fallback srcsets.
+
+    ``size`` picks the variant used for ``src`` and the default ``sizes``;
+    extra keyword arguments become attributes of the <img>.
+    """
+    if not image:
+        return ''
+    attrs.setdefault('loading', 'lazy')
+    manifest = image_variants(image)
+    if manifest is None:
+        return format_html('<img src="{}" alt="{}"{}>', image.url, alt, flatatt(attrs))
+    variant = manifest['variants'].get(size) or max(manifest['variants'].values(), key=lambda entry: entry['width'])
+    if sizes is None:
+        sizes = f"(max-width: {variant['width']}px) 100vw, {variant['width']}px"
+    attrs.setdefault('width', variant['width'])
+    attrs.setdefault('height', variant['height'])
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{}></picture>',
+        image_srcset(image, webp=True), sizes,
+        image.storage.url(variant['path']), image_srcset(image), sizes, alt, flatatt(attrs),
+    )
+
+
+@register.filter
+def srcset(image, image_format=''):
+    """``{{ image|srcset }}`` or ``{{ image|srcset:'webp' }}``."""
+    return image_srcset(image, webp=image_format == 'webp') if image else ''
+
+
+@register.filter
+def variant_url(image, size):
+    """``{{ image|variant_url:'thumb' }}``."""
+    return image_variant_url(image, size) if image else ''
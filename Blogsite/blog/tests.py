@@ -1,14 +1,75 @@
-from django.test import TestCase, Client, RequestFactory
-from django.urls import reverse
+from datetime import timedelta
+import asyncio
+import gzip
+import importlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from types import ModuleType
+from unittest import mock, skipUnless
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib import admin
+
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, include, path, resolve, reverse
+from django.utils import timezone
+from django.utils.http import http_date
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from django.core.files.uploadedfile import SimpleUploadedFile
 
-from .models import Post, Category, Tag, Comment, UserProfile
+from .models import Post, Category, Tag, Comment, UserProfile, Job, PostDailyStats
 from .forms import PostForm, CommentForm
 from .views import PostCreateView, PostUpdateView, PostDetailView
+from .view_counter import CacheStore, MemoryStore, ViewCounter, record_view, view_counter
+from .comment_tree import comment_tree
+from .images import image_variants
+from .benchmark import BENCHMARK_PASSWORD, build_routes, compare_reports, dataset_summary
+from . import benchmark
+from . import fragments
+from .reactions import mark_liked, toggle_like
+from .stats import author_totals, daily_series, record_activity
+from .assets import minify_css, minify_js
+from .rendering import render_post_fields, sanitize
+from .db_router import PIN_COOKIE, PrimaryReplicaRouter, ReplicaPinningMiddleware, health as db_health, use_primary
+from .transfer import Checkpoint, PostImporter, dump_record, export_chunks
+from .jobs import Worker, claim, enqueue, job, queue_depth, requeue_stale, retry_delay, retry_failed
+from .related import load_corpus, np, rebuild_related_posts, refresh_related_posts, related_posts
+from .related import schedule_refresh as schedule_related_refresh
+from . import serializers as blog_serializers
+from .serializers import PostSerializer
+from .query_plan import optimize, plan_for
+from .templatetags.blog_images import responsive_image
+from .pagination import KeysetPaginator
+from .page_cache import INVALIDATED_KEY, anonymous_page_cache, cache_stats, get_cache as get_page_cache, invalidate
+from .counters import rebuild_taxonomy_counts, reconcile_counters
+from .search import DatabaseSearchBackend, get_backend as get_search_backend, search_posts
+from .query_budget import QueryBudgetExceeded, QueryBudgetMiddleware, get_query_budget
+from . import views
+from . import urls as blog_urls
 
 User = get_user_model()
 
+
+def tearDownModule():
+    # Views recorded by the tests must not be flushed by the shutdown hook,
+    # which runs after the test database is gone.
+    view_counter.store.take()
+
+
 class PostModelTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -180,3 +241,2103 @@ class UserProfileTest(TestCase):
         self.assertEqual(str(self.profile), "testuser's Profile")
         self.assertEqual(self.profile.bio, 'Test Bio')
         self.assertEqual(self.profile.website, 'https://example.com')
+
+
+class ViewCounterTest(TransactionTestCase):
+    def setUp(self):
+        # Drop views buffered by other tests before ids get reused
+        view_counter.store.take()
+        # Only explicit flushes write; the interval may have elapsed mid-suite
+        interval = mock.patch.object(view_counter, 'flush_interval', 3600)
+        interval.start()
+        self.addCleanup(interval.stop)
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.post = Post.objects.create(
+            title='Test Post',
+            content='Test Content',
+            author=self.user,
+            status='published'
+        )
+
+    def test_detail_view_does_not_save_post(self):
+        date_updated = self.post.date_updated
+        response = self.client.get(self.post.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 0)
+        self.assertEqual(self.post.date_updated, date_updated)
+        view_counter.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 1)
+
+    def test_concurrent_views_are_not_lost(self):
+        counter = ViewCounter(MemoryStore(), flush_interval=3600, max_pending=10 ** 6)
+        threads_count, views_per_thread = 8, 250
+
+        def hit():
+            for _ in range(views_per_thread):
+                counter.record(self.post.pk)
+
+        threads = [threading.Thread(target=hit) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        # Flush while requests are still arriving
+        flushed = 0
+        while any(thread.is_alive() for thread in threads):
+            flushed += counter.flush()
+        for thread in threads:
+            thread.join()
+        flushed += counter.flush()
+
+        self.post.refresh_from_db()
+        self.assertEqual(flushed, threads_count * views_per_thread)
+        self.assertEqual(self.post.views, threads_count * views_per_thread)
+
+    def test_failed_flush_keeps_pending_views(self):
+        store = MemoryStore()
+        counter = ViewCounter(store, flush_interval=3600)
+        counter.record(self.post.pk)
+        counter.record(self.post.pk)
+        with mock.patch.object(counter, '_write', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                counter.flush()
+        self.assertEqual(counter.flush(), 2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 2)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'blogsite'},
+        'views': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'view-counts'},
+    })
+    def test_cache_store_only_visits_viewed_posts(self):
+        store = CacheStore('views')
+        store.cache.clear()
+        others = [Post.objects.create(title=f'Other {number}', content='Body', author=self.user) for number in range(5)]
+        store.add(self.post.pk)
+        store.add(self.post.pk, 2)
+        store.add(others[0].pk)
+        self.assertEqual(len(store), 2)
+        with self.assertNumQueries(0), mock.patch.object(store, '_take_chunk', wraps=store._take_chunk) as take_chunk:
+            self.assertEqual(store.take(), {self.post.pk: 3, others[0].pk: 1})
+        self.assertEqual(take_chunk.call_args.args[0], sorted([self.post.pk, others[0].pk]))
+        self.assertEqual(len(store), 0)
+        store.add(others[1].pk)
+        self.assertEqual(store.take(), {others[1].pk: 1})
+        self.assertEqual(store.take(), {})
+
+        counter = ViewCounter(store, flush_interval=3600, max_pending=2)
+        counter.record(others[2].pk)
+        self.assertEqual(len(store), 1)
+        # Reaching max_pending asks for a flush after the response
+        counter.record(others[3].pk)
+        self.assertTrue(counter.flush_pending)
+        self.assertEqual(counter.flush_requested(), 2)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(Post.objects.get(pk=others[3].pk).views, 1)
+
+    def test_due_flush_waits_for_the_response(self):
+        view_counter.flush_interval = 0
+
+        def record_and_check(post_id):
+            record_view(post_id)
+            # Nothing is written while the view is still running
+            self.assertTrue(view_counter.flush_pending)
+            self.assertEqual(Post.objects.get(pk=post_id).views, 0)
+
+        with mock.patch('blog.views.record_view', side_effect=record_and_check) as recorded:
+            response = self.client.get(self.post.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        recorded.assert_called_once_with(self.post.pk)
+        self.assertFalse(view_counter.flush_pending)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 1)
+
+    @override_settings(JOB_QUEUE_EAGER=False)
+    def test_shared_store_flushes_on_the_job_queue(self):
+        other = Post.objects.create(title='Other', content='Body', author=self.user, status='published')
+        counter = ViewCounter(CacheStore('default'), flush_interval=3600, max_pending=2)
+        with mock.patch.object(CacheStore, 'shared', True):
+            counter.record(self.post.pk)
+            counter.record(other.pk, 2)
+            counter.record(self.post.pk)
+        job = Job.objects.get(name='blog.view_counter.flush_buffered_views')
+        self.assertEqual((job.dedupe_key, job.status), ('flush-buffered-views', Job.QUEUED))
+        self.assertFalse(counter.flush_pending)
+        self.assertEqual(Post.objects.get(pk=other.pk).views, 0)
+        self.assertEqual(counter.flush(), 4)
+        self.assertEqual(Post.objects.get(pk=other.pk).views, 2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 2)
+
+class CounterTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.post = Post.objects.create(
+            title='Test Post',
+            content='Test Content',
+            author=self.user,
+            status='published'
+        )
+
+    def test_like_counts_follow_m2m_changes(self):
+        self.post.likes.add(self.user, self.other)
+        self.assertEqual(self.post.like_count, 2)
+        self.other.liked_posts.remove(self.post)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.user.liked_posts.clear()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
+        comment = Comment.objects.create(post=self.post, author=self.user, content='Hi')
+        comment.likes.add(self.other)
+        comment.refresh_from_db()
+        self.assertEqual(comment.like_count, 1)
+
+    def test_comment_count_follows_creates_and_deletes(self):
+        parent = Comment.objects.create(post=self.post, author=self.user, content='Parent')
+        Comment.objects.create(post=self.post, author=self.other, content='Reply', parent=parent)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+        # Deleting the parent cascades to the reply
+        parent.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_add_comment_view_updates_counter(self):
+        self.client.login(username='other', password='testpass123')
+        self.client.post(reverse('add_comment', kwargs={'slug': self.post.slug}), {'content': 'Nice'})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_reconcile_repairs_drift(self):
+        self.post.likes.add(self.other)
+        Comment.objects.create(post=self.post, author=self.user, content='Hi')
+        Post.objects.update(like_count=7, comment_count=7)
+        reconcile_counters()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (1, 1))
+
+    def test_taxonomy_counts_track_published_posts(self):
+        python = Category.objects.create(name='Python')
+        web = Category.objects.create(name='Web')
+        django_tag = Tag.objects.create(name='django')
+        draft = Post.objects.create(title='Draft', content='Body', author=self.user, category=python, status='draft')
+        draft.tags.add(django_tag)
+        self.post.category = python
+        self.post.save()
+        self.post.tags.add(django_tag)
+        counts = lambda: (
+            Category.objects.get(pk=python.pk).post_count,
+            Category.objects.get(pk=web.pk).post_count,
+            Tag.objects.get(pk=django_tag.pk).post_count,
+        )
+        self.assertEqual(counts(), (1, 0, 1))
+
+        draft.status = 'published'
+        draft.save()
+        self.assertEqual(counts(), (2, 0, 2))
+        draft.category = web
+        draft.save()
+        self.assertEqual(counts(), (1, 1, 2))
+        draft.tags.clear()
+        self.assertEqual(counts(), (1, 1, 1))
+        django_tag.posts.add(draft)
+        self.assertEqual(counts(), (1, 1, 2))
+        draft.delete()
+        self.assertEqual(counts(), (1, 0, 1))
+
+    def test_rebuild_taxonomy_counts_repairs_drift(self):
+        category = Category.objects.create(name='Python')
+        tag = Tag.objects.create(name='django')
+        self.post.category = category
+        self.post.save()
+        self.post.tags.add(tag)
+        Category.objects.update(post_count=9)
+        Tag.objects.update(post_count=9)
+        rebuild_taxonomy_counts()
+        self.assertEqual(Category.objects.get(pk=category.pk).post_count, 1)
+        self.assertEqual(Tag.objects.get(pk=tag.pk).post_count, 1)
+
+    def test_home_queries_do_not_grow_with_posts(self):
+        for i in range(5):
+            Post.objects.create(title=f'Post {i}', content='Body', author=self.user, status='published')
+        with self.assertNumQueries(4):
+            self.client.get(reverse('home'))
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.category = Category.objects.create(name='Python')
+        self.django_tag = Tag.objects.create(name='django')
+        self.tagged = Post.objects.create(
+            title='Deploying web apps',
+            content='<p>Notes on <strong>deployment</strong> pipelines.</p>',
+            author=self.user,
+            status='published'
+        )
+        self.tagged.tags.add(self.django_tag)
+        self.titled = Post.objects.create(
+            title='Django templates',
+            content='<p>Everything about templates and Django rendering.</p>',
+            author=self.user,
+            category=self.category,
+            status='published'
+        )
+        self.draft = Post.objects.create(
+            title='Django draft',
+            content='Unfinished',
+            author=self.user,
+            status='draft'
+        )
+
+    def test_ranked_prefix_search_with_snippets(self):
+        hits = get_search_backend().search('djan')
+        self.assertEqual([hit.post_id for hit in hits], [self.titled.pk, self.tagged.pk])
+        snippet = get_search_backend().search('rendering')[0].snippet
+        self.assertIn('<mark>rendering</mark>', snippet)
+        self.assertNotIn('<p>', snippet)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.titled.status = 'draft'
+        self.titled.save()
+        self.assertEqual([hit.post_id for hit in get_search_backend().search('templates')], [])
+        self.tagged.tags.remove(self.django_tag)
+        self.assertEqual(get_search_backend().search('django'), [])
+        self.tagged.delete()
+        self.assertEqual(get_search_backend().search('deployment'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM blog_post_fts')
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(get_search_backend().search('django')), 2)
+
+    def test_post_list_uses_search_index(self):
+        response = self.client.get(reverse('post_list'), {'query': 'django'})
+        self.assertEqual(list(response.context['posts']), [self.titled, self.tagged])
+        self.assertEqual(response.context['search_total'], 2)
+
+    def test_category_and_tag_searches_rank_within_the_scope(self):
+        # Better-ranked matches outside the category fill a global top-N
+        for number in range(3):
+            Post.objects.create(title=f'Django Django {number}', content='Django', author=self.user, status='published')
+        scoped = Post.objects.filter(status='published', category=self.category)
+        queryset, hits = search_posts('django', scoped, limit=1)
+        self.assertEqual(list(queryset), [self.titled])
+        self.assertEqual(list(hits), [self.titled.pk])
+        hits = DatabaseSearchBackend().search('django', limit=1, scope=scoped)
+        self.assertEqual([hit.post_id for hit in hits], [self.titled.pk])
+
+        response = self.client.get(reverse('tag_posts', kwargs={'tag_slug': self.django_tag.slug}), {'query': 'django'})
+        self.assertEqual(list(response.context['posts']), [self.tagged])
+        self.assertEqual(response.context['search_total'], 1)
+        response = self.client.get(reverse('category_posts', kwargs={'category_slug': self.category.slug}), {'query': 'deployment'})
+        self.assertEqual(list(response.context['posts']), [])
+        self.assertEqual(response.context['search_total'], 0)
+
+    def test_search_api(self):
+        response = self.client.get(reverse('search_api'), {'q': 'pipelines'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['slug'], self.tagged.slug)
+        self.assertIn('<mark>pipelines</mark>', response.data['results'][0]['snippet'])
+        self.assertEqual(self.client.get(reverse('search_api')).status_code, 400)
+
+
+def seed_dataset(users=10, categories=8, tags=25, posts=60, comments_per_post=6, likes_per_post=5):
+    """Build a dataset big enough for N+1 queries to show up in query counts."""
+    authors = [
+        User.objects.create_user(username=f'user{i}', password='testpass123')
+        for i in range(users)
+    ]
+    for author in authors:
+        UserProfile.objects.create(user=author)
+    category_objs = [Category.objects.create(name=f'Category {i}') for i in range(categories)]
+    tag_objs = [Tag.objects.create(name=f'tag-{i}') for i in range(tags)]
+    post_objs = []
+    for i in range(posts):
+        post = Post.objects.create(
+            title=f'Seeded post {i}',
+            content=f'<p>Body of seeded post {i} with some words to search.</p>',
+            excerpt=f'Excerpt {i}',
+            author=authors[i % users],
+            category=category_objs[i % categories],
+            status='published' if i % 7 else 'draft',
+        )
+        post.tags.add(*[tag_objs[(i + j) % tags] for j in range(3)])
+        post.likes.add(*authors[:likes_per_post])
+        parent = None
+        for j in range(comments_per_post):
+            parent = Comment.objects.create(
+                post=post,
+                author=authors[j % users],
+                content=f'Comment {j}',
+                parent=parent if j % 2 else None,
+            )
+        post_objs.append(post)
+    return authors, category_objs, tag_objs, post_objs
+
+
+def iter_named_routes(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_named_routes(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern
+
+
+class QueryBudgetTest(TestCase):
+    """Every GET route in blog/urls.py must stay within its query budget."""
+
+    # Routes that cannot be measured yet, with the reason. Remove entries as
+    # the underlying problems are fixed.
+    exempt_routes = {
+        'profile': 'profile.html fails to parse',
+        'user_profile': 'profile.html fails to parse',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.categories, cls.tags, cls.posts = seed_dataset()
+        cls.user = cls.users[0]
+        cls.post = next(post for post in cls.posts if post.author == cls.user and post.status == 'published')
+
+    def route_kwargs(self, pattern):
+        values = {
+            'slug': self.post.slug,
+            'category_slug': self.categories[0].slug,
+            'tag_slug': self.tags[0].slug,
+            'username': self.user.username,
+            'pk': Comment.objects.filter(post=self.post).values_list('pk', flat=True).first(),
+            'year': self.post.date_created.year,
+            'month': self.post.date_created.month,
+        }
+        if pattern.name == 'category-detail':
+            values['slug'] = self.categories[0].slug
+        elif pattern.name == 'tag-detail':
+            values['slug'] = self.tags[0].slug
+        return {name: values[name] for name in pattern.pattern.regex.groupindex}
+
+    def assertQueryBudget(self, url, user=None):
+        if user is not None:
+            self.client.force_login(user)
+        view_func = resolve(url).func
+        budget = get_query_budget(view_func)
+        # Start the flush interval over so buffered views are not written
+        # (and counted) during the request
+        view_counter.flush()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 500, url)
+        self.assertIsNotNone(budget, f'{url} has no query budget')
+        self.assertLessEqual(
+            len(queries), budget,
+            f'{url} ran {len(queries)} queries, budget is {budget}'
+        )
+        return len(queries)
+
+    def test_routes_within_budget(self):
+        checked = 0
+        for pattern in iter_named_routes(blog_urls.urlpatterns):
+            if 'format' in pattern.pattern.regex.groupindex or pattern.name in self.exempt_routes:
+                continue
+            url = reverse(pattern.name, kwargs=self.route_kwargs(pattern))
+            for user in (None, self.user):
+                with self.subTest(route=pattern.name, authenticated=user is not None):
+                    self.client.logout()
+                    self.assertQueryBudget(url, user)
+                    checked += 1
+        self.assertGreater(checked, 0)
+
+
+class QueryBudgetMiddlewareTest(TestCase):
+    def setUp(self):
+        Category.objects.create(name='Test Category')
+
+    def test_violation_is_logged(self):
+        with mock.patch.object(views.category_list, 'query_budget', 0):
+            with self.settings(QUERY_BUDGET_RAISE=False):
+                with self.assertLogs('blog.query_budget', 'WARNING') as logs:
+                    response = self.client.get(reverse('category_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('budget is 0', logs.output[0])
+
+    def test_violation_raises_when_enabled(self):
+        with mock.patch.object(views.category_list, 'query_budget', 0):
+            with self.settings(QUERY_BUDGET_RAISE=True):
+                with self.assertRaises(QueryBudgetExceeded):
+                    self.client.get(reverse('category_list'))
+
+    def test_debug_headers(self):
+        with self.settings(DEBUG=True, QUERY_BUDGET_RAISE=False):
+            response = self.client.get(reverse('category_list'))
+        self.assertEqual(response['X-Query-Count'], '1')
+
+    def test_overlapping_requests_count_only_their_own_queries(self):
+        # Two requests sharing one thread's connections, as concurrent ASGI
+        # requests do: the outer one's recorder is still installed while
+        # the inner one runs.
+        def inner_view(request):
+            list(Category.objects.all())
+            return HttpResponse()
+
+        def outer_view(request):
+            list(Category.objects.all())
+            inner_response = inner(RequestFactory().get('/inner/'))
+            self.assertEqual(inner_response['X-Query-Count'], '1')
+            list(Category.objects.all())
+            return HttpResponse()
+
+        inner = QueryBudgetMiddleware(inner_view)
+        outer = QueryBudgetMiddleware(outer_view)
+        wrappers = list(connection.execute_wrappers)
+        with self.settings(DEBUG=True, QUERY_BUDGET_RAISE=False):
+            response = outer(RequestFactory().get('/outer/'))
+        self.assertEqual(response['X-Query-Count'], '2')
+        self.assertEqual(connection.execute_wrappers, wrappers)
+
+
+class CommentTreeTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.post = Post.objects.create(title='Test Post', content='Body', author=self.user, status='published')
+        self.first = Comment.objects.create(post=self.post, author=self.user, content='First')
+        self.reply = Comment.objects.create(post=self.post, author=self.user, content='Reply', parent=self.first)
+        self.nested = Comment.objects.create(post=self.post, author=self.user, content='Nested', parent=self.reply)
+        self.second = Comment.objects.create(post=self.post, author=self.user, content='Second')
+
+    def test_paths_follow_parents(self):
+        self.nested.refresh_from_db()
+        self.assertEqual(self.nested.depth, 2)
+        self.assertEqual(
+            self.nested.path,
+            '.'.join(str(pk).zfill(10) for pk in (self.first.pk, self.reply.pk, self.nested.pk))
+        )
+
+    def test_tree_loads_in_one_query(self):
+        with self.assertNumQueries(1):
+            roots = comment_tree(self.post)
+            self.assertEqual(roots, [self.second, self.first])
+            self.assertEqual(roots[1].children, [self.reply])
+            self.assertEqual(roots[1].children[0].children, [self.nested])
+
+    def test_depth_limit_and_reply_cap(self):
+        Comment.objects.create(post=self.post, author=self.user, content='Reply 2', parent=self.first)
+        roots = comment_tree(self.post, max_depth=1, max_replies=1)
+        first = roots[1]
+        self.assertEqual(first.children, [self.reply])
+        self.assertEqual(first.hidden_replies, 1)
+        self.assertEqual(first.children[0].children, [])
+        self.assertEqual(first.children[0].hidden_replies, 1)
+
+    def test_comments_below_the_depth_limit_are_counted(self):
+        parent = self.second
+        chain = [parent]
+        for number in range(7):
+            parent = Comment.objects.create(post=self.post, author=self.user, content=f'Level {number + 1}', parent=parent)
+            chain.append(parent)
+        with self.settings(COMMENT_TREE_MAX_DEPTH=5):
+            shown = comment_tree(self.post)[0]
+            for _ in range(5):
+                self.assertFalse(shown.at_depth_limit)
+                self.assertEqual(shown.hidden_replies, 0)
+                shown = shown.children[0]
+            self.assertEqual(shown, chain[5])
+            self.assertTrue(shown.at_depth_limit)
+            self.assertEqual((shown.children, shown.hidden_replies), ([], 2))
+
+            self.client.login(username='testuser', password='testpass123')
+            response = self.client.get(self.post.get_absolute_url())
+        self.assertContains(response, f'data-comment-id="{chain[4].pk}"')
+        self.assertNotContains(response, f'data-comment-id="{chain[5].pk}"')
+        self.assertNotContains(response, f'id="comment-{chain[6].pk}"')
+        self.assertContains(response, '2 more replies')
+
+    def test_serializer_does_not_query_per_comment(self):
+        # One query each for the tags, the whole comment thread and the
+        # related posts
+        with self.assertNumQueries(3):
+            data = PostSerializer(self.post).data
+        self.assertEqual(data['comments'][1]['replies'][0]['replies'][0]['content'], 'Nested')
+
+    def test_post_detail_renders_thread(self):
+        response = self.client.get(self.post.get_absolute_url())
+        self.assertContains(response, 'Nested')
+        self.assertContains(response, f'id="comment-{self.nested.pk}"')
+
+
+class RelatedPostsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        python = Category.objects.create(name='Python')
+        cooking = Category.objects.create(name='Cooking')
+        django_tag = Tag.objects.create(name='django')
+        baking = Tag.objects.create(name='baking')
+
+        def create(title, excerpt, category, tags):
+            post = Post.objects.create(title=title, content='Body', excerpt=excerpt,
+                                       category=category, author=self.user, status='published')
+            post.tags.set(tags)
+            return post
+
+        self.views = create('Django views explained', 'Class based views and mixins', python, [django_tag])
+        self.forms = create('Django forms explained', 'Validation in forms and views', python, [django_tag])
+        self.orm = create('Python ORM tricks', 'Querysets in depth', python, [])
+        self.bread = create('Sourdough bread', 'Baking bread at home', cooking, [baking])
+        rebuild_related_posts(limit=2, use_numpy=False)
+
+    def test_rebuild_ranks_most_similar_first(self):
+        self.assertEqual(list(related_posts(self.views)), [self.forms, self.orm])
+        self.assertEqual(list(related_posts(self.bread)), [])
+
+    @skipUnless(np is not None, 'NumPy is not installed')
+    def test_numpy_and_python_scores_agree(self):
+        fast = dict(load_corpus(use_numpy=True).top_related())
+        slow = dict(load_corpus(use_numpy=False).top_related())
+        self.assertEqual(fast.keys(), slow.keys())
+        for post_id, items in slow.items():
+            self.assertEqual([pk for pk, _ in fast[post_id]], [pk for pk, _ in items])
+            for (_, fast_score), (_, slow_score) in zip(fast[post_id], items):
+                self.assertAlmostEqual(fast_score, slow_score, places=5)
+
+    def test_refresh_updates_affected_posts_only(self):
+        models_post = Post.objects.create(title='Django models explained', excerpt='Fields and views',
+                                          content='Body', category=self.views.category,
+                                          author=self.user, status='published')
+        models_post.tags.add(*self.views.tags.all())
+        affected = refresh_related_posts([models_post.pk], limit=2, use_numpy=False)
+        self.assertIn(self.views.pk, affected)
+        self.assertNotIn(self.bread.pk, affected)
+        self.assertIn(models_post, related_posts(self.views))
+        self.assertEqual(len(related_posts(models_post)), 2)
+
+        models_post.status = 'draft'
+        models_post.save()
+        refresh_related_posts([models_post.pk], limit=2, use_numpy=False)
+        self.assertEqual(list(related_posts(self.views)), [self.forms, self.orm])
+        self.assertEqual(list(related_posts(models_post)), [])
+
+    def test_refresh_only_loads_the_neighbourhood(self):
+        with mock.patch('blog.related.load_corpus', wraps=load_corpus) as loader:
+            refresh_related_posts([self.orm.pk], limit=2, use_numpy=False)
+        sample = loader.call_args.args[0]
+        self.assertLessEqual({self.orm.pk, self.views.pk, self.forms.pk}, sample)
+        self.assertNotIn(self.bread.pk, sample)
+        self.assertEqual(list(related_posts(self.views)), [self.forms, self.orm])
+
+    def test_scheduled_ids_stay_with_their_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            schedule_related_refresh(self.views.pk)
+        with self.captureOnCommitCallbacks() as other_callbacks:
+            schedule_related_refresh(self.bread.pk)
+        with mock.patch('blog.related.enqueue') as enqueue_job:
+            other_callbacks[0]()
+            callbacks[0]()
+        self.assertEqual([call.args[1] for call in enqueue_job.call_args_list],
+                         [[[self.bread.pk]], [[self.views.pk]]])
+
+    def test_post_changes_schedule_a_refresh(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cake = Post.objects.create(title='Sourdough cake', excerpt='Baking with starter',
+                                       content='Body', category=self.bread.category,
+                                       author=self.user, status='published')
+        self.assertEqual(list(related_posts(self.bread)), [cake])
+
+    def test_detail_and_api_read_related_posts(self):
+        with self.assertNumQueries(1):
+            related = list(related_posts(self.views, limit=3))
+            self.assertEqual(related[0].category.name, 'Python')
+        response = self.client.get(reverse('post_detail', kwargs={'slug': self.views.slug}))
+        self.assertEqual(list(response.context['related_posts']), [self.forms, self.orm])
+        response = self.client.get(reverse('post_detail_api', kwargs={'slug': self.views.slug}))
+        self.assertEqual([item['id'] for item in response.json()['related_posts']],
+                         [self.forms.pk, self.orm.pk])
+
+
+def make_image(width, height, image_format='JPEG'):
+    from PIL import Image
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), 'teal').save(buffer, image_format)
+    extension = 'jpg' if image_format == 'JPEG' else image_format.lower()
+    return SimpleUploadedFile(f'photo.{extension}', buffer.getvalue(), content_type=f'image/{extension}')
+
+
+@override_settings(IMAGE_PIPELINE_WORKERS=0, IMAGE_VARIANTS={'thumb': 100, 'card': 300, 'hero': 900})
+class ImagePipelineTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        # Manifests are cached by file name, which repeats across tests
+        get_page_cache().clear()
+
+    def create_post(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(title='Photo', content='Body', author=self.user,
+                                       status='published', featured_image=image)
+
+    def test_upload_generates_bounded_variants_and_manifest(self):
+        post = self.create_post(make_image(600, 400))
+        manifest = image_variants(post.featured_image)
+        widths = {label: entry['width'] for label, entry in manifest['variants'].items()}
+        # Narrow originals are not upscaled; hero reuses the 600px copy
+        self.assertEqual(widths, {'thumb': 100, 'card': 300, 'hero': 600})
+        self.assertEqual(manifest['variants']['card']['height'], 200)
+        storage = post.featured_image.storage
+        for entry in manifest['variants'].values():
+            self.assertTrue(storage.exists(entry['path']))
+            self.assertTrue(entry['webp'].endswith('.webp'))
+            self.assertTrue(storage.exists(entry['webp']))
+        self.assertTrue(storage.exists(post.featured_image.name.rsplit('.', 1)[0] + '.variants.json'))
+
+    def test_templates_and_api_get_srcsets(self):
+        post = self.create_post(make_image(1000, 500, 'PNG'))
+        html = responsive_image(post.featured_image, 'card', alt='Photo')
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('__300w.png 300w, ', html)
+        self.assertIn('__900w.webp 900w', html)
+        self.assertIn('width="300"', html)
+        response = self.client.get(reverse('post_detail_api', kwargs={'slug': post.slug}))
+        variants = response.json()['featured_image_variants']
+        self.assertTrue(variants['variants']['thumb']['url'].startswith('http://testserver/'))
+        self.assertIn('100w', variants['webp_srcset'])
+
+    def test_backfill_command_processes_existing_images(self):
+        post = Post.objects.create(title='Old', content='Body', author=self.user,
+                                   status='published', featured_image=make_image(200, 200))
+        self.assertIsNone(image_variants(post.featured_image))
+        out = StringIO()
+        call_command('generate_image_variants', stdout=out)
+        self.assertIn('Generated variants for 1 of 1 images', out.getvalue())
+        self.assertIsNotNone(image_variants(post.featured_image))
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.posts = [
+            Post.objects.create(title=f'Post {i}', content='Body', author=self.user, status='published')
+            for i in range(7)
+        ]
+        # Several posts share a timestamp so the id tie-breaker matters
+        Post.objects.filter(pk__in=[post.pk for post in self.posts[2:5]]).update(
+            date_created=self.posts[2].date_created
+        )
+
+    def walk(self, queryset, per_page):
+        paginator = KeysetPaginator(queryset, per_page)
+        page = paginator.page()
+        pages = [list(page)]
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            pages.append(list(page))
+        return paginator, page, pages
+
+    def test_pages_cover_every_post_once_in_order(self):
+        queryset = Post.objects.all()
+        _, _, pages = self.walk(queryset, 3)
+        seen = [post for page in pages for post in page]
+        self.assertEqual(seen, list(queryset.order_by('-date_created', '-id')))
+
+    def test_previous_cursor_returns_same_page(self):
+        paginator, last_page, pages = self.walk(Post.objects.all(), 3)
+        previous = paginator.page(last_page.previous_cursor)
+        self.assertEqual(list(previous), pages[-2])
+
+    def test_cursor_is_stable_when_posts_are_inserted(self):
+        paginator = KeysetPaginator(Post.objects.all(), 3)
+        first = paginator.page()
+        expected = list(paginator.page(first.next_cursor))
+        Post.objects.create(title='Brand new', content='Body', author=self.user, status='published')
+        self.assertEqual(list(paginator.page(first.next_cursor)), expected)
+
+    def test_post_list_pages_without_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('post_list'))
+        self.assertFalse(any('COUNT(*)' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(len(response.context['posts']), 7)
+        self.assertEqual(self.client.get(reverse('post_list'), {'cursor': 'garbage'}).status_code, 404)
+
+    def test_api_list_uses_cursors(self):
+        response = self.client.get(reverse('post_list_api'), {'page_size': 4})
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertNotIn('count', response.data)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+
+
+class PageCacheTest(TestCase):
+    def setUp(self):
+        get_page_cache().clear()
+        view_counter.store.take()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.post = Post.objects.create(title='Cached Post', content='Body', author=self.user, status='published')
+
+    def test_anonymous_pages_are_cached(self):
+        first = self.client.get(reverse('home'))
+        self.assertEqual(first['X-Page-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('home'))
+        self.assertEqual(second['X-Page-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(self.client.get(reverse('home'), {'q': 1})['X-Page-Cache'], 'MISS')
+        self.assertEqual(cache_stats()['hits'], 1)
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.client.get(reverse('home'))
+        self.client.login(username='testuser', password='testpass123')
+        self.assertNotIn('X-Page-Cache', self.client.get(reverse('home')))
+
+    def test_writes_invalidate_dependent_pages_only(self):
+        other = Post.objects.create(title='Other Post', content='Body', author=self.user, status='published')
+        self.client.get(self.post.get_absolute_url())
+        self.client.get(other.get_absolute_url())
+        self.client.get(reverse('post_list'))
+
+        Comment.objects.create(post=self.post, author=self.user, content='New comment')
+        self.assertEqual(self.client.get(self.post.get_absolute_url())['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get(other.get_absolute_url())['X-Page-Cache'], 'HIT')
+        self.assertEqual(self.client.get(reverse('post_list'))['X-Page-Cache'], 'MISS')
+
+        self.post.title = 'Renamed Post'
+        self.post.save()
+        self.assertContains(self.client.get(reverse('post_list')), 'Renamed Post')
+
+    def test_cached_detail_hits_still_count_views(self):
+        self.client.get(self.post.get_absolute_url())
+        self.assertEqual(self.client.get(self.post.get_absolute_url())['X-Page-Cache'], 'HIT')
+        view_counter.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 2)
+
+    def test_cached_detail_pages_hold_no_csrf_token(self):
+        self.client.get(self.post.get_absolute_url())
+        cached = self.client.get(self.post.get_absolute_url())
+        self.assertEqual(cached['X-Page-Cache'], 'HIT')
+        self.assertNotContains(cached, 'name="csrfmiddlewaretoken"')
+        # The like form from the cached copy leads a visitor to log in
+        form = re.search(r'<form method="(\w+)" action="([^"]+)" class="like-form">\s*'
+                         r'<input type="hidden" name="next" value="([^"]+)">', cached.content.decode())
+        method, action, next_url = form.groups()
+        self.assertEqual((method, action), ('get', reverse('login')))
+        client = Client(enforce_csrf_checks=True)
+        self.assertEqual(next_url, self.post.get_absolute_url())
+        self.assertEqual(client.get(action, {'next': next_url}).status_code, 200)
+
+    def test_pages_that_render_a_csrf_token_are_not_cached(self):
+        @anonymous_page_cache('posts')
+        def view(request):
+            return HttpResponse(get_token(request))
+
+        request = RequestFactory().get('/csrf-page/')
+        request.user = AnonymousUser()
+        self.assertEqual(view(request)['X-Page-Cache'], 'MISS')
+        request = RequestFactory().get('/csrf-page/')
+        request.user = AnonymousUser()
+        self.assertEqual(view(request)['X-Page-Cache'], 'MISS')
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        get_page_cache().clear()
+        view_counter.store.take()
+        # Only explicit flushes write; the interval may have elapsed mid-suite
+        interval = mock.patch.object(view_counter, 'flush_interval', 3600)
+        interval.start()
+        self.addCleanup(interval.stop)
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.category = Category.objects.create(name='Python')
+        self.post = Post.objects.create(title='Fresh Post', content='Body', author=self.user,
+                                        category=self.category, status='published')
+
+    def test_post_page_revalidates_without_rendering(self):
+        url = self.post.get_absolute_url()
+        first = self.client.get(url)
+        self.assertFalse(first.has_header('Last-Modified'))
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        # The validator query never reads the post body
+        self.assertNotIn('"blog_post"."content', queries[0]['sql'])
+        # The revalidated hit still counts as a view
+        self.assertEqual(view_counter.store.take(), {self.post.pk: 2})
+
+        Comment.objects.create(post=self.post, author=self.user, content='New comment')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_likes_and_deleted_comments_after_the_first_get_are_seen(self):
+        # If-Modified-Since alone cannot see either write, so it never gets a 304
+        since = http_date(time.time() + 3600)
+        for url in (self.post.get_absolute_url(), reverse('post_detail_api', kwargs={'slug': self.post.slug}),
+                    reverse('post-detail', kwargs={'slug': self.post.slug})):
+            with self.subTest(url=url):
+                comment = Comment.objects.create(post=self.post, author=self.user, content='Soon gone')
+                first = self.client.get(url)
+                self.assertFalse(first.has_header('Last-Modified'))
+                toggle_like(Post.objects.get(pk=self.post.pk), self.user)
+                self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+                etag = self.client.get(url)['ETag']
+                comment.delete()
+                self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_api_etags_change_with_counters_and_collections(self):
+        detail = reverse('post-detail', kwargs={'slug': self.post.slug})
+        etag = self.client.get(detail)['ETag']
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.post.likes.add(self.user)
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        for url in (reverse('post-list'), reverse('post_list_api'), reverse('category-list')):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Category.objects.create(name='Web')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        category = reverse('category-detail', kwargs={'slug': self.category.slug})
+        etag = self.client.get(category)['ETag']
+        Post.objects.create(title='Second', content='Body', author=self.user,
+                            category=self.category, status='published')
+        self.assertEqual(self.client.get(category, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+def async_urlconf():
+    """The site's URLconf with BLOG_ASYNC_VIEWS on."""
+    with override_settings(BLOG_ASYNC_VIEWS=True):
+        patterns = importlib.reload(blog_urls).urlpatterns
+    importlib.reload(blog_urls)
+    urlconf = ModuleType('async_urls')
+    urlconf.urlpatterns = [path('admin/', admin.site.urls), path('', include(patterns))]
+    return urlconf
+
+
+class AsyncViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        cls.category = Category.objects.create(name='Python')
+        cls.tag = Tag.objects.create(name='django')
+        cls.post = Post.objects.create(title='Async Post', content='Body', author=cls.user,
+                                       category=cls.category, status='published')
+        cls.post.tags.add(cls.tag)
+        Comment.objects.create(post=cls.post, author=cls.user, content='Async comment')
+
+    def setUp(self):
+        get_page_cache().clear()
+        view_counter.store.take()
+        interval = mock.patch.object(view_counter, 'flush_interval', 3600)
+        interval.start()
+        self.addCleanup(interval.stop)
+        self.sync_pages = {}
+        self.urls = [
+            reverse('home'), reverse('post_list'), self.post.get_absolute_url(),
+            reverse('category_posts', kwargs={'category_slug': self.category.slug}),
+            reverse('tag_posts', kwargs={'tag_slug': self.tag.slug}),
+            reverse('category_list'), reverse('tag_list'),
+            reverse('post_list_api'), reverse('search_api') + '?q=async',
+        ]
+        for url in self.urls:
+            self.sync_pages[url] = self.client.get(url)
+        get_page_cache().clear()
+        view_counter.store.take()
+        urlconf = override_settings(ROOT_URLCONF=async_urlconf())
+        urlconf.enable()
+        self.addCleanup(urlconf.disable)
+
+    def test_routes_use_async_views(self):
+        self.assertTrue(iscoroutinefunction(resolve(reverse('home')).func))
+        self.assertFalse(iscoroutinefunction(resolve(reverse('create_post')).func))
+
+    async def test_async_pages_match_sync_pages(self):
+        for url in self.urls:
+            response = await self.async_client.get(url)
+            sync_response = self.sync_pages[url]
+            self.assertEqual(response.status_code, sync_response.status_code, url)
+            if response['Content-Type'] == 'application/json':
+                self.assertEqual(response.json(), sync_response.json(), url)
+            else:
+                self.assertEqual(b'Async Post' in response.content, b'Async Post' in sync_response.content, url)
+
+    async def test_post_detail_counts_views_and_revalidates(self):
+        response = await self.async_client.get(self.post.get_absolute_url())
+        self.assertContains(response, 'Async comment')
+        again = await self.async_client.get(self.post.get_absolute_url(), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(view_counter.store.take(), {self.post.pk: 2})
+        missing = await self.async_client.get(reverse('post_detail', kwargs={'slug': 'missing'}))
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_query_budget_counts_async_queries(self):
+        with self.settings(DEBUG=True, QUERY_BUDGET_RAISE=False):
+            response = await self.async_client.get(reverse('home'))
+        self.assertEqual(response['X-Query-Count'], '4')
+
+    async def test_concurrent_requests_have_separate_query_counts(self):
+        with self.settings(DEBUG=True, QUERY_BUDGET_RAISE=False):
+            responses = await asyncio.gather(*[self.async_client.get(reverse('home')) for _ in range(4)])
+        self.assertEqual([response['X-Query-Count'] for response in responses], ['4'] * 4)
+
+
+JOB_CALLS = []
+
+
+@job(max_attempts=2)
+def record_job(value):
+    JOB_CALLS.append(value)
+
+
+@job(max_attempts=2)
+def broken_job():
+    raise ValueError('boom')
+
+
+@override_settings(JOB_QUEUE_EAGER=False, JOB_RETRY_BACKOFF=10)
+class JobQueueTest(TransactionTestCase):
+    def setUp(self):
+        JOB_CALLS.clear()
+
+    def test_dedupe_key_keeps_one_waiting_job(self):
+        first = enqueue(record_job, ['a'], dedupe_key='record', delay=timedelta(minutes=5))
+        second = enqueue(record_job, ['a'], dedupe_key='record', priority=5)
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(second.priority, 5)
+        self.assertLessEqual(second.run_at, timezone.now())
+        self.assertEqual(second.name, 'blog.tests.record_job')
+        # A running job may have one waiting successor
+        claim('worker-1')
+        self.assertNotEqual(enqueue(record_job, ['a'], dedupe_key='record').pk, first.pk)
+
+    def test_claim_takes_due_jobs_by_priority_once(self):
+        low = enqueue(record_job, ['low'])
+        high = enqueue(record_job, ['high'], priority=10)
+        enqueue(record_job, ['later'], delay=timedelta(hours=1))
+        self.assertEqual(claim('worker-1', limit=5), [high, low])
+        self.assertEqual(claim('worker-2', limit=5), [])
+        high.refresh_from_db()
+        self.assertEqual((high.status, high.locked_by, high.attempts), (Job.RUNNING, 'worker-1', 1))
+
+    def test_worker_runs_jobs_and_retries_failures_with_backoff(self):
+        enqueue(record_job, ['ok'])
+        failing = enqueue(broken_job)
+        worker = Worker(concurrency=2, poll_interval=0.01)
+        with self.assertLogs('blog.jobs', 'WARNING'):
+            self.assertEqual(worker.run(burst=True), 2)
+        self.assertEqual(JOB_CALLS, ['ok'])
+        self.assertEqual(list(Job.objects.all()), [failing])
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), (Job.QUEUED, 1))
+        self.assertIn('ValueError: boom', failing.last_error)
+        self.assertGreater(failing.run_at, timezone.now() + timedelta(seconds=5))
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('blog.jobs', 'ERROR'):
+            Worker(poll_interval=0.01).run(burst=True)
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), (Job.FAILED, 2))
+        self.assertEqual(retry_failed(Job.objects.all()), 1)
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), (Job.QUEUED, 0))
+
+    def test_retry_delay_doubles_up_to_the_ceiling(self):
+        with self.settings(JOB_RETRY_BACKOFF=5, JOB_RETRY_MAX_DELAY=30):
+            self.assertEqual([retry_delay(n).total_seconds() for n in (1, 2, 3, 4)], [5, 10, 20, 30])
+
+    def test_stale_running_jobs_are_retried(self):
+        enqueue(record_job, ['lost'])
+        claimed, = claim('crashed-worker')
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale(timeout=600), 1)
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.status, Job.QUEUED)
+        self.assertIn('crashed-worker', claimed.last_error)
+
+    def test_post_changes_queue_jobs_instead_of_running_them(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        post = Post.objects.create(title='Queued', content='Body', author=user, status='published')
+        job_row = Job.objects.get()
+        self.assertEqual(job_row.name, 'blog.related.refresh_related_posts')
+        self.assertIn(post.pk, job_row.args[0])
+        self.assertEqual(job_row.priority, -1)
+        out = StringIO()
+        call_command('run_jobs', '--burst', stdout=out)
+        self.assertIn('Processed 1 jobs (0 failed)', out.getvalue())
+        self.assertFalse(Job.objects.exists())
+
+    def test_related_refresh_jobs_are_deduplicated(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        post = Post.objects.create(title='Queued', content='Body', author=user, status='published')
+        post.title = 'Queued again'
+        post.save()
+        self.assertEqual(Job.objects.filter(name='blog.related.refresh_related_posts').count(), 1)
+
+    def test_admin_shows_queue_depth(self):
+        User.objects.create_superuser(username='admin', password='adminpass123', email='admin@example.com')
+        enqueue(record_job, ['a'])
+        enqueue(record_job, ['b'], delay=timedelta(hours=1))
+        self.assertEqual(
+            [(row['name'], row['due'], row['scheduled'], row['failed']) for row in queue_depth()],
+            [('blog.tests.record_job', 1, 1, 0)],
+        )
+        self.client.login(username='admin', password='adminpass123')
+        response = self.client.get(reverse('admin:blog_job_changelist'))
+        self.assertContains(response, 'Queue depth')
+        self.assertContains(response, '<td>blog.tests.record_job</td>', html=True)
+
+
+class PostFormTagsTest(TestCase):
+    def test_tags_are_upserted_in_two_queries(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        existing = Tag.objects.create(name='Django')
+        post = Post.objects.create(title='Tags', content='Body', author=user, status='published')
+        with self.assertNumQueries(2):
+            tags = PostForm.upsert_tags(['Django', 'django', 'New Tag', 'Another'])
+        self.assertEqual(tags[:2], [existing, existing])
+        self.assertEqual([tag.slug for tag in tags[2:]], ['new-tag', 'another'])
+
+        form = PostForm(instance=post, data={
+            'title': 'Tags', 'excerpt': '', 'content': 'Body', 'status': 'published',
+            'tags_input': 'Django, New Tag, Django',
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(sorted(post.tags.values_list('name', flat=True)), ['Django', 'New Tag'])
+        self.assertEqual(Tag.objects.get(name='New Tag').post_count, 1)
+
+    def test_upserted_tags_reach_cached_pages_and_api(self):
+        get_page_cache().clear()
+        Tag.objects.create(name='Django')
+        for url in (reverse('tag_list'), reverse('tag-list')):
+            self.assertNotContains(self.client.get(url), 'Fresh Tag')
+        PostForm.upsert_tags(['Django', 'Fresh Tag'])
+        self.assertContains(self.client.get(reverse('tag_list')), 'Fresh Tag')
+        self.assertEqual([tag['name'] for tag in self.client.get(reverse('tag-list')).json()['results']],
+                         ['Django', 'Fresh Tag'])
+
+
+class TransferTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.author = User.objects.create_user(username='writer', email='writer@example.com', password='x')
+        reader = User.objects.create_user(username='reader', password='x')
+        category = Category.objects.create(name='Python', description='Snakes')
+        tags = [Tag.objects.create(name='django'), Tag.objects.create(name='Async IO')]
+        self.posts = []
+        for number in range(3):
+            post = Post.objects.create(title=f'Transfer {number}', content=f'Body {number} kangaroo',
+                                       author=self.author, category=category, status='published')
+            post.tags.set(tags[:number])
+            self.posts.append(post)
+        root = Comment.objects.create(post=self.posts[2], author=reader, content='Root')
+        reply = Comment.objects.create(post=self.posts[2], author=self.author, content='Reply', parent=root)
+        Comment.objects.create(post=self.posts[2], author=reader, content='Nested', parent=reply)
+        self.backdated = timezone.now() - timedelta(days=30)
+        Post.objects.filter(pk=self.posts[0].pk).update(date_created=self.backdated)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def export(self, *args):
+        call_command('export_posts', self.path('posts.jsonl.gz'), *args, stdout=StringIO())
+        with gzip.open(self.path('posts.jsonl.gz'), 'rt', encoding='utf-8') as handle:
+            return [json.loads(line) for line in handle]
+
+    def test_export_streams_posts_with_relations(self):
+        with self.assertNumQueries(3 * 1 + 1):
+            records = [record for chunk in export_chunks(chunk_size=5) for record in chunk]
+        self.assertEqual([record['slug'] for record in records], [post.slug for post in self.posts])
+        self.assertEqual(self.export('--chunk-size', '2'), [json.loads(dump_record(record)) for record in records])
+        last = records[2]
+        self.assertEqual(last['author'], {'username': 'writer', 'email': 'writer@example.com'})
+        self.assertEqual(last['category']['description'], 'Snakes')
+        self.assertEqual([tag['slug'] for tag in last['tags']], ['async-io', 'django'])
+        self.assertEqual([comment['content'] for comment in last['comments']], ['Root', 'Reply', 'Nested'])
+        self.assertEqual(last['comments'][1]['parent'], last['comments'][0]['id'])
+
+    def test_import_recreates_posts_tags_and_threads(self):
+        records = self.export()
+        Post.objects.all().delete()
+        Tag.objects.all().delete()
+        Category.objects.all().delete()
+        User.objects.exclude(username='writer').delete()
+
+        out = StringIO()
+        call_command('import_posts', self.path('posts.jsonl.gz'), '--chunk-size', '2', stdout=out)
+        self.assertIn('Created 3 posts, updated 0 posts and imported 3 comments', out.getvalue())
+        imported = Post.objects.get(slug=records[2]['slug'])
+        self.assertEqual(imported.author, self.author)
+        self.assertEqual(imported.comment_count, 3)
+        self.assertEqual(sorted(imported.tags.values_list('name', flat=True)), ['Async IO', 'django'])
+        self.assertEqual(Tag.objects.get(slug='django').post_count, 2)
+        self.assertEqual(Category.objects.get().post_count, 3)
+        thread = list(imported.comments.order_by('path'))
+        self.assertEqual([(comment.content, comment.depth) for comment in thread],
+                         [('Root', 0), ('Reply', 1), ('Nested', 2)])
+        self.assertEqual(thread[2].path, f'{thread[1].path}.{str(thread[2].pk).zfill(10)}')
+        self.assertEqual(thread[2].author.username, 'reader')
+        self.assertFalse(thread[0].author.has_usable_password())
+        self.assertEqual(Post.objects.get(slug=records[0]['slug']).date_created, self.backdated)
+        self.assertEqual([hit.post_id for hit in get_search_backend().search('kangaroo')].count(imported.pk), 1)
+
+    def test_chunk_queries_do_not_grow_with_posts(self):
+        template = next(export_chunks())[2]
+        counts = []
+        for size in (2, 20):
+            records = [{**template, 'slug': f'copy-{size}-{number}'} for number in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                PostImporter().import_chunk(records)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_import_resumes_from_checkpoint_and_updates_by_slug(self):
+        self.export()
+        checkpoint = self.path('import.checkpoint')
+        Checkpoint(checkpoint).save(2)
+        Post.objects.filter(pk=self.posts[2].pk).update(title='Changed')
+        out = StringIO()
+        call_command('import_posts', self.path('posts.jsonl.gz'), '--checkpoint', checkpoint, stdout=out)
+        self.assertIn('Resuming after line 2', out.getvalue())
+        self.assertIn('Created 0 posts, updated 1 posts and imported 3 comments', out.getvalue())
+        self.assertEqual(Post.objects.count(), 3)
+        self.assertEqual(Post.objects.get(pk=self.posts[2].pk).title, 'Transfer 2')
+        self.assertEqual(Comment.objects.count(), 3)
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_reimport_keeps_comment_counts(self):
+        records = [record for chunk in export_chunks() for record in chunk]
+        PostImporter().import_chunk(records)
+        post = Post.objects.get(pk=self.posts[2].pk)
+        self.assertEqual(post.comment_count, 3)
+        self.assertEqual(post.comments.count(), 3)
+
+
+class BenchmarkTest(TransactionTestCase):
+    # Driver threads use connections of their own, so the data must be committed
+
+    def setUp(self):
+        benchmark.seed_dataset(users=3, posts=6, tags=4, categories=2, comments_per_post=3, likes_per_post=2, chunk_size=4)
+
+    def test_seeding_is_bulk_and_reproducible(self):
+        summary = dataset_summary()
+        self.assertEqual(summary['posts'], 6)
+        self.assertEqual(summary['comments'], 18)
+        self.assertEqual(summary['likes'], 12)
+        post = Post.objects.get(slug='benchmark-post-0')
+        self.assertEqual(post.like_count, 2)
+        self.assertEqual(post.comment_count, 3)
+        self.assertTrue(post.author.check_password(BENCHMARK_PASSWORD))
+        titles = list(Post.objects.order_by('slug').values_list('title', flat=True))
+
+        benchmark.seed_dataset(users=3, posts=6, tags=4, categories=2, comments_per_post=3, likes_per_post=2)
+        self.assertEqual(dataset_summary(), summary)
+        self.assertEqual(list(Post.objects.order_by('slug').values_list('title', flat=True)), titles)
+
+    def test_route_plans_cover_named_routes(self):
+        routes, skipped = build_routes()
+        names = {route.name for route in routes}
+        self.assertTrue({'home', 'post_detail', 'category_posts', 'tag-detail', 'api_token_auth'} <= names)
+        self.assertFalse(any(name.startswith('admin:') for name in names))
+        self.assertIn('like_post', skipped)
+        self.assertIn('logout', skipped)
+        paths = {route.name: route.path for route in routes}
+        self.assertEqual(paths['post_detail'], '/posts/benchmark-post-0/')
+        self.assertEqual(paths['search_api'], '/api/search/?q=django')
+
+        routes, skipped = build_routes(writes=True)
+        self.assertIn('like_post', {route.name for route in routes})
+        self.assertNotIn('post_delete_api', {route.name for route in routes})
+
+    def test_benchmark_routes_reports_json(self):
+        output = os.path.join(tempfile.mkdtemp(), 'report.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(output), ignore_errors=True)
+        call_command('benchmark_routes', 'home', 'post_detail', 'edit_profile', '--requests', '6',
+                     '--concurrency', '2', '--warmup', '1', '--output', output, stdout=StringIO())
+        with open(output, encoding='utf-8') as handle:
+            report = json.load(handle)
+
+        self.assertEqual(report['meta']['dataset']['posts'], 6)
+        self.assertEqual(set(report['routes']), {'home', 'post_detail', 'edit_profile'})
+        for stats in report['routes'].values():
+            self.assertEqual(stats['requests'], 6)
+            self.assertEqual(stats['statuses'], {'200': 6})
+            self.assertLessEqual(stats['p50_ms'], stats['p95_ms'])
+            self.assertLessEqual(stats['p95_ms'], stats['p99_ms'])
+            self.assertGreater(stats['queries_mean'], 0)
+        # The profile editor redirects anonymous visitors, so it ran logged in
+        self.assertTrue(report['routes']['edit_profile']['authenticated'])
+        self.assertFalse(report['routes']['home']['authenticated'])
+
+    def test_compare_reports_flags_regressions(self):
+        def report(p95, queries, statuses):
+            return {'meta': {'dataset': {'posts': 6}}, 'routes': {'home': {
+                'p95_ms': p95, 'queries_mean': queries, 'statuses': statuses}}}
+
+        baseline = report(10.0, 4, {'200': 10})
+        self.assertEqual(compare_reports(baseline, report(11.0, 4, {'200': 10})), [])
+        regressions = compare_reports(baseline, report(20.0, 6, {'200': 9, '500': 1}))
+        self.assertEqual(len(regressions), 3)
+        self.assertTrue(regressions[0].startswith('home: p95'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], DATABASE_REPLICA_CHECK_INTERVAL=60)
+class DatabaseRouterTest(SimpleTestCase):
+    # The test settings have no replica databases, so probes are mocked and
+    # only routing decisions are checked.
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        patcher = mock.patch('blog.db_router.probe')
+        self.probe = patcher.start()
+        self.addCleanup(patcher.stop)
+        db_health.reset()
+        self.addCleanup(db_health.reset)
+
+    def read_alias(self):
+        return self.router.db_for_read(Post)
+
+    def test_reads_go_to_replicas_and_writes_to_the_primary(self):
+        self.assertEqual({self.read_alias() for _ in range(50)}, {'replica1', 'replica2'})
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'blog'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'blog'))
+
+    def test_use_primary(self):
+        with use_primary():
+            self.assertEqual(self.read_alias(), 'default')
+        self.assertNotEqual(self.read_alias(), 'default')
+
+    def test_related_reads_follow_the_instance(self):
+        post = Post(pk=1)
+        post._state.db = 'default'
+        self.assertEqual(self.router.db_for_read(Comment, instance=post), 'default')
+
+    def test_unhealthy_replicas_leave_rotation(self):
+        def probe(alias):
+            if alias == 'replica1':
+                raise DatabaseError('gone')
+
+        self.probe.side_effect = probe
+        with self.assertLogs('blog.db_router', 'WARNING'):
+            aliases = {self.read_alias() for _ in range(20)}
+        self.assertEqual(aliases, {'replica2'})
+        # Probed once per interval, not per read
+        self.assertEqual(self.probe.call_count, 2)
+        self.assertEqual(db_health.status()['replica1'], {'healthy': False, 'error': 'gone'})
+
+        with self.assertLogs('blog.db_router', 'WARNING'):
+            db_health.mark_down('replica2', 'maintenance')
+        self.assertEqual(self.read_alias(), 'default')
+
+    def test_replicas_are_checked_again_after_the_interval(self):
+        self.probe.side_effect = DatabaseError('gone')
+        with self.assertLogs('blog.db_router', 'WARNING'):
+            self.assertEqual(self.read_alias(), 'default')
+        self.probe.side_effect = None
+        with self.settings(DATABASE_REPLICA_CHECK_INTERVAL=0):
+            db_health._next_check.clear()
+            self.assertNotEqual(self.read_alias(), 'default')
+
+    def middleware_read(self, request):
+        seen = []
+
+        def view(request):
+            seen.append(self.read_alias())
+            return HttpResponse()
+
+        response = ReplicaPinningMiddleware(view)(request)
+        return seen[0], response
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        factory = RequestFactory()
+        alias, response = self.middleware_read(factory.post('/posts/slug/comment/'))
+        self.assertEqual(alias, 'default')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+        request = factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        alias, response = self.middleware_read(request)
+        self.assertEqual(alias, 'default')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        alias, _ = self.middleware_read(factory.get('/'))
+        self.assertNotEqual(alias, 'default')
+
+    def test_cache_fills_read_the_primary_after_an_invalidation(self):
+        seen = []
+
+        @anonymous_page_cache('posts')
+        def view(request):
+            seen.append(self.read_alias())
+            return HttpResponse('page')
+
+        def fill(path):
+            request = RequestFactory().get(path)
+            request.user = AnonymousUser()
+            view(request)
+            return seen[-1]
+
+        get_page_cache().delete(INVALIDATED_KEY)
+        self.assertNotEqual(fill('/fill-routing/first/'), 'default')
+        invalidate('posts')
+        self.assertEqual(fill('/fill-routing/first/'), 'default')
+        get_page_cache().set(INVALIDATED_KEY, time.time() - 60, None)
+        self.assertNotEqual(fill('/fill-routing/second/'), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_pinning_without_replicas(self):
+        alias, response = self.middleware_read(RequestFactory().post('/'))
+        self.assertEqual(alias, 'default')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+class ReactionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='fan', password='testpass123')
+        self.other = User.objects.create_user(username='critic', password='testpass123')
+        self.post = Post.objects.create(title='Liked post', content='Body', author=self.other, status='published')
+        self.comment = Comment.objects.create(post=self.post, author=self.other, content='Liked comment')
+        self.client.force_login(self.user)
+
+    def like(self, url, **headers):
+        return self.client.post(url, headers={'X-Requested-With': 'XMLHttpRequest', **headers})
+
+    def test_toggle_post_like(self):
+        url = reverse('like_post', kwargs={'slug': self.post.slug})
+        # Session, user, post, then delete, insert, counter update and daily
+        # rollup update inside a savepoint (a transaction outside of tests)
+        with self.assertNumQueries(9):
+            response = self.like(url)
+        self.assertEqual(response.json(), {'liked': True, 'count': 1})
+        self.assertTrue(self.post.likes.filter(pk=self.user.pk).exists())
+
+        with self.assertNumQueries(8):
+            response = self.like(url)
+        self.assertEqual(response.json(), {'liked': False, 'count': 0})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertFalse(self.post.likes.exists())
+
+    def test_toggle_comment_like(self):
+        url = reverse('like_comment', kwargs={'pk': self.comment.pk})
+        self.assertEqual(self.like(url).json(), {'liked': True, 'count': 1})
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.like_count, 1)
+        self.assertEqual(list(self.comment.likes.all()), [self.user])
+
+        response = self.client.post(url)
+        self.assertRedirects(response, f"{self.post.get_absolute_url()}#comment-{self.comment.pk}",
+                             fetch_redirect_response=False)
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.like_count, 0)
+
+    def test_likes_need_post_and_login(self):
+        url = reverse('like_post', kwargs={'slug': self.post.slug})
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.client.logout()
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.assertEqual(Post.likes.through.objects.count(), 0)
+
+    def test_liked_state_in_one_query_per_model(self):
+        second = Post.objects.create(title='Unliked', content='Body', author=self.other, status='published')
+        toggle_like(self.post, self.user)
+        toggle_like(self.comment, self.user)
+        with self.assertNumQueries(2):
+            mark_liked(self.user, [self.post, second, self.comment])
+        self.assertEqual([self.post.user_has_liked, second.user_has_liked, self.comment.user_has_liked],
+                         [True, False, True])
+
+        response = self.client.get(reverse('likes_api'),
+                                   {'posts': f'{self.post.pk},{second.pk}', 'comments': str(self.comment.pk)})
+        self.assertEqual(response.json(), {'posts': [self.post.pk], 'comments': [self.comment.pk]})
+        self.assertEqual(self.client.get(reverse('likes_api'), {'posts': 'x'}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('likes_api'), {'posts': str(self.post.pk)}).json(),
+                         {'posts': [], 'comments': []})
+
+    def test_detail_page_shows_like_state(self):
+        toggle_like(self.comment, self.user)
+        response = self.client.get(self.post.get_absolute_url())
+        self.assertFalse(response.context['user_has_liked'])
+        self.assertTrue(response.context['comments'][0].user_has_liked)
+        self.assertContains(response, reverse('like_comment', kwargs={'pk': self.comment.pk}))
+
+    def test_likes_invalidate_cached_pages(self):
+        self.client.logout()
+        url = self.post.get_absolute_url()
+        etag = self.client.get(url)['ETag']
+        toggle_like(self.comment, self.user)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_like_lost_to_a_concurrent_insert_is_not_counted(self):
+        toggle_like(self.post, self.user)
+        post = Post.objects.get(pk=self.post.pk)
+        # The other request's row appears between our DELETE and INSERT
+        with mock.patch('django.db.models.query.QuerySet.delete', return_value=(0, {})):
+            liked, like_count = toggle_like(post, self.user)
+        self.assertEqual((liked, like_count), (True, 1))
+        post.refresh_from_db()
+        self.assertEqual(post.like_count, 1)
+        self.assertEqual(Post.likes.through.objects.filter(post=post).count(), 1)
+
+
+class DashboardStatsTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='writer', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.post = Post.objects.create(title='Counted post', content='Body', author=self.author, status='published')
+        self.draft = Post.objects.create(title='Draft post', content='Body', author=self.author, status='draft')
+        self.today = timezone.localdate()
+
+    def stats(self, post):
+        return PostDailyStats.objects.get(post=post, date=self.today)
+
+    def test_totals_in_one_query(self):
+        Post.objects.filter(pk=self.post.pk).update(views=7, like_count=2, comment_count=3)
+        Post.objects.filter(pk=self.draft.pk).update(views=1)
+        with self.assertNumQueries(1):
+            totals = author_totals(self.author)
+        self.assertEqual(totals['post_count'], 2)
+        self.assertEqual(totals['published_count'], 1)
+        self.assertEqual(totals['draft_count'], 1)
+        self.assertEqual((totals['total_views'], totals['total_likes'], totals['total_comments']), (8, 2, 3))
+        self.assertEqual(totals['avg_views'], 4.0)
+        self.assertEqual(author_totals(self.reader)['total_views'], 0)
+
+    def test_activity_is_rolled_up_by_day(self):
+        counter = ViewCounter(MemoryStore())
+        counter.record(self.post.pk, 3)
+        counter.record(self.draft.pk, 1)
+        counter.flush()
+        Comment.objects.create(post=self.post, author=self.reader, content='Nice')
+        toggle_like(Post.objects.get(pk=self.post.pk), self.reader)
+        self.post.likes.add(self.author)
+        self.post.likes.remove(self.author)
+
+        stats = self.stats(self.post)
+        self.assertEqual((stats.views, stats.likes, stats.comments), (3, 1, 1))
+        self.assertEqual(stats.author, self.author)
+        self.assertEqual(self.stats(self.draft).views, 1)
+
+        toggle_like(Post.objects.get(pk=self.post.pk), self.reader)
+        self.assertEqual(self.stats(self.post).likes, 0)
+
+    def test_existing_row_costs_one_update(self):
+        record_activity('views', {self.post.pk: 1})
+        with self.assertNumQueries(1):
+            record_activity('views', {self.post.pk: 2})
+        self.assertEqual(self.stats(self.post).views, 3)
+
+    def test_series_is_zero_filled(self):
+        yesterday = self.today - timedelta(days=1)
+        record_activity('views', {self.post.pk: 4, self.draft.pk: 1}, day=yesterday)
+        record_activity('comments', {self.post.pk: 2})
+        with self.assertNumQueries(1):
+            series = daily_series(self.author, days=7)
+        self.assertEqual(len(series['labels']), 7)
+        self.assertEqual(series['views'], [0, 0, 0, 0, 0, 5, 0])
+        self.assertEqual(series['comments'], [0, 0, 0, 0, 0, 0, 2])
+        self.assertEqual(series['likes'], [0] * 7)
+        self.assertEqual(daily_series(self.reader, days=7)['views'], [0] * 7)
+
+    def test_dashboard_renders_totals_and_charts(self):
+        Post.objects.filter(pk=self.post.pk).update(views=12)
+        record_activity('views', {self.post.pk: 12})
+        Comment.objects.create(post=self.post, author=self.reader, content='Great read')
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['post_count'], 2)
+        self.assertEqual(response.context['total_views'], 12)
+        self.assertEqual(json.loads(response.context['views_chart'])['values'][-1], 12)
+        self.assertEqual(json.loads(response.context['engagement_chart'])['comments'][-1], 1)
+        self.assertContains(response, 'Great read')
+        self.assertContains(response, reverse('delete_post', args=[self.post.slug]))
+
+
+@override_settings(SITE_URL='https://blog.example')
+class FeedSitemapTest(TestCase):
+    def setUp(self):
+        self.sitemap_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sitemap_root, ignore_errors=True)
+        sitemaps = override_settings(SITEMAP_ROOT=self.sitemap_root)
+        sitemaps.enable()
+        self.addCleanup(sitemaps.disable)
+        get_page_cache().clear()
+        self.author = User.objects.create_user(username='writer', password='testpass123')
+        self.python = Category.objects.create(name='Python')
+        self.rust = Category.objects.create(name='Rust')
+        self.tag = Tag.objects.create(name='asyncio')
+        self.post = Post.objects.create(title='Feed post', content='<p>Body</p>', excerpt='Short',
+                                        author=self.author, category=self.python, status='published')
+        self.post.tags.add(self.tag)
+        self.draft = Post.objects.create(title='Hidden draft', content='Body', author=self.author, status='draft')
+
+    def etag(self, url):
+        return self.client.get(url)['ETag']
+
+    def test_feeds_list_published_posts(self):
+        urls = [
+            reverse('feed_rss'), reverse('feed_atom'),
+            reverse('category_feed_rss', args=[self.python.slug]),
+            reverse('tag_feed_atom', args=[self.tag.slug]),
+            reverse('author_feed_rss', args=[self.author.username]),
+        ]
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertContains(response, 'Feed post')
+            self.assertNotContains(response, 'Hidden draft')
+        self.assertIn('atom+xml', self.client.get(reverse('feed_atom'))['Content-Type'])
+        self.assertNotContains(self.client.get(reverse('category_feed_rss', args=[self.rust.slug])), 'Feed post')
+        self.assertEqual(self.client.get(reverse('category_feed_rss', args=['missing'])).status_code, 404)
+
+    def test_feeds_are_cached_and_revalidated(self):
+        url = reverse('feed_rss')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+            not_modified = self.client.get(url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(cached.content, first.content)
+        self.assertEqual(not_modified.status_code, 304)
+
+        category_url = reverse('category_feed_rss', args=[self.python.slug])
+        self.client.get(category_url)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(category_url).status_code, 200)
+
+    def test_only_changes_to_published_posts_in_a_feed_regenerate_it(self):
+        site, python, rust = (reverse('feed_rss'), reverse('category_feed_rss', args=[self.python.slug]),
+                              reverse('category_feed_rss', args=[self.rust.slug]))
+        before = {url: self.etag(url) for url in (site, python, rust)}
+
+        self.draft.title = 'Still a draft'
+        self.draft.save()
+        Comment.objects.create(post=self.post, author=self.author, content='Nice')
+        toggle_like(self.post, self.author)
+        self.assertEqual({url: self.etag(url) for url in before}, before)
+
+        self.post.title = 'Feed post, revised'
+        self.post.save()
+        self.assertNotEqual(self.etag(site), before[site])
+        self.assertNotEqual(self.etag(python), before[python])
+        self.assertEqual(self.etag(rust), before[rust])
+        self.assertContains(self.client.get(python), 'Feed post, revised')
+
+        self.draft.status = 'published'
+        self.draft.category = self.rust
+        self.draft.save()
+        self.assertContains(self.client.get(rust), 'Still a draft')
+
+    def test_sitemap_index_and_pages(self):
+        response = self.client.get(reverse('sitemap_index'))
+        self.assertEqual(response.status_code, 200)
+        created = self.post.date_created
+        shard = reverse('sitemap_posts', kwargs={'year': created.year, 'month': created.month})
+        self.assertIn(f'-{created.month:02d}.xml', shard)
+        self.assertContains(response, f'https://blog.example{shard}')
+        self.assertContains(response, 'https://blog.example' + reverse('sitemap_pages'))
+        revalidated = self.client.get(reverse('sitemap_index'), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+        pages = self.client.get(reverse('sitemap_pages'))
+        self.assertContains(pages, reverse('category_posts', args=[self.python.slug]))
+        self.assertNotContains(pages, reverse('category_posts', args=[self.rust.slug]))
+
+    def test_current_month_shard_is_rendered_and_revalidated(self):
+        created = self.post.date_created
+        url = reverse('sitemap_posts', kwargs={'year': created.year, 'month': created.month})
+        response = self.client.get(url)
+        self.assertContains(response, 'https://blog.example' + self.post.get_absolute_url())
+        self.assertNotContains(response, self.draft.slug)
+        with self.assertNumQueries(1):
+            revalidated = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertFalse(os.listdir(self.sitemap_root))
+
+    def test_past_month_shards_are_static_files(self):
+        Post.objects.filter(pk=self.post.pk).update(date_created=timezone.make_aware(timezone.datetime(2024, 3, 5)))
+        url = reverse('sitemap_posts', kwargs={'year': 2024, 'month': 3})
+        path = os.path.join(self.sitemap_root, 'posts-2024-03.xml')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.post.slug, b''.join(response.streaming_content).decode())
+        self.assertTrue(os.path.exists(path))
+        with self.assertNumQueries(0):
+            revalidated = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+        # Editing a post of that month discards the file until the next request
+        post = Post.objects.get(pk=self.post.pk)
+        post.title = 'Renamed'
+        post.save()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.client.get(reverse('sitemap_posts', kwargs={'year': 2024, 'month': 4})).status_code, 404)
+
+        out = StringIO()
+        call_command('build_sitemaps', stdout=out)
+        self.assertIn('Wrote 1 sitemap shards', out.getvalue())
+        self.assertTrue(os.path.exists(path))
+
+
+class AssetPipelineTest(TestCase):
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root, ignore_errors=True)
+        static = override_settings(STATIC_ROOT=self.static_root)
+        static.enable()
+        self.addCleanup(static.disable)
+        get_page_cache().clear()
+
+    def collect(self):
+        call_command('collectstatic', interactive=False, verbosity=0,
+                     ignore_patterns=['admin', 'ckeditor', 'rest_framework'])
+
+    def test_minifiers_keep_strings_and_regular_expressions(self):
+        self.assertEqual(
+            minify_css('a , b > c {\n  color: red ; /* note */\n  content: "x  ;  y";\n}\n'),
+            'a,b>c{color: red;content: "x  ;  y"}\n',
+        )
+        self.assertEqual(
+            minify_js('const pattern = /a"b\\/c/g; // note\n    let url = "http://x"; /* inline */\n'
+                      'let text = `a\n  // kept`;\nx = a / b / c;\n'),
+            'const pattern = /a"b\\/c/g;\nlet url = "http://x";\nlet text = `a\n  // kept`;\nx = a / b / c;\n',
+        )
+
+    def test_pages_use_source_files_until_bundles_are_collected(self):
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'modern-theme.css')
+        self.assertContains(response, 'modern-scripts.js')
+
+    def test_collectstatic_builds_hashed_precompressed_bundles(self):
+        self.collect()
+        response = self.client.get(reverse('home'))
+        self.assertNotContains(response, 'modern-theme.css')
+        html = response.content.decode()
+        css_url = html[html.index('/static/bundles/site.'):].split('"')[0]
+        self.assertRegex(css_url, r'^/static/bundles/site\.[0-9a-f]{12}\.css$')
+        self.assertIn('/static/bundles/site.', html[html.index('<script src="/static/bundles/'):])
+        self.assertContains(self.client.get(reverse('login')), '/static/bundles/auth.')
+
+        path = os.path.join(self.static_root, css_url[len('/static/'):])
+        with open(path, 'rb') as stream:
+            bundle = stream.read()
+        self.assertIn(b'--primary', bundle)
+        self.assertLess(len(bundle), sum(os.path.getsize(os.path.join(self.static_root, name))
+                                         for name in ('modern-theme.css', 'dark-mode-fix.css')))
+        self.assertTrue(os.path.exists(path + '.gz'))
+
+        with self.assertNumQueries(0):
+            compressed = self.client.get(css_url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(compressed['Content-Type'], 'text/css')
+        self.assertEqual(compressed['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(compressed['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(b''.join(compressed.streaming_content)), bundle)
+
+        plain = self.client.get(css_url, headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(plain.streaming_content), bundle)
+        revalidated = self.client.get(css_url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': compressed['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+        unhashed = self.client.get('/static/bundles/site.css')
+        self.assertEqual(unhashed['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(self.client.get('/static/missing.css').status_code, 404)
+        self.assertGreaterEqual(self.client.get('/static/../manage.py').status_code, 400)
+
+
+class RenderedFieldsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='writer', password='testpass123')
+        get_page_cache().clear()
+
+    def test_sanitize_keeps_allowed_markup_only(self):
+        html, text = sanitize(
+            '<p class="lead" onclick="x()">Hi <b>there</b><script>alert(1)</script></p>'
+            '<a href="javascript:alert(1)" target="_blank">link</a><img src="/a.png" onerror="x()">'
+            '<iframe src="https://evil.example"><p>inside</p></iframe><unknown>kept text</unknown>'
+        )
+        self.assertEqual(
+            html,
+            '<p class="lead">Hi <b>there</b></p><a target="_blank" rel="noopener noreferrer">link</a>'
+            '<img src="/a.png" loading="lazy">kept text',
+        )
+        self.assertEqual(text, 'Hi there\nlinkkept text')
+
+    def test_summary_word_count_and_reading_time(self):
+        fields = render_post_fields('<p>' + 'word ' * 450 + '</p>')
+        self.assertEqual(fields['word_count'], 450)
+        self.assertEqual(fields['reading_time'], 3)
+        self.assertEqual(fields['summary'], 'word ' * 29 + 'word…')
+        self.assertEqual(render_post_fields('<p>Body</p>', '<em>Short</em>  excerpt')['summary'], 'Short excerpt')
+        self.assertEqual(render_post_fields('')['reading_time'], 1)
+
+    def test_save_renders_fields(self):
+        post = Post.objects.create(title='Rendered', content='<p>One <i>two</i></p><script>x</script>',
+                                   author=self.user, status='published')
+        self.assertEqual((post.summary, post.word_count), ('One two', 2))
+        self.assertEqual(post.content_html, '<p>One <i>two</i></p>')
+
+        post.content = '<p>Three four five</p>'
+        post.save(update_fields=['content'])
+        post.refresh_from_db()
+        self.assertEqual((post.summary, post.word_count), ('Three four five', 3))
+
+        renamed = Post.objects.defer('content').get(pk=post.pk)
+        renamed.title = 'Renamed'
+        with CaptureQueriesContext(connection) as queries:
+            renamed.save(update_fields=['title'])
+        update = next(query['sql'] for query in queries if query['sql'].startswith('UPDATE "blog_post"'))
+        self.assertNotIn('"summary"', update)
+        self.assertEqual(Post.objects.get(pk=post.pk).summary, 'Three four five')
+
+    def test_render_posts_command_backfills(self):
+        post = Post.objects.create(title='Stale', content='<p>Fresh words</p>', author=self.user, status='published')
+        Post.objects.filter(pk=post.pk).update(summary='', word_count=0, content_html='')
+        out = StringIO()
+        call_command('render_posts', '--chunk-size', '1', stdout=out)
+        self.assertIn('Rendered 1 posts', out.getvalue())
+        post.refresh_from_db()
+        self.assertEqual((post.summary, post.word_count, post.content_html), ('Fresh words', 2, '<p>Fresh words</p>'))
+
+    def test_migration_backfills_with_its_own_renderer(self):
+        migration = importlib.import_module('blog.migrations.0011_post_rendered_fields')
+        self.assertFalse([value for value in vars(migration).values()
+                          if getattr(value, '__module__', None) == 'blog.rendering'])
+        post = Post.objects.create(title='Stale', content='<p>Fresh <b>words</b></p>', author=self.user, status='published')
+        Post.objects.filter(pk=post.pk).update(summary='', word_count=0, content_html='')
+        executor = MigrationExecutor(connection)
+        state = executor.loader.project_state(('blog', '0011_post_rendered_fields'))
+        migration.render_posts(state.apps, None)
+        post.refresh_from_db()
+        self.assertEqual((post.summary, post.word_count, post.content_html), ('Fresh words', 2, '<p>Fresh <b>words</b></p>'))
+
+    def test_list_pages_do_not_load_the_body(self):
+        post = Post.objects.create(title='Listed', content='<p>Body text here</p>', author=self.user, status='published')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('post_list'))
+        self.assertContains(response, 'Body text here')
+        self.assertContains(response, '1 min read')
+        post_queries = [query['sql'] for query in queries if 'FROM "blog_post"' in query['sql']]
+        self.assertTrue(post_queries)
+        for sql in post_queries:
+            self.assertNotIn('"blog_post"."content"', sql)
+
+        response = self.client.get(reverse('post_detail', kwargs={'slug': post.slug}))
+        self.assertContains(response, '<p>Body text here</p>', html=True)
+
+
+class FragmentCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='writer', password='testpass123')
+        self.category = Category.objects.create(name='Python')
+        self.post = Post.objects.create(title='Cached card', content='<p>Body</p>', author=self.user,
+                                        category=self.category, status='published')
+        get_page_cache().clear()
+
+    def posts(self):
+        return Post.objects.select_related('author', 'category').prefetch_related('tags').order_by('pk')
+
+    def render(self, posts):
+        with mock.patch.object(fragments, 'render_to_string', wraps=fragments.render_to_string) as rendered:
+            html = fragments.render_cards(posts, 'blog/cards/post_card.html', show_category=True, show_tags=True)
+        return html, rendered.call_count
+
+    def test_cards_are_rendered_once_per_version(self):
+        Post.objects.create(title='Second card', content='<p>More</p>', author=self.user, status='published')
+        html, rendered = self.render(self.posts())
+        self.assertEqual(rendered, 2)
+        self.assertIn('Cached card', html)
+        cache = get_page_cache()
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            self.assertEqual(self.render(self.posts()), (html, 0))
+        self.assertEqual(get_many.call_count, 1)
+
+        Post.objects.filter(pk=self.post.pk).update(like_count=5)
+        html, rendered = self.render(self.posts())
+        self.assertEqual(rendered, 1)
+        self.assertIn('<i class="far fa-heart"></i> 5', html)
+
+        Category.objects.filter(pk=self.category.pk).update(name='Django')
+        html, rendered = self.render(self.posts())
+        self.assertEqual(rendered, 1)
+        self.assertIn('Django', html)
+
+        tag = Tag.objects.create(name='orm')
+        self.post.tags.add(tag)
+        html, rendered = self.render(self.posts())
+        self.assertEqual(rendered, 1)
+        self.assertIn('orm', html)
+
+    def test_search_results_are_not_cached(self):
+        post = self.posts().get()
+        post.search_snippet = 'a <mark>match</mark>'
+        self.assertEqual(self.render([post])[1], 1)
+        self.assertEqual(self.render([post])[1], 1)
+
+    def test_signed_in_pages_reuse_anonymous_cards(self):
+        self.client.get(reverse('post_list'))
+        self.client.login(username='writer', password='testpass123')
+        with mock.patch.object(fragments, 'render_to_string', wraps=fragments.render_to_string) as rendered:
+            response = self.client.get(reverse('post_list'))
+        self.assertContains(response, 'Cached card')
+        self.assertEqual(rendered.call_count, 0)
+
+
+class ApiCacheTest(TestCase):
+    def setUp(self):
+        get_page_cache().clear()
+        self.user = User.objects.create_user(username='writer', password='testpass123')
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+        self.post = Post.objects.create(title='Cached API post', content='<p>Body</p>', author=self.user,
+                                        category=self.python, status='published')
+        self.other = Post.objects.create(title='Other API post', content='<p>Body</p>', author=self.user,
+                                         category=self.django, status='published')
+
+    def get(self, url, **headers):
+        return self.client.get(url, headers=headers)
+
+    def test_hits_skip_queries_and_serialization(self):
+        url = reverse('post-list')
+        first = self.get(url)
+        self.assertEqual(first['X-API-Cache'], 'MISS')
+        with mock.patch.object(PostSerializer, 'to_representation') as serialize:
+            with self.assertNumQueries(0):
+                second = self.get(url)
+        serialize.assert_not_called()
+        self.assertEqual(second['X-API-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+
+        with self.assertNumQueries(0):
+            revalidated = self.get(url, If_None_Match=first['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(self.get(f'{url}?page_size=1')['X-API-Cache'], 'MISS')
+
+    def test_writes_invalidate_only_affected_responses(self):
+        post_url = reverse('post-detail', kwargs={'slug': self.post.slug})
+        other_url = reverse('post-detail', kwargs={'slug': self.other.slug})
+        category_url = reverse('category-detail', kwargs={'slug': self.django.slug})
+        urls = [reverse('post-list'), reverse('post_list_api'), post_url, other_url,
+                category_url, reverse('category-list'), reverse('tag-list')]
+        for url in urls:
+            self.get(url)
+
+        Comment.objects.create(post=self.post, author=self.user, content='Fresh comment')
+        state = {url: self.get(url)['X-API-Cache'] for url in urls}
+        self.assertEqual(state, {
+            urls[0]: 'MISS', urls[1]: 'MISS', post_url: 'MISS', other_url: 'HIT',
+            category_url: 'HIT', urls[5]: 'HIT', urls[6]: 'HIT',
+        })
+        self.assertContains(self.get(post_url), 'Fresh comment')
+
+        self.python.name = 'Python 3'
+        self.python.save()
+        self.assertEqual(self.get(category_url)['X-API-Cache'], 'HIT')
+        self.assertEqual(self.get(reverse('category-list'))['X-API-Cache'], 'MISS')
+        self.assertContains(self.get(post_url), 'Python 3')
+
+        toggle_like(self.other, self.user)
+        self.assertEqual(self.get(other_url).json()['likes_count'], 1)
+
+    def test_browsable_api_is_not_stored(self):
+        url = reverse('category-list')
+        self.get(url, Accept='text/html')
+        self.assertEqual(self.get(url, Accept='text/html')['X-API-Cache'], 'MISS')
+        self.get(url, Accept='application/json')
+        self.assertEqual(self.get(url, Accept='application/json')['X-API-Cache'], 'HIT')
+
+    def test_author_changes_invalidate_post_responses(self):
+        urls = [reverse('post-detail', kwargs={'slug': self.post.slug}),
+                f"{reverse('post-list')}?expand=author", reverse('post_list_api') + '?expand=author']
+        for url in urls:
+            self.get(url)
+        self.client.login(username='writer', password='testpass123')
+        self.client.logout()
+        self.assertEqual({self.get(url)['X-API-Cache'] for url in urls}, {'HIT'})
+
+        self.user.username = 'renamed'
+        self.user.save()
+        for url in urls:
+            response = self.get(url)
+            self.assertEqual(response['X-API-Cache'], 'MISS')
+            self.assertContains(response, 'renamed')
+
+
+class QueryPlanTest(TestCase):
+    def setUp(self):
+        get_page_cache().clear()
+        self.user = User.objects.create_user(username='writer', password='testpass123')
+        self.category = Category.objects.create(name='Python')
+        self.tags = [Tag.objects.create(name=name) for name in ('orm', 'drf')]
+
+    def create_posts(self, count):
+        start = Post.objects.count()
+        for number in range(start, start + count):
+            post = Post.objects.create(title=f'Planned {number}', content='<p>Body</p>', author=self.user,
+                                       category=self.category, status='published')
+            post.tags.set(self.tags)
+            Comment.objects.create(post=post, author=self.user, content='Reply')
+
+    def test_post_plan_follows_nested_serializers(self):
+        plan = plan_for(PostSerializer)
+        self.assertEqual(plan.select_related, {'author', 'category'})
+        self.assertEqual(list(plan.prefetch_related), ['tags'])
+        self.assertEqual(plan_for(blog_serializers.CommentSerializer).select_related, {'author'})
+        self.assertEqual(plan_for(blog_serializers.UserProfileSerializer).select_related, {'user'})
+
+    def test_every_serializer_can_be_planned(self):
+        for name in dir(blog_serializers):
+            serializer_class = getattr(blog_serializers, name)
+            if (isinstance(serializer_class, type) and issubclass(serializer_class, blog_serializers.serializers.ModelSerializer)
+                    and serializer_class.__module__ == blog_serializers.__name__):
+                with self.subTest(serializer=name):
+                    optimize(serializer_class.Meta.model.objects.all(), serializer_class)
+
+    def test_serializing_a_page_costs_the_same_for_any_size(self):
+        def serialize():
+            posts = optimize(Post.objects.order_by('pk'), PostSerializer)
+            with CaptureQueriesContext(connection) as queries:
+                data = PostSerializer(posts, many=True).data
+            return data, len(queries)
+
+        self.create_posts(2)
+        small, small_queries = serialize()
+        self.create_posts(8)
+        large, large_queries = serialize()
+        self.assertEqual(len(large), 10)
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(large[0]['category']['name'], 'Python')
+        self.assertEqual(sorted(tag['name'] for tag in large[0]['tags']), ['drf', 'orm'])
+
+    @override_settings(API_CACHE_ENABLED=False)
+    def test_list_endpoints_stay_flat(self):
+        self.create_posts(3)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('post-list'))
+        self.create_posts(6)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse('post-list'))
+        self.assertEqual(len(response.json()['results']), 9)
+        self.assertEqual(len(small), len(large))
+
+    def test_hints_add_annotations(self):
+        class CategoryWithPosts(blog_serializers.serializers.ModelSerializer):
+            posts_total = blog_serializers.serializers.SerializerMethodField()
+
+            class Meta:
+                model = Category
+                fields = ['name', 'posts_total']
+                query_hints = {'posts_total': {'annotate': {'posts_total': Count('posts')}}}
+
+            def get_posts_total(self, obj):
+                return obj.posts_total
+
+        self.create_posts(2)
+        categories = optimize(Category.objects.all(), CategoryWithPosts)
+        with self.assertNumQueries(1):
+            data = CategoryWithPosts(categories, many=True).data
+        self.assertEqual(data[0]['posts_total'], 2)
+
+
+@override_settings(API_CACHE_ENABLED=False)
+class SparseFieldsetTest(TestCase):
+    def setUp(self):
+        get_page_cache().clear()
+        self.user = User.objects.create_user(username='mobile', password='testpass123')
+        self.category = Category.objects.create(name='Apps')
+        self.tag = Tag.objects.create(name='ios')
+        for number in range(3):
+            post = Post.objects.create(title=f'Headline {number}', content='<p>Long body</p>' * 200,
+                                       author=self.user, category=self.category, status='published')
+            post.tags.add(self.tag)
+            Comment.objects.create(post=post, author=self.user, content='Nice')
+
+    def post_selects(self, queries):
+        return [query['sql'] for query in queries if query['sql'].startswith('SELECT') and 'FROM "blog_post"' in query['sql']]
+
+    def test_list_uses_the_summary_representation(self):
+        for url in (reverse('post-list'), reverse('post_list_api')):
+            with self.subTest(url=url):
+                result = self.client.get(url).json()['results'][0]
+                self.assertEqual(result['author'], self.user.pk)
+                self.assertEqual(result['category'], self.category.pk)
+                self.assertNotIn('content', result)
+                self.assertNotIn('comments', result)
+                self.assertNotIn('tags', result)
+
+    def test_unrequested_fields_are_not_loaded(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('post_list_api'), {'fields': 'id,title,slug'})
+        results = response.json()['results']
+        self.assertEqual(len(results), 3)
+        self.assertEqual(set(results[0]), {'id', 'title', 'slug'})
+        selects = self.post_selects(queries)
+        self.assertTrue(selects)
+        for sql in selects:
+            self.assertNotIn('"blog_post"."content"', sql)
+            self.assertNotIn('"blog_post"."content_html"', sql)
+        self.assertFalse([query for query in queries if 'blog_comment' in query['sql']])
+
+    def test_expand_nests_relations(self):
+        response = self.client.get(reverse('post-list'), {'expand': 'author,category,tags,comments', 'fields': 'title'})
+        result = response.json()['results'][0]
+        self.assertEqual(set(result), {'title', 'author', 'category', 'tags', 'comments'})
+        self.assertEqual(result['author']['username'], 'mobile')
+        self.assertEqual(result['category']['name'], 'Apps')
+        self.assertEqual([tag['name'] for tag in result['tags']], ['ios'])
+        self.assertEqual(result['comments'][0]['content'], 'Nice')
+
+    def test_detail_accepts_sparse_fields(self):
+        post = Post.objects.first()
+        response = self.client.get(reverse('post-detail', args=[post.slug]), {'fields': 'title,tags'})
+        data = response.json()
+        self.assertEqual(set(data), {'title', 'tags'})
+        self.assertEqual([tag['name'] for tag in data['tags']], ['ios'])
+        self.assertIn('content', self.client.get(reverse('post-detail', args=[post.slug])).json())
+
+    def test_headlines_transfer_a_fraction_of_the_detail_payload(self):
+        full = self.client.get(reverse('post-list'), {'expand': 'author,category,tags,comments', 'fields': ','.join(
+            blog_serializers.PostSerializer.Meta.fields)})
+        headlines = self.client.get(reverse('post-list'), {'fields': 'id,title,slug'})
+        detail_bytes = sum(len(self.client.get(reverse('post-detail', args=[result['slug']])).content)
+                           for result in headlines.json()['results'])
+        self.assertLess(len(headlines.content) * 10, detail_bytes)
+        self.assertLess(len(headlines.content), len(full.content))
+
+    def test_writes_ignore_sparse_fields(self):
+        self.client.login(username='mobile', password='testpass123')
+        post = Post.objects.first()
+        response = self.client.patch(f"{reverse('post-detail', args=[post.slug])}?fields=title",
+                                     {'title': 'Edited'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('content', response.json())
+        post.refresh_from_db()
+        self.assertEqual(post.title, 'Edited')
+        self.assertIn('Long body', post.content)
+
+    def test_each_representation_has_its_own_etag(self):
+        post = Post.objects.first()
+        for url in (reverse('post_detail_api', args=[post.slug]), reverse('post-detail', args=[post.slug])):
+            with self.subTest(url=url):
+                full = self.client.get(url)
+                sparse = self.client.get(url, {'fields': 'id,title'})
+                self.assertNotEqual(full['ETag'], sparse['ETag'])
+                self.assertEqual(self.client.get(url, {'fields': 'title,id'})['ETag'], sparse['ETag'])
+                response = self.client.get(url, {'fields': 'id,title'}, HTTP_IF_NONE_MATCH=full['ETag'])
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(set(response.json()), {'id', 'title'})
+                self.assertNotEqual(self.client.get(url, {'expand': 'comments'})['ETag'], full['ETag'])
+                self.assertNotEqual(self.client.get(url, HTTP_ACCEPT='text/html')['ETag'], full['ETag'])
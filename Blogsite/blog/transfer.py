@@ -0,0 +1,338 @@
+import contextlib
+import gzip
+import json
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import CharField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, Concat, LPad
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.text import slugify
+
+from .api_cache import bump_all
+from .counters import rebuild_taxonomy_counts
+from .jobs import enqueue
+from .models import Category, Comment, Post, Tag
+from .page_cache import invalidate
+from .related import rebuild_related_posts
+from .rendering import RENDERED_FIELDS
+from .search import get_backend as get_search_backend
+from .sitemaps import discard_all_shards
+
+
+# Posts travel as JSON Lines, one post per line with its author, category,
+# tags and comment thread inlined. Both directions work chunk by chunk, so
+# memory use depends on the chunk size rather than on the number of posts.
+
+DEFAULT_CHUNK_SIZE = 500
+POST_FIELDS = ('title', 'excerpt', 'content', 'status', 'featured_image', 'views', 'date_created', 'date_updated')
+
+
+def open_stream(path, mode):
+    """Open ``path`` for text I/O; ``-`` is stdin/stdout, ``.gz`` is gzipped."""
+    if path == '-':
+        # Leave the process's own streams open afterwards
+        return contextlib.nullcontext(sys.stdin if 'r' in mode else sys.stdout)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class Checkpoint:
+    """Progress marker kept in a small JSON file, replaced atomically so a
+    crash never leaves a half-written checkpoint behind."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, default=0):
+        if not self.path or not os.path.exists(self.path):
+            return default
+        with open(self.path, encoding='utf-8') as handle:
+            return json.load(handle)['position']
+
+    def save(self, position):
+        if not self.path:
+            return
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as handle:
+            json.dump({'position': position}, handle)
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Export
+
+def _person(username, email):
+    return {'username': username, 'email': email}
+
+
+def export_chunks(after=0, chunk_size=DEFAULT_CHUNK_SIZE, queryset=None):
+    """Yield lists of post records with ``pk > after`` in primary key order.
+
+    Each chunk costs three queries: posts with author and category, tag
+    links, and comments.
+    """
+    queryset = Post.objects.all() if queryset is None else queryset
+    last = after
+    while True:
+        posts = list(
+            queryset.filter(pk__gt=last).order_by('pk').values(
+                'pk', 'slug', *POST_FIELDS, 'author__username', 'author__email',
+                'category__name', 'category__slug', 'category__description',
+            )[:chunk_size]
+        )
+        if not posts:
+            return
+        ids = [post['pk'] for post in posts]
+
+        tags = defaultdict(list)
+        links = (Post.tags.through.objects.filter(post_id__in=ids).order_by('post_id', 'tag__name')
+                 .values_list('post_id', 'tag__name', 'tag__slug'))
+        for post_id, name, slug in links:
+            tags[post_id].append({'name': name, 'slug': slug})
+
+        comments = defaultdict(list)
+        # Path order puts every parent before its replies
+        rows = (Comment.objects.filter(post_id__in=ids).order_by('post_id', 'path')
+                .values_list('post_id', 'pk', 'parent_id', 'author__username', 'author__email',
+                             'content', 'date_created'))
+        for post_id, pk, parent_id, username, email, content, date_created in rows:
+            comments[post_id].append({
+                'id': pk, 'parent': parent_id, 'author': _person(username, email),
+                'content': content, 'date_created': date_created,
+            })
+
+        chunk = []
+        for post in posts:
+            record = {'id': post['pk'], 'slug': post['slug']}
+            record.update((field, post[field]) for field in POST_FIELDS)
+            record['featured_image'] = post['featured_image'] or ''
+            record['author'] = _person(post['author__username'], post['author__email'])
+            record['category'] = None if post['category__slug'] is None else {
+                'name': post['category__name'], 'slug': post['category__slug'],
+                'description': post['category__description'],
+            }
+            record['tags'] = tags[post['pk']]
+            record['comments'] = comments[post['pk']]
+            chunk.append(record)
+        yield chunk
+        last = ids[-1]
+
+
+class RecordEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # Keep full precision; DjangoJSONEncoder rounds to milliseconds
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def dump_record(record):
+    return json.dumps(record, cls=RecordEncoder, ensure_ascii=False) + '\n'
+
+
+# Import
+
+def read_records(stream, skip=0):
+    """Yield ``(line_number, record)`` for the non-blank lines after ``skip``."""
+    for number, line in enumerate(stream, 1):
+        if number <= skip or not line.strip():
+            continue
+        yield number, json.loads(line)
+
+
+def _date(value):
+    return parse_datetime(value) if isinstance(value, str) else value
+
+
+def upsert_users(people):
+    """Map usernames to user ids, creating missing users without a usable
+    password. Two queries."""
+    User = get_user_model()
+    people = {person['username']: person for person in people}
+    User.objects.bulk_create(
+        [User(username=username, email=person.get('email') or '', password=make_password(None))
+         for username, person in people.items()],
+        ignore_conflicts=True,
+    )
+    return dict(User.objects.filter(username__in=people).values_list('username', 'pk'))
+
+
+def upsert_named(model, rows):
+    """Map slugs to ids of ``model`` (Category or Tag) rows, creating missing
+    ones. A row whose name or slug is taken reuses the existing row."""
+    rows = {row['slug'] or slugify(row['name']): row for row in rows}
+    if not rows:
+        return {}
+    model.objects.bulk_create(
+        [model(**{**row, 'slug': slug}) for slug, row in rows.items()], ignore_conflicts=True,
+    )
+    by_name, by_slug = {}, {}
+    names = [row['name'] for row in rows.values()]
+    for pk, name, slug in model.objects.filter(Q(slug__in=rows) | Q(name__in=names)).values_list('pk', 'name', 'slug'):
+        by_name[name] = by_slug[slug] = pk
+    return {slug: by_slug.get(slug) or by_name[row['name']] for slug, row in rows.items()}
+
+
+@contextlib.contextmanager
+def keep_given_dates(model):
+    """Let ``bulk_create`` store the dates set on the instances.
+
+    ``auto_now``/``auto_now_add`` fields would be stamped with the current
+    time, which would have to be undone row by row with a slow bulk_update.
+    The flags live on the shared field objects, so run imports in a process
+    of their own, like the import_posts command.
+    """
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    flags = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in flags:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class PostImporter:
+    """Writes chunks of post records with bulk queries.
+
+    Posts are matched on slug, so importing a chunk again (for example after
+    resuming from a checkpoint) updates the posts instead of duplicating
+    them; their tags and comments are replaced.
+    """
+
+    def __init__(self):
+        self.posts_created = 0
+        self.posts_updated = 0
+        self.comments_created = 0
+
+    @transaction.atomic
+    def import_chunk(self, records):
+        # Later lines win when a slug repeats within the chunk
+        records = {record.get('slug') or slugify(record['title']): record for record in records}
+        people = [record['author'] for record in records.values()]
+        people += [comment['author'] for record in records.values() for comment in record.get('comments', ())]
+        users = upsert_users(people)
+        categories = upsert_named(Category, [record['category'] for record in records.values() if record.get('category')])
+        tags = upsert_named(Tag, [tag for record in records.values() for tag in record.get('tags', ())])
+
+        existing = dict(Post.objects.filter(slug__in=records).values_list('slug', 'pk'))
+        now = timezone.now()
+        posts = {}
+        for slug, record in records.items():
+            post = Post(
+                pk=existing.get(slug), slug=slug, author_id=users[record['author']['username']],
+                category_id=categories[record['category']['slug'] or slugify(record['category']['name'])]
+                if record.get('category') else None,
+                comment_count=len(record.get('comments', ())),
+            )
+            for field in POST_FIELDS:
+                if field in record:
+                    setattr(post, field, _date(record[field]) if field.startswith('date_') else record[field])
+            post.date_created = post.date_created or now
+            post.date_updated = post.date_updated or post.date_created
+            # bulk_create and bulk_update skip Post.save
+            post.render_fields()
+            posts[slug] = post
+
+        new = [post for post in posts.values() if post.pk is None]
+        old = [post for post in posts.values() if post.pk is not None]
+        with keep_given_dates(Post):
+            Post.objects.bulk_create(new)
+        if any(post.pk is None for post in new):
+            # Backends that cannot return ids from a bulk insert
+            ids = dict(Post.objects.filter(slug__in=[post.slug for post in new]).values_list('slug', 'pk'))
+            for post in new:
+                post.pk = ids[post.slug]
+        # Clear the replaced tags and comments first: each deleted comment
+        # decrements comment_count, which the update then sets
+        old_ids = [post.pk for post in old]
+        Post.tags.through.objects.filter(post_id__in=old_ids).delete()
+        Comment.objects.filter(post_id__in=old_ids).delete()
+        update_fields = ['author', 'category', 'comment_count', *POST_FIELDS, *RENDERED_FIELDS]
+        Post.objects.bulk_update(old, update_fields)
+        Post.tags.through.objects.bulk_create([
+            Post.tags.through(post_id=posts[slug].pk, tag_id=tags[tag['slug'] or slugify(tag['name'])])
+            for slug, record in records.items() for tag in record.get('tags', ())
+        ], ignore_conflicts=True)
+        self._import_comments(posts, records, users)
+
+        self.posts_created += len(new)
+        self.posts_updated += len(old)
+        get_search_backend().index_posts([post.pk for post in posts.values()])
+        return len(records)
+
+    def _import_comments(self, posts, records, users):
+        # Comments are inserted one thread level at a time so replies can
+        # point at the freshly assigned ids of their parents.
+        levels = defaultdict(list)
+        for slug, record in records.items():
+            depth_of = {}
+            for data in record.get('comments', ()):
+                parent = data.get('parent')
+                depth = depth_of[parent] + 1 if parent in depth_of else 0
+                depth_of[data['id']] = depth
+                levels[depth].append((slug, data))
+
+        created = {}
+        now = timezone.now()
+        for depth in sorted(levels):
+            level = []
+            for slug, data in levels[depth]:
+                parent = created.get((slug, data.get('parent')))
+                # Same rule as Comment.save: replies too deep attach higher up
+                while parent is not None and parent.depth >= Comment.MAX_DEPTH:
+                    parent = parent.parent
+                comment = Comment(
+                    post_id=posts[slug].pk, author_id=users[data['author']['username']],
+                    content=data['content'], parent=parent,
+                    depth=parent.depth + 1 if parent is not None else 0,
+                    date_created=_date(data.get('date_created')) or now,
+                )
+                created[(slug, data['id'])] = comment
+                level.append(comment)
+            with keep_given_dates(Comment):
+                Comment.objects.bulk_create(level)
+
+        # Materialized paths need the new ids, so the database fills them in
+        # level by level, each reply appending its id to its parent's path.
+        post_ids = [post.pk for post in posts.values()]
+        key = LPad(Cast('pk', CharField()), Comment.PATH_STEP, Value('0'))
+        parent_path = Subquery(Comment.objects.filter(pk=OuterRef('parent_id')).values('path')[:1])
+        for depth in sorted({comment.depth for comment in created.values()}):
+            path = key if depth == 0 else Concat(parent_path, Value(Comment.PATH_SEPARATOR), key)
+            Comment.objects.filter(post_id__in=post_ids, depth=depth, path='').update(path=path)
+        self.comments_created += len(created)
+
+
+def finish_import():
+    """Bring the derived data up to date once, after the last chunk."""
+    rebuild_taxonomy_counts()
+    enqueue(rebuild_related_posts)
+    invalidate('posts', 'taxonomy', 'feeds')
+    bump_all('post')
+    discard_all_shards()
@@ -1,7 +1,37 @@
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, include, register_converter
 from rest_framework.routers import DefaultRouter
 from . import views
 
+# Hot read paths have async versions for ASGI deployments (core/asgi.py
+# turns BLOG_ASYNC_VIEWS on)
+if settings.BLOG_ASYNC_VIEWS:
+    from . import async_views as read_views
+else:
+    read_views = views
+
+
+# Zero-padded date parts, so sitemap shard URLs match their file names
+class FourDigitYearConverter:
+    regex = '[0-9]{4}'
+    width = 4
+
+    def to_python(self, value):
+        return int(value)
+
+    def to_url(self, value):
+        return f'{value:0{self.width}d}'
+
+
+class TwoDigitMonthConverter(FourDigitYearConverter):
+    regex = '[0-9]{2}'
+    width = 2
+
+
+register_converter(FourDigitYearConverter, 'yyyy')
+register_converter(TwoDigitMonthConverter, 'mm')
+
+
 # Set up the API router
 router = DefaultRouter()
 router.register(r'posts', views.PostViewSet)
@@ -10,24 +40,25 @@ router.register(r'tags', views.TagViewSet)
 
 urlpatterns = [
     # Main pages
-    path('', views.home, name='home'),
+    path('', read_views.home, name='home'),
     
     # Post URLs
-    path('posts/', views.PostListView.as_view(), name='post_list'),
+    path('posts/', read_views.post_list, name='post_list'),
     path('posts/new/', views.PostCreateView.as_view(), name='create_post'),
-    path('posts/<slug:slug>/', views.PostDetailView.as_view(), name='post_detail'),
+    path('posts/<slug:slug>/', read_views.post_detail, name='post_detail'),
     path('posts/<slug:slug>/edit/', views.PostUpdateView.as_view(), name='update_post'),
     path('posts/<slug:slug>/delete/', views.PostDeleteView.as_view(), name='delete_post'),
     
     # Comment and like functionality
     path('posts/<slug:slug>/comment/', views.add_comment, name='add_comment'),
     path('posts/<slug:slug>/like/', views.like_post, name='like_post'),
+    path('comments/<int:pk>/like/', views.like_comment, name='like_comment'),
     
     # Category and tag URLs
-    path('category/<slug:category_slug>/', views.PostListView.as_view(), name='category_posts'),
-    path('tag/<slug:tag_slug>/', views.PostListView.as_view(), name='tag_posts'),
-    path('categories/', views.category_list, name='category_list'),
-    path('tags/', views.tag_list, name='tag_list'),
+    path('category/<slug:category_slug>/', read_views.post_list, name='category_posts'),
+    path('tag/<slug:tag_slug>/', read_views.post_list, name='tag_posts'),
+    path('categories/', read_views.category_list, name='category_list'),
+    path('tags/', read_views.tag_list, name='tag_list'),
     
     # User authentication
     path('register/', views.register, name='register'),
@@ -40,10 +71,26 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('dashboard/', views.dashboard, name='dashboard'),
     
+    # Feeds and sitemaps
+    path('feeds/rss/', views.post_feed, {'feed_format': 'rss'}, name='feed_rss'),
+    path('feeds/atom/', views.post_feed, {'feed_format': 'atom'}, name='feed_atom'),
+    path('feeds/category/<slug:category_slug>/rss/', views.post_feed, {'feed_format': 'rss'}, name='category_feed_rss'),
+    path('feeds/category/<slug:category_slug>/atom/', views.post_feed, {'feed_format': 'atom'}, name='category_feed_atom'),
+    path('feeds/tag/<slug:tag_slug>/rss/', views.post_feed, {'feed_format': 'rss'}, name='tag_feed_rss'),
+    path('feeds/tag/<slug:tag_slug>/atom/', views.post_feed, {'feed_format': 'atom'}, name='tag_feed_atom'),
+    path('feeds/author/<str:username>/rss/', views.post_feed, {'feed_format': 'rss'}, name='author_feed_rss'),
+    path('feeds/author/<str:username>/atom/', views.post_feed, {'feed_format': 'atom'}, name='author_feed_atom'),
+    path('sitemap.xml', views.sitemap_index, name='sitemap_index'),
+    path('sitemaps/pages.xml', views.sitemap_pages, name='sitemap_pages'),
+    path('sitemaps/posts-<yyyy:year>-<mm:month>.xml', views.sitemap_posts, name='sitemap_posts'),
+    
     # API endpoints
     path('api/', include(router.urls)),
-    path('api/posts-list/', views.post_list_api, name='post_list_api'),
-    path('api/posts/<slug:slug>/', views.post_detail_api, name='post_detail_api'),
+    path('api/posts-list/', read_views.post_list_api, name='post_list_api'),
+    path('api/search/', read_views.search_api, name='search_api'),
+    path('api/likes/', views.likes_api, name='likes_api'),
+    path('api/page-cache/stats/', views.page_cache_stats_api, name='page_cache_stats_api'),
+    path('api/posts/<slug:slug>/', read_views.post_detail_api, name='post_detail_api'),
     path('api/posts/create/', views.post_create_api, name='post_create_api'),
     path('api/posts/<slug:slug>/update/', views.post_update_api, name='post_update_api'),
     path('api/posts/<slug:slug>/delete/', views.post_delete_api, name='post_delete_api'),
@@ -0,0 +1,254 @@
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import F
+
+from .jobs import enqueue, job
+from .models import Post
+from .stats import record_activity
+
+
+CACHE_KEY = 'blog:views:pending:%s'
+# Posts viewed since the last flush are listed per window: the first view
+# of a post in a window claims the next slot. Flushing opens a new window
+# and reads the closed one's slots, so it only visits viewed posts.
+WINDOW_KEY = 'blog:views:window'
+DIRTY_KEY = 'blog:views:dirty:%s:%s'
+SLOTS_KEY = 'blog:views:slots:%s'
+SLOT_KEY = 'blog:views:slot:%s:%s'
+
+
+class MemoryStore:
+    """Pending view increments held in this process only."""
+
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def add(self, post_id, amount=1):
+        with self._lock:
+            self._pending[post_id] = self._pending.get(post_id, 0) + amount
+
+    def take(self):
+        # Swap the dict out under the lock so increments arriving during
+        # the database write land in the next batch instead of being lost.
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def restore(self, pending):
+        for post_id, amount in pending.items():
+            self.add(post_id, amount)
+
+    def __len__(self):
+        return len(self._pending)
+
+
+class CacheStore:
+    """Pending view increments shared through a Django cache alias.
+
+    With Redis or Memcached every worker writes into the same counters, so
+    any process (including the ``flush_view_counts`` command) can drain them.
+    """
+
+    chunk_size = 500
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def shared(self):
+        # A local-memory cache is as private to the process as MemoryStore.
+        return not isinstance(self.cache, LocMemCache)
+
+    def _incr(self, key, amount=1):
+        try:
+            return self.cache.incr(key, amount)
+        except ValueError:
+            if self.cache.add(key, amount, None):
+                return amount
+            return self.cache.incr(key, amount)
+
+    def _window(self):
+        window = self.cache.get(WINDOW_KEY)
+        if window is None:
+            self.cache.add(WINDOW_KEY, 0, None)
+            window = self.cache.get(WINDOW_KEY, 0)
+        return window
+
+    def add(self, post_id, amount=1):
+        self._incr(CACHE_KEY % post_id, amount)
+        window = self._window()
+        if self.cache.add(DIRTY_KEY % (window, post_id), True, None):
+            slot = self._incr(SLOTS_KEY % window)
+            self.cache.set(SLOT_KEY % (window, slot), post_id, None)
+
+    def _listed(self, window):
+        slots = [SLOT_KEY % (window, slot) for slot in range(1, (self.cache.get(SLOTS_KEY % window) or 0) + 1)]
+        return slots, set(self.cache.get_many(slots).values()) if slots else set()
+
+    def take(self):
+        window = self._window()
+        self._incr(WINDOW_KEY)
+        # The window before is read again for posts listed in it after the
+        # last flush had read it, then forgotten
+        previous_slots, post_ids = self._listed(window - 1)
+        post_ids |= self._listed(window)[1]
+        post_ids = sorted(post_ids)
+        pending = {}
+        for start in range(0, len(post_ids), self.chunk_size):
+            pending.update(self._take_chunk(post_ids[start:start + self.chunk_size]))
+        self.cache.delete_many([
+            *previous_slots, SLOTS_KEY % (window - 1),
+            *[DIRTY_KEY % (window - 1, post_id) for post_id in post_ids],
+        ])
+        return pending
+
+    def _take_chunk(self, post_ids):
+        keys = {CACHE_KEY % post_id: post_id for post_id in post_ids}
+        taken = {}
+        for key, amount in self.cache.get_many(list(keys)).items():
+            if amount:
+                # decr (rather than delete) keeps increments that raced in
+                # between get_many and now.
+                self.cache.decr(key, amount)
+                taken[keys[key]] = amount
+        return taken
+
+    def restore(self, pending):
+        for post_id, amount in pending.items():
+            self.add(post_id, amount)
+
+    def __len__(self):
+        # Posts viewed in the current window, as MemoryStore counts them
+        return self.cache.get(SLOTS_KEY % self._window()) or 0
+
+
+class ViewCounter:
+    """Write-behind buffer for ``Post.views``.
+
+    Views are recorded in memory (or cache) and written in batches of
+    ``UPDATE ... SET views = views + n`` so readers never take the database
+    write lock and ``date_updated`` is left alone.
+
+    ``record`` never writes itself. A due flush is handed to the job queue
+    when the store is shared with the workers; otherwise it runs once the
+    current response has been sent (see ``flush_requested``).
+    """
+
+    # Seconds before a due flush is scheduled again while the last one waits
+    schedule_gap = 1
+
+    def __init__(self, store, flush_interval=10, max_pending=1000):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._last_scheduled = None
+        self.flush_pending = False
+
+    def record(self, post_id, amount=1):
+        self.store.add(post_id, amount)
+        if self._flush_due():
+            self.schedule_flush()
+
+    def _flush_due(self):
+        now = time.monotonic()
+        if self._last_scheduled is not None and now - self._last_scheduled < self.schedule_gap:
+            return False
+        if now - self._last_flush >= self.flush_interval:
+            return True
+        return len(self.store) >= self.max_pending
+
+    def schedule_flush(self):
+        self._last_scheduled = time.monotonic()
+        if self.store.shared:
+            enqueue(flush_buffered_views, dedupe_key='flush-buffered-views')
+        else:
+            self.flush_pending = True
+
+    def flush_requested(self):
+        """Run a flush ``record`` asked for; returns the number of views written."""
+        if not self.flush_pending:
+            return 0
+        self.flush_pending = False
+        return self.flush(blocking=False)
+
+    def flush(self, blocking=True):
+        """Write all pending increments; returns the number of views written."""
+        if not self._flush_lock.acquire(blocking=blocking):
+            return 0
+        try:
+            self._last_flush = time.monotonic()
+            pending = self.store.take()
+            if not pending:
+                return 0
+            try:
+                self._write(pending)
+            except Exception:
+                self.store.restore(pending)
+                raise
+            return sum(pending.values())
+        finally:
+            self._flush_lock.release()
+
+    def _write(self, pending):
+        # Posts with the same increment share one UPDATE statement.
+        by_amount = {}
+        for post_id, amount in pending.items():
+            by_amount.setdefault(amount, []).append(post_id)
+        for amount, post_ids in by_amount.items():
+            Post.objects.filter(pk__in=post_ids).update(views=F('views') + amount)
+        record_activity('views', pending)
+
+
+def _build_counter():
+    backend = getattr(settings, 'VIEW_COUNT_BUFFER', 'cache')
+    if backend == 'cache':
+        store = CacheStore(getattr(settings, 'VIEW_COUNT_CACHE_ALIAS', 'default'))
+    else:
+        store = MemoryStore()
+    return ViewCounter(
+        store,
+        flush_interval=getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 10),
+        max_pending=getattr(settings, 'VIEW_COUNT_MAX_PENDING', 1000),
+    )
+
+
+view_counter = _build_counter()
+
+
+def record_view(post_id):
+    view_counter.record(post_id)
+
+
+def flush_views():
+    return view_counter.flush()
+
+
+@job()
+def flush_buffered_views():
+    flush_views()
+
+
+def _flush_at_exit():
+    try:
+        view_counter.flush()
+    except Exception:
+        # The interpreter is going away; there is nobody left to report to.
+        pass
+
+
+def install_shutdown_hook():
+    atexit.register(_flush_at_exit)
@@ -1,13 +1,19 @@
+import json
+import os
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, logout, authenticate
 from django.contrib import messages
-from django.db.models import Q, Count
-from django.http import JsonResponse, HttpResponseRedirect
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, HttpResponseRedirect
 from django.urls import reverse, reverse_lazy
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 
 from .models import Post, Category, Tag, Comment, UserProfile
 from .forms import (PostForm, CommentForm, CustomUserCreationForm, 
@@ -17,15 +23,48 @@ from django.contrib.auth.models import User
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status, viewsets, permissions
-from .serializers import PostSerializer, CategorySerializer, TagSerializer, CommentSerializer, UserProfileSerializer
+from .serializers import PostSerializer, PostSummarySerializer, CategorySerializer, TagSerializer, CommentSerializer, UserProfileSerializer
+from .view_counter import record_view
+from .page_cache import add_cache_tags, anonymous_page_cache, cache_stats, set_cache_meta
+from .search import get_backend as get_search_backend, search_posts
+from .query_budget import query_budget
+from .comment_tree import comment_tree
+from .related import related_posts
+from .rendering import BODY_FIELDS
+from .reactions import LIKEABLE, liked_ids, mark_liked, toggle_like, walk_tree
+from .conditional import (conditional_category, conditional_post, conditional_post_collection,
+                          conditional_post_list, conditional_post_page, conditional_sitemap_month,
+                          conditional_tag, make_etag, post_state)
+from .pagination import (POST_ORDERING, InvalidCursor, KeysetPagination, KeysetPaginator,
+                         OffsetCursorPaginator)
+from .stats import author_totals, daily_series
+from .api_cache import CachedResponseMixin, cache_api_response, depend_on, generation
+from .query_plan import OptimizedQuerysetMixin, optimize
+from .feeds import serve_feed
+from .sitemaps import (base_url, is_closed, month_shards, render_index, render_month, render_pages,
+                       shard_path, write_shard)
+
+DASHBOARD_DAYS = 30
+DASHBOARD_POSTS = 20
+
+
+def count_cached_view(request, meta):
+    record_view(meta['post_id'])
+
+
+def count_revalidated_view(request, slug):
+    record_view(post_state(request, slug)['pk'])
 
 
 # Home Page
+@query_budget(8)
+@anonymous_page_cache('posts', 'taxonomy')
 def home(request):
-    featured_posts = Post.objects.filter(status='published').order_by('-views')[:5]
-    recent_posts = Post.objects.filter(status='published').order_by('-date_created')[:5]
-    categories = Category.objects.annotate(post_count=Count('posts')).order_by('-post_count')[:10]
-    popular_tags = Tag.objects.annotate(post_count=Count('posts')).order_by('-post_count')[:15]
+    published = Post.objects.filter(status='published').select_related('author', 'category').defer(*BODY_FIELDS)
+    featured_posts = published.order_by('-views')[:5]
+    recent_posts = published.order_by('-date_created')[:5]
+    categories = Category.objects.order_by('-post_count', 'name')[:10]
+    popular_tags = Tag.objects.order_by('-post_count', 'name')[:15]
     
     context = {
         'featured_posts': featured_posts,
@@ -37,14 +76,20 @@ def home(request):
 
 
 # Post List View
+@method_decorator(anonymous_page_cache('posts', 'taxonomy'), name='dispatch')
 class PostListView(ListView):
     model = Post
+    query_budget = 10
     template_name = 'blog/post_list.html'
     context_object_name = 'posts'
     paginate_by = 9
     
     def get_queryset(self):
-        queryset = Post.objects.filter(status='published').order_by('-date_created')
+        queryset = (Post.objects.filter(status='published')
+                    .select_related('author', 'category')
+                    .prefetch_related('tags')
+                    .defer(*BODY_FIELDS)
+                    .order_by('-date_created'))
         
         # Filter by category if provided
         category_slug = self.kwargs.get('category_slug')
@@ -57,25 +102,47 @@ class PostListView(ListView):
             queryset = queryset.filter(tags__slug=tag_slug)
             
         # Search functionality
+        self.search_hits = None
         search_form = SearchForm(self.request.GET)
         if search_form.is_valid() and search_form.cleaned_data['query']:
-            query = search_form.cleaned_data['query']
-            queryset = queryset.filter(
-                Q(title__icontains=query) | 
-                Q(content__icontains=query) | 
-                Q(excerpt__icontains=query) |
-                Q(author__username__icontains=query) |
-                Q(category__name__icontains=query) |
-                Q(tags__name__icontains=query)
-            ).distinct()
+            queryset, self.search_hits = search_posts(search_form.cleaned_data['query'], queryset)
             
         return queryset
     
+    def paginate_queryset(self, queryset, page_size):
+        # Cursor pagination: no COUNT(*) and no OFFSET scans on deep pages.
+        # Ranked search results are already bounded, so they page by offset.
+        if self.search_hits is not None:
+            paginator = OffsetCursorPaginator(queryset, page_size)
+        else:
+            paginator = KeysetPaginator(queryset, page_size, POST_ORDERING)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('Invalid page cursor')
+        return paginator, page, page.object_list, page.has_other_pages()
+    
+    def page_query(self, cursor):
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        params['cursor'] = cursor
+        return params.urlencode()
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search_form'] = SearchForm(self.request.GET)
-        context['categories'] = Category.objects.annotate(post_count=Count('posts'))
-        context['popular_tags'] = Tag.objects.annotate(post_count=Count('posts')).order_by('-post_count')[:20]
+        page = context['page_obj']
+        if page.has_next():
+            context['next_page_query'] = self.page_query(page.next_cursor)
+        if page.has_previous():
+            context['previous_page_query'] = self.page_query(page.previous_cursor)
+        if self.search_hits is not None:
+            context['search_total'] = len(self.search_hits)
+            for post in context['posts']:
+                hit = self.search_hits.get(post.pk)
+                post.search_snippet = hit.snippet if hit else ''
+        context['categories'] = Category.objects.order_by('name')
+        context['popular_tags'] = Tag.objects.order_by('-post_count', 'name')[:20]
         
         # Add category or tag info if filtering
         category_slug = self.kwargs.get('category_slug')
@@ -90,48 +157,52 @@ class PostListView(ListView):
 
 
 # Post Detail View
+# Revalidation is checked first, so a 304 skips the page cache as well
+@method_decorator(conditional_post_page(on_not_modified=count_revalidated_view), name='dispatch')
+@method_decorator(anonymous_page_cache('taxonomy', on_hit=count_cached_view), name='dispatch')
 class PostDetailView(DetailView):
     model = Post
+    query_budget = 12
     template_name = 'blog/post_detail.html'
     context_object_name = 'post'
     slug_url_kwarg = 'slug'
     
     def get_object(self):
         post = super().get_object()
-        # Increment view count
+        # Buffer the view; the counter flushes it to the database in batches
+        record_view(post.pk)
+        add_cache_tags(self.request, f'post:{post.pk}')
+        set_cache_meta(self.request, post_id=post.pk)
         post.views += 1
-        post.save()
         return post
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         post = self.object
         
-        # Add comments
-        comments = post.comments.filter(parent=None).order_by('-date_created')
-        context['comments'] = comments
+        # Add comments: the whole thread, assembled from one query
+        context['comments'] = comment_tree(post)
         context['comment_form'] = CommentForm()
         
-        # Check if user has liked the post
+        # Like state of the post and its comments, one query each
         if self.request.user.is_authenticated:
-            context['user_has_liked'] = post.likes.filter(id=self.request.user.id).exists()
+            mark_liked(self.request.user, [post, *walk_tree(context['comments'])])
+            context['user_has_liked'] = post.user_has_liked
         
-        # Related posts (same category or tags)
-        related_posts = Post.objects.filter(status='published')
-        if post.category:
-            related_posts = related_posts.filter(category=post.category)
-        else:
-            related_posts = related_posts.filter(tags__in=post.tags.all())
-            
-        related_posts = related_posts.exclude(id=post.id).distinct()[:3]
-        context['related_posts'] = related_posts
+        # Related posts, precomputed by blog/related.py
+        context['related_posts'] = related_posts(post, limit=3)
         
         return context
     
 
+post_list = PostListView.as_view()
+post_detail = PostDetailView.as_view()
+
+
 # Post Create View
 class PostCreateView(LoginRequiredMixin, CreateView):
     model = Post
+    query_budget = 15
     form_class = PostForm
     template_name = 'blog/create_post.html'
     
@@ -144,6 +215,7 @@ class PostCreateView(LoginRequiredMixin, CreateView):
 # Post Update View
 class PostUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     model = Post
+    query_budget = 15
     form_class = PostForm
     template_name = 'blog/update_post.html'
     slug_url_kwarg = 'slug'
@@ -160,6 +232,7 @@ class PostUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
 # Post Delete View
 class PostDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     model = Post
+    query_budget = 16
     template_name = 'blog/delete_post.html'
     success_url = reverse_lazy('post_list')
     slug_url_kwarg = 'slug'
@@ -174,6 +247,7 @@ class PostDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 
 
 # Comment functionality
+@query_budget(10)
 @login_required
 def add_comment(request, slug):
     post = get_object_or_404(Post, slug=slug)
@@ -197,24 +271,40 @@ def add_comment(request, slug):
 
 
 # Like functionality
+def _wants_json(request):
+    return (request.headers.get('x-requested-with') == 'XMLHttpRequest'
+            or 'application/json' in request.headers.get('accept', ''))
+
+
+@query_budget(10)
 @login_required
+@require_POST
 def like_post(request, slug):
-    post = get_object_or_404(Post, slug=slug)
-    
-    if post.likes.filter(id=request.user.id).exists():
-        post.likes.remove(request.user)
-        liked = False
-    else:
-        post.likes.add(request.user)
-        liked = True
-        
-    if request.is_ajax():
-        return JsonResponse({'liked': liked, 'count': post.total_likes()})
-    
+    post = get_object_or_404(Post.objects.only('pk', 'slug', 'author', 'like_count'), slug=slug)
+    liked, count = toggle_like(post, request.user)
+
+    if _wants_json(request):
+        return JsonResponse({'liked': liked, 'count': count})
+
     return redirect('post_detail', slug=post.slug)
 
 
+@query_budget(8)
+@login_required
+@require_POST
+def like_comment(request, pk):
+    comment = get_object_or_404(
+        Comment.objects.select_related('post').only('pk', 'like_count', 'post__slug'), pk=pk)
+    liked, count = toggle_like(comment, request.user)
+
+    if _wants_json(request):
+        return JsonResponse({'liked': liked, 'count': count})
+
+    return HttpResponseRedirect(f"{reverse('post_detail', args=[comment.post.slug])}#comment-{comment.pk}")
+
+
 # User Registration
+@query_budget(12)
 def register(request):
     if request.method == 'POST':
         form = CustomUserCreationForm(request.POST)
@@ -252,6 +342,7 @@ def register(request):
 
 
 # User Login
+@query_budget(8)
 def user_login(request):
     # If user is already authenticated, redirect to home
     if request.user.is_authenticated:
@@ -279,6 +370,7 @@ def user_login(request):
 
 
 # User Logout
+@query_budget(6)
 @login_required
 def user_logout(request):
     logout(request)
@@ -287,6 +379,7 @@ def user_logout(request):
 
 
 # User Profile
+@query_budget(10)
 @login_required
 def profile(request, username=None):
     if username:
@@ -298,7 +391,7 @@ def profile(request, username=None):
     profile, created = UserProfile.objects.get_or_create(user=user)
     
     # Get user's posts
-    posts = Post.objects.filter(author=user).order_by('-date_created')
+    posts = Post.objects.filter(author=user).defer(*BODY_FIELDS).order_by('-date_created')
     
     context = {
         'profile_user': user,
@@ -310,6 +403,7 @@ def profile(request, username=None):
 
 
 # Edit Profile
+@query_budget(8)
 @login_required
 def edit_profile(request):
     profile, created = UserProfile.objects.get_or_create(user=request.user)
@@ -327,78 +421,239 @@ def edit_profile(request):
 
 
 # Category List
+@query_budget(5)
+@anonymous_page_cache('taxonomy')
 def category_list(request):
-    categories = Category.objects.annotate(post_count=Count('posts')).order_by('name')
+    categories = Category.objects.order_by('name')
     return render(request, 'blog/category_list.html', {'categories': categories})
 
 
 # Tag List
+@query_budget(5)
+@anonymous_page_cache('taxonomy')
 def tag_list(request):
-    tags = Tag.objects.annotate(post_count=Count('posts')).order_by('name')
+    tags = Tag.objects.order_by('name')
     return render(request, 'blog/tag_list.html', {'tags': tags})
 
 
 # Dashboard for authenticated users
+@query_budget(10)
 @login_required
 def dashboard(request):
-    user_posts = Post.objects.filter(author=request.user).order_by('-date_created')
-    draft_posts = user_posts.filter(status='draft')
-    published_posts = user_posts.filter(status='published')
-    
+    # Totals come from one aggregate and charts from the daily rollup, so
+    # the page costs the same for an author with thousands of posts.
+    user_posts = (Post.objects.filter(author=request.user).select_related('category')
+                  .defer(*BODY_FIELDS).order_by('-date_created'))
+    series = daily_series(request.user, days=DASHBOARD_DAYS)
+
     context = {
-        'user_posts': user_posts,
-        'draft_posts': draft_posts,
-        'published_posts': published_posts,
-        'post_count': user_posts.count(),
-        'draft_count': draft_posts.count(),
-        'published_count': published_posts.count(),
+        **author_totals(request.user),
+        'published_posts': user_posts.filter(status='published')[:DASHBOARD_POSTS],
+        'draft_posts': user_posts.filter(status='draft')[:DASHBOARD_POSTS],
+        'recent_comments': Comment.objects.filter(post__author=request.user)
+            .select_related('author__profile', 'post').order_by('-date_created')[:6],
+        'views_chart': json.dumps({'labels': series['labels'], 'values': series['views']}),
+        'engagement_chart': json.dumps({key: series[key] for key in ('labels', 'likes', 'comments')}),
     }
-    
+
     return render(request, 'blog/dashboard.html', context)
 
 
+# Feeds (see blog/feeds.py)
+@query_budget(6)
+def post_feed(request, feed_format, **kwargs):
+    return serve_feed(request, feed_format, **kwargs)
+
+
+# Sitemaps (see blog/sitemaps.py)
+SITEMAP_CONTENT_TYPE = 'application/xml; charset=utf-8'
+
+
+def _sitemap_response(request, content, last_modified=None):
+    etag = quote_etag(make_etag(content))
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(content, content_type=SITEMAP_CONTENT_TYPE)
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def _sitemap_file_response(request, path):
+    stream = open(path, 'rb')
+    stat = os.fstat(stream.fileno())
+    etag = quote_etag(make_etag(stat.st_mtime_ns, stat.st_size))
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = FileResponse(stream, content_type=SITEMAP_CONTENT_TYPE)
+    else:
+        stream.close()
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
+
+
+@query_budget(3)
+def sitemap_index(request):
+    shards = month_shards()
+    last_modified = max((shard['lastmod'] for shard in shards), default=None)
+    return _sitemap_response(request, render_index(shards, base_url(request)), last_modified)
+
+
+@query_budget(4)
+def sitemap_pages(request):
+    return _sitemap_response(request, render_pages(base_url(request)))
+
+
+@conditional_sitemap_month
+def _open_month_sitemap(request, year, month):
+    content = render_month(year, month, base_url(request))
+    if '<url>' not in content:
+        raise Http404('No posts were published that month')
+    return HttpResponse(content, content_type=SITEMAP_CONTENT_TYPE)
+
+
+@query_budget(3)
+def sitemap_posts(request, year, month):
+    if not 1 <= month <= 12:
+        raise Http404('No such month')
+    if not is_closed(year, month):
+        return _open_month_sitemap(request, year, month)
+    # Ended months are served from their file, written on first request
+    path = shard_path(year, month)
+    try:
+        return _sitemap_file_response(request, path)
+    except FileNotFoundError:
+        if write_shard(year, month, base_url(request)) is None:
+            raise Http404('No posts were published that month')
+        return _sitemap_file_response(request, path)
+
+
 # API Views
-class PostViewSet(viewsets.ModelViewSet):
+@method_decorator(conditional_post, name='retrieve')
+@method_decorator(conditional_post_collection, name='list')
+class PostViewSet(CachedResponseMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Post.objects.all()
+    query_budget = 15
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     lookup_field = 'slug'
+    keyset_ordering = POST_ORDERING
+    cache_model = 'post'
+    cache_related = ('category', 'tag', 'user')
+    
+    def get_serializer_class(self):
+        return PostSummarySerializer if self.action == 'list' else PostSerializer
     
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+@method_decorator(conditional_category, name='retrieve')
+@method_decorator(conditional_category, name='list')
+class CategoryViewSet(CachedResponseMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
+    query_budget = 15
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     lookup_field = 'slug'
+    keyset_ordering = ('name',)
+    cache_model = 'category'
 
 
-class TagViewSet(viewsets.ModelViewSet):
+@method_decorator(conditional_tag, name='retrieve')
+@method_decorator(conditional_tag, name='list')
+class TagViewSet(CachedResponseMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
+    query_budget = 15
     serializer_class = TagSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     lookup_field = 'slug'
+    keyset_ordering = ('name',)
+    cache_model = 'tag'
 
 
+@query_budget(8)
+@cache_api_response('api:post', 'api:category', 'api:tag', 'api:user')
+@conditional_post_list
 @api_view(['GET'])
 def post_list_api(request):
-    posts = Post.objects.filter(status='published')
-    serializer = PostSerializer(posts, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    serializer = PostSummarySerializer(context={'request': request})
+    posts = optimize(Post.objects.filter(status='published'), serializer, keep=POST_ORDERING)
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(posts, request, ordering=POST_ORDERING)
+    serializer = PostSummarySerializer(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
 
 
+@query_budget(8)
+@cache_api_response('api:post:*', 'api:category', 'api:tag', 'api:user')
+@conditional_post
 @api_view(['GET'])
 def post_detail_api(request, slug):
     try:
-        post = Post.objects.get(slug=slug)
-        serializer = PostSerializer(post)
+        serializer = PostSerializer(context={'request': request})
+        post = optimize(Post.objects.all(), serializer).get(slug=slug)
+        depend_on(request, generation(post, post.pk))
+        serializer = PostSerializer(post, context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Post.DoesNotExist:
         return Response({'error': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@query_budget(5)
+@api_view(['GET'])
+def search_api(request):
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'error': 'Missing search query "q"'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(int(request.query_params.get('limit', 20)), 100)
+        offset = max(int(request.query_params.get('offset', 0)), 0)
+    except ValueError:
+        return Response({'error': 'limit and offset must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    hits = get_search_backend().search(query, limit=limit, offset=offset)
+    posts = Post.objects.in_bulk([hit.post_id for hit in hits])
+    results = [
+        {
+            'id': hit.post_id,
+            'title': posts[hit.post_id].title,
+            'slug': posts[hit.post_id].slug,
+            'url': posts[hit.post_id].get_absolute_url(),
+            'rank': hit.rank,
+            'snippet': hit.snippet,
+        }
+        for hit in hits if hit.post_id in posts
+    ]
+    return Response({'query': query, 'results': results}, status=status.HTTP_200_OK)
+
+
+@query_budget(4)
+@api_view(['GET'])
+def likes_api(request):
+    """Which of ``?posts=1,2`` and ``?comments=3,4`` the current user has
+    liked, so cached pages can fill in like state with one request."""
+    liked = {}
+    for param, model in LIKEABLE.items():
+        try:
+            pks = [int(pk) for pk in request.GET.get(param, '').split(',') if pk.strip()][:100]
+        except ValueError:
+            return Response({'error': f'{param} must be a comma separated list of ids'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        liked[param] = sorted(liked_ids(request.user, model, pks))
+    return Response(liked)
+
+
+@query_budget(5)
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def page_cache_stats_api(request):
+    return Response(cache_stats(), status=status.HTTP_200_OK)
+
+
+@query_budget(15)
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def post_create_api(request):
@@ -409,6 +664,7 @@ def post_create_api(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)   
 
 
+@query_budget(15)
 @api_view(['PUT'])
 @permission_classes([permissions.IsAuthenticated])
 def post_update_api(request, slug):
@@ -429,6 +685,7 @@ def post_update_api(request, slug):
         return Response({'error': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@query_budget(15)
 @api_view(['DELETE'])
 @permission_classes([permissions.IsAuthenticated])
 def post_delete_api(request, slug):
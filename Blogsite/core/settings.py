@@ -51,6 +51,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'blog.assets.StaticAssetMiddleware',
+    'blog.db_router.ReplicaPinningMiddleware',
+    'blog.query_budget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -93,7 +96,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'blog.pagination.KeysetPagination',
     'PAGE_SIZE': 10,
 }
 
@@ -101,8 +104,15 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are kept in memory; under runserver the
+            # autoreloader clears them when a template changes
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -118,11 +128,52 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# SQLite by default. Setting POSTGRES_DB switches to PostgreSQL with
+# persistent connections that are health-checked before reuse.
+if os.environ.get('POSTGRES_DB'):
+    PRIMARY_DATABASE = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'USER': os.environ.get('POSTGRES_USER', ''),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    REPLICA_LOCATION_KEY = 'HOST'
+else:
+    PRIMARY_DATABASE = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
+    REPLICA_LOCATION_KEY = 'NAME'
+
+DATABASES = {'default': PRIMARY_DATABASE}
+
+# Read replicas (see blog/db_router.py): DATABASE_REPLICAS lists replica
+# hosts for PostgreSQL, or database files for SQLite (refresh those with
+# `manage.py check_databases --copy-sqlite`). Tests read from the primary.
+for number, location in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        **PRIMARY_DATABASE, REPLICA_LOCATION_KEY: location.strip(), 'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['blog.db_router.PrimaryReplicaRouter']
+DATABASE_REPLICA_PIN_SECONDS = 5  # reads stay on the primary this long after a write request
+DATABASE_REPLICA_CHECK_INTERVAL = 10  # seconds between replica health probes
+
+
+# Cache
+# The page cache and other shared state work with any backend that supports
+# incr/add, e.g. django.core.cache.backends.filebased.FileBasedCache or
+# django.core.cache.backends.redis.RedisCache ('LOCATION': 'redis://127.0.0.1:6379').
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'blogsite',
+    }
 }
 
 
@@ -164,6 +215,98 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Static asset pipeline (see blog/assets.py). collectstatic builds these
+# bundles, hashes every file name and precompresses text files (brotli
+# needs the optional brotli package). StaticAssetMiddleware serves
+# STATIC_ROOT; hashed files are cached for a year, others for
+# STATIC_ASSETS_MAX_AGE seconds.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'blog.assets.BundledManifestStorage'},
+}
+STATIC_BUNDLES = {
+    'site.css': ['modern-theme.css', 'dark-mode-fix.css'],
+    'site.js': ['modern-scripts.js'],
+    'auth.css': ['auth.css'],
+}
+STATIC_ASSETS_SERVE = True
+STATIC_ASSETS_MAX_AGE = 60
+
+# Per-view query budgets (see blog/query_budget.py). Views without their own
+# budget fall back to QUERY_BUDGET_DEFAULT. Violations are logged, and raise
+# while DEBUG is on unless QUERY_BUDGET_RAISE says otherwise.
+QUERY_BUDGET_DEFAULT = 30
+# QUERY_BUDGET_RAISE = False
+
+# Serve the hot read paths with the async views in blog/async_views.py.
+# core/asgi.py switches this on; WSGI keeps the sync views.
+BLOG_ASYNC_VIEWS = os.environ.get('BLOG_ASYNC_VIEWS') == '1'
+
+# Anonymous full-page cache (see blog/page_cache.py)
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_ALIAS = 'default'
+PAGE_CACHE_TIMEOUT = 300  # seconds
+
+# Post card fragments (see blog/fragments.py), stored in the page cache.
+# Keys carry the post's version, so stale cards are never served and this
+# only bounds how long unused ones are kept.
+FRAGMENT_CACHE_TIMEOUT = 86400  # seconds
+
+# API response cache (see blog/api_cache.py), stored in the page cache.
+# Writes invalidate entries through generation counters; the timeout bounds
+# how stale view counts in them can get.
+API_CACHE_ENABLED = True
+API_CACHE_TIMEOUT = 300  # seconds
+
+# Comment threads (see blog/comment_tree.py)
+COMMENT_TREE_MAX_DEPTH = 5
+COMMENT_TREE_MAX_REPLIES = 20
+
+# Post view counting (see blog/view_counter.py)
+# 'cache' keeps pending counts in the cache, where the job queue and the
+# flush_view_counts command can drain them once the cache is shared (Redis,
+# Memcached). 'memory', like a local-memory cache, is private to one process:
+# its counts are flushed after that process's responses and lost if it is killed.
+VIEW_COUNT_BUFFER = 'cache'
+VIEW_COUNT_FLUSH_INTERVAL = 10  # seconds
+VIEW_COUNT_MAX_PENDING = 1000
+
+# Full-text search (see blog/search.py). Defaults to SQLite FTS5 on SQLite
+# and an unindexed icontains search elsewhere.
+# BLOG_SEARCH_BACKEND = 'blog.search.SQLiteFTSBackend'
+BLOG_SEARCH_MAX_RESULTS = 500
+
+# Related posts (see blog/related.py). Each published post keeps its
+# RELATED_POSTS_LIMIT best matches, scored from shared tags, category and
+# TF-IDF similarity of title and excerpt.
+RELATED_POSTS_LIMIT = 6
+RELATED_POSTS_WEIGHTS = {'tags': 1.0, 'category': 0.5, 'text': 1.0}
+
+# Responsive image variants (see blog/images.py). Uploads get a copy per
+# width bound plus WebP versions, generated by a background job. The
+# generate_image_variants backfill uses IMAGE_PIPELINE_WORKERS processes
+# (0 processes them one by one).
+IMAGE_VARIANTS = {'thumb': 160, 'card': 640, 'hero': 1280}
+IMAGE_PIPELINE_WORKERS = 2
+
+# Background jobs (see blog/jobs.py), stored in the database and run by
+# `manage.py run_jobs`. JOB_QUEUE_EAGER runs them in the web process after
+# the transaction commits instead, so the development server needs no worker.
+JOB_QUEUE_EAGER = DEBUG
+JOB_RETRY_BACKOFF = 10  # seconds, doubled after each failed attempt
+JOB_RETRY_MAX_DELAY = 3600  # seconds
+JOB_STALE_TIMEOUT = 600  # seconds before a running job is presumed lost
+
+# Feeds and sitemaps (see blog/feeds.py and blog/sitemaps.py). Feeds stay
+# cached until a published post in them changes. Sitemap shards of past
+# months are written to SITEMAP_ROOT, which the web server can serve as
+# static files; SITE_URL (e.g. https://example.com) is the host their URLs
+# are built with, defaulting to the requesting host.
+FEED_ITEMS = 20
+FEED_CACHE_TIMEOUT = 86400  # seconds
+SITEMAP_ROOT = os.path.join(BASE_DIR, 'media', 'sitemaps')
+SITE_URL = os.environ.get('SITE_URL', '')
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')